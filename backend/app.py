@@ -60,6 +60,7 @@ from db.models import (
     MappingTemplate,
     CompanyDocMappingDefault,
     OrderItemType,
+    OrderJobType,
 )
 from main import extract_text_from_image, extract_text_from_pdf
 from utils.excel_converter import json_to_excel, json_to_csv
@@ -73,6 +74,7 @@ from utils.template_service import (
     extract_template_version_from_path,
     validate_template_payload,
 )
+from utils.template_cache import get_template_cache
 from utils.prompt_schema_manager import get_prompt_schema_manager, load_prompt_and_schema
 from utils.company_file_manager import FileType
 from utils.force_delete_manager import ForceDeleteManager
@@ -83,6 +85,7 @@ from utils.order_processor import (
     escape_excel_formulas,
 )
 from utils.order_processor import OrderProcessor
+from utils.job_queue import enqueue_order_job, get_queue_stats, job_queue_enabled
 from utils.mapping_config import (
     MappingItemType,
     normalise_mapping_config,
@@ -302,6 +305,134 @@ def health_check():
         if health_status["status"] == "healthy":
             health_status["status"] = "degraded"
 
+    # 檢查 OCR 調度器狀態
+    try:
+        from utils.ocr_scheduler import get_ocr_item_scheduler, get_ocr_scheduler
+
+        scheduler_stats = get_ocr_scheduler().get_stats()
+        item_stats = get_ocr_item_scheduler().get_stats()
+        health_status["services"]["ocr_scheduler"] = {
+            "status": "healthy",
+            "info": {**scheduler_stats, "items": item_stats},
+            "message": (
+                f"{scheduler_stats['running']} calls running, {scheduler_stats['queued']} queued; "
+                f"{item_stats['running']} items active, {item_stats['queued']} waiting"
+            ),
+        }
+    except Exception as e:
+        health_status["services"]["ocr_scheduler"] = {
+            "status": "unhealthy",
+            "error": str(e),
+        }
+
+    # 檢查 OCR 結果緩存狀態
+    try:
+        from utils.ocr_result_cache import get_ocr_result_cache
+
+        cache_stats = get_ocr_result_cache().get_stats()
+        health_status["services"]["ocr_result_cache"] = {
+            "status": "healthy",
+            "info": cache_stats,
+            "message": f"OCR cache ({cache_stats['backend']}): {cache_stats['hits']} hits, {cache_stats['misses']} misses",
+        }
+    except Exception as e:
+        health_status["services"]["ocr_result_cache"] = {
+            "status": "unhealthy",
+            "error": str(e),
+        }
+
+    # 檢查訂單任務隊列狀態
+    try:
+        queue_stats = get_queue_stats()
+        health_status["services"]["order_job_queue"] = {
+            "status": "healthy",
+            "info": queue_stats,
+            "message": f"Order jobs ({queue_stats['mode']}): {queue_stats['by_status']}",
+        }
+    except Exception as e:
+        health_status["services"]["order_job_queue"] = {
+            "status": "unhealthy",
+            "error": str(e),
+        }
+
+    # 檢查 OCR 預處理狀態
+    try:
+        from utils.ocr_preprocess import get_ocr_preprocessor
+
+        preprocess_stats = get_ocr_preprocessor().get_stats()
+        health_status["services"]["ocr_preprocess"] = {
+            "status": "healthy",
+            "info": preprocess_stats,
+            "message": f"{preprocess_stats['files_compacted']} files compacted, {preprocess_stats['bytes_saved']:,} bytes saved",
+        }
+    except Exception as e:
+        health_status["services"]["ocr_preprocess"] = {
+            "status": "unhealthy",
+            "error": str(e),
+        }
+
+    # 檢查主數據緩存狀態
+    try:
+        from utils.master_data_cache import get_master_data_cache
+
+        master_stats = get_master_data_cache().get_stats()
+        health_status["services"]["master_data_cache"] = {
+            "status": "healthy",
+            "info": master_stats,
+            "message": f"{master_stats['entries']} master files cached, hit rate {master_stats['hit_rate']:.0%}",
+        }
+    except Exception as e:
+        health_status["services"]["master_data_cache"] = {
+            "status": "unhealthy",
+            "error": str(e),
+        }
+
+    # 檢查模板緩存狀態
+    try:
+        template_stats = get_template_cache().get_stats()
+        health_status["services"]["template_cache"] = {
+            "status": "healthy",
+            "info": template_stats,
+            "message": f"{template_stats['entries']} templates cached, hit rate {template_stats['hit_rate']:.0%}",
+        }
+    except Exception as e:
+        health_status["services"]["template_cache"] = {
+            "status": "unhealthy",
+            "error": str(e),
+        }
+
+    # 檢查 OCR 後端狀態
+    try:
+        from utils.ocr_backend import get_ocr_backend
+
+        backend_stats = get_ocr_backend().get_stats()
+        health_status["services"]["ocr_backend"] = {
+            "status": "healthy",
+            "info": backend_stats,
+            "message": f"OCR backend: {backend_stats['backend']}",
+        }
+    except Exception as e:
+        health_status["services"]["ocr_backend"] = {
+            "status": "unhealthy",
+            "error": str(e),
+        }
+
+    # 檢查 Gemini 模型池狀態
+    try:
+        from utils.gemini_model_pool import get_gemini_model_pool
+
+        pool_stats = get_gemini_model_pool().get_stats()
+        health_status["services"]["gemini_model_pool"] = {
+            "status": "healthy",
+            "info": pool_stats,
+            "message": f"{pool_stats['created']} models created, {pool_stats['reused']} reused",
+        }
+    except Exception as e:
+        health_status["services"]["gemini_model_pool"] = {
+            "status": "unhealthy",
+            "error": str(e),
+        }
+
     # 設置適當的 HTTP 狀態碼
     status_code = 200
     if health_status["status"] == "unhealthy":
@@ -479,6 +610,7 @@ def _serialize_document_type(doc_type: DocumentType) -> dict:
         "template_json_path": template_path,
         "template_version": template_version,
         "has_template": bool(template_path),
+        "pdf_pages_per_chunk": doc_type.pdf_pages_per_chunk,
         "created_at": doc_type.created_at.isoformat(),
         "updated_at": doc_type.updated_at.isoformat(),
     }
@@ -529,6 +661,11 @@ def update_document_type(
     doc_type.type_name = doc_type_data["type_name"]
     doc_type.type_code = doc_type_data["type_code"]
     doc_type.description = doc_type_data.get("description", doc_type.description)
+    if "pdf_pages_per_chunk" in doc_type_data:
+        pages_per_chunk = doc_type_data["pdf_pages_per_chunk"]
+        if pages_per_chunk is not None and (not isinstance(pages_per_chunk, int) or pages_per_chunk < 0):
+            raise HTTPException(status_code=400, detail="pdf_pages_per_chunk must be a non-negative integer or null")
+        doc_type.pdf_pages_per_chunk = pages_per_chunk
 
     db.commit()
     db.refresh(doc_type)
@@ -538,6 +675,7 @@ def update_document_type(
         "type_name": doc_type.type_name,
         "type_code": doc_type.type_code,
         "description": doc_type.description,
+        "pdf_pages_per_chunk": doc_type.pdf_pages_per_chunk,
         "created_at": doc_type.created_at.isoformat(),
         "updated_at": doc_type.updated_at.isoformat(),
     }
@@ -694,6 +832,12 @@ async def upload_document_type_template(
         )
         raise HTTPException(status_code=500, detail="Failed to save template metadata") from exc
 
+    # Same version re-uploads overwrite the same key: drop cached plans so the next mapping run reloads
+    template_cache = get_template_cache()
+    template_cache.invalidate(template_uri)
+    if previous_path and previous_path != template_uri:
+        template_cache.invalidate(previous_path)
+
     logger.info(
         "Template uploaded for doc_type %s. Stored at %s (previous=%s)",
         doc_type_id,
@@ -762,6 +906,7 @@ def delete_document_type_template(doc_type_id: int, db: Session = Depends(get_db
     file_storage = get_file_storage()
 
     deletion_success = file_storage.delete_file(template_path)
+    get_template_cache().invalidate(template_path)
     logger.info(
         "Template deletion for doc_type %s requested. Path=%s deleted=%s",
         doc_type_id,
@@ -3595,6 +3740,14 @@ def delete_mapping_default(default_id: int, db: Session = Depends(get_db)):
 
     return {"message": "Default deleted successfully"}
 
+def _dispatch_order_job(db: Session, background_tasks: Optional[BackgroundTasks], order_id: int, job_type: OrderJobType, inline_runner) -> None:
+    """Queue an order run for worker processes (ORDER_JOB_MODE=queue) or run it in this process."""
+    if job_queue_enabled():
+        enqueue_order_job(db, order_id, job_type)
+    elif background_tasks is not None:
+        background_tasks.add_task(inline_runner, order_id)
+
+
 @app.post("/orders/{order_id}/submit", response_model=dict)
 def submit_order(order_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     """Submit order for processing"""
@@ -3626,8 +3779,8 @@ def submit_order(order_id: int, background_tasks: BackgroundTasks, db: Session =
 
         db.commit()
 
-        # Start background processing
-        background_tasks.add_task(start_order_processing, order_id)
+        # Start background processing (or queue it for workers)
+        _dispatch_order_job(db, background_tasks, order_id, OrderJobType.PROCESS_ORDER, start_order_processing)
 
         return {
             "order_id": order.order_id,
@@ -3671,8 +3824,8 @@ def process_order_ocr_only(order_id: int, background_tasks: BackgroundTasks, db:
 
         db.commit()
 
-        # Start background OCR-only processing
-        background_tasks.add_task(start_order_ocr_only_processing, order_id)
+        # Start background OCR-only processing (or queue it for workers)
+        _dispatch_order_job(db, background_tasks, order_id, OrderJobType.OCR_ONLY, start_order_ocr_only_processing)
 
         return {
             "order_id": order.order_id,
@@ -3688,8 +3841,17 @@ def process_order_ocr_only(order_id: int, background_tasks: BackgroundTasks, db:
 
 
 @app.post("/orders/{order_id}/process-mapping", response_model=dict)
-def process_order_mapping_only(order_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    """Submit order for mapping-only processing (OCR already completed)"""
+def process_order_mapping_only(
+    order_id: int,
+    background_tasks: BackgroundTasks,
+    force: bool = Query(False, description="Rebuild every item instead of reusing unchanged item mappings"),
+    db: Session = Depends(get_db),
+):
+    """Submit order for mapping-only processing (OCR already completed)
+
+    Items whose inputs (OCR results, mapping config/template, master file
+    version) are unchanged since their last mapping reuse the stored frame.
+    """
     try:
         order = db.query(OcrOrder).filter(OcrOrder.order_id == order_id).first()
         if not order:
@@ -3710,14 +3872,19 @@ def process_order_mapping_only(order_id: int, background_tasks: BackgroundTasks,
         if items_without_ocr > 0:
             raise HTTPException(status_code=400, detail=f"{items_without_ocr} items don't have completed OCR results")
 
+        if force:
+            db.query(OcrOrderItem).filter(OcrOrderItem.order_id == order_id).update(
+                {OcrOrderItem.mapping_fingerprint: None}, synchronize_session=False
+            )
+
         # Update order status to MAPPING
         order.status = OrderStatus.MAPPING
         order.updated_at = datetime.utcnow()
 
         db.commit()
 
-        # Start background mapping processing
-        background_tasks.add_task(start_order_mapping_only_processing, order_id)
+        # Start background mapping processing (or queue it for workers)
+        _dispatch_order_job(db, background_tasks, order_id, OrderJobType.MAPPING_ONLY, start_order_mapping_only_processing)
 
         return {
             "order_id": order.order_id,
@@ -5775,8 +5942,12 @@ def unlock_order(order_id: int, db: Session = Depends(get_db)):
 
 
 @app.post("/orders/{order_id}/restart-ocr")
-def restart_ocr_processing(order_id: int, db: Session = Depends(get_db)):
-    """Restart OCR processing for an order"""
+def restart_ocr_processing(
+    order_id: int,
+    force: bool = Query(False, description="Discard per-file OCR checkpoints and re-OCR every file"),
+    db: Session = Depends(get_db),
+):
+    """Restart OCR processing for an order (files with a completed checkpoint are skipped unless force=true)"""
     try:
         order = db.query(OcrOrder).filter(OcrOrder.order_id == order_id).first()
         if not order:
@@ -5802,26 +5973,35 @@ def restart_ocr_processing(order_id: int, db: Session = Depends(get_db)):
             item.processing_completed_at = None
             item.processing_time_seconds = None
             item.updated_at = datetime.utcnow()
+            if force:
+                for file_link in item.files:
+                    file_link.ocr_status = None
+                    file_link.ocr_result_path = None
+                    file_link.ocr_completed_at = None
+                    file_link.ocr_error = None
 
         db.commit()
 
-        # Trigger OCR processing
-        from utils.order_processor import OrderProcessor
-        processor = OrderProcessor()
-
-        # Process asynchronously
-        import asyncio
-        def run_async():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(processor.process_order(order_id))
-            loop.close()
+        if job_queue_enabled():
+            enqueue_order_job(db, order_id, OrderJobType.PROCESS_ORDER)
+        else:
+            # Trigger OCR processing
+            from utils.order_processor import OrderProcessor
+            processor = OrderProcessor()
+
+            # Process asynchronously
+            import asyncio
+            def run_async():
+                loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(loop)
+                loop.run_until_complete(processor.process_order(order_id))
+                loop.close()
 
-        import threading
-        thread = threading.Thread(target=run_async)
-        thread.start()
+            import threading
+            thread = threading.Thread(target=run_async)
+            thread.start()
 
-        logger.info(f"Order {order_id} OCR processing restarted")
+        logger.info(f"Order {order_id} OCR processing restarted (force={force})")
         return {"message": "OCR processing restarted successfully", "order_id": order_id, "status": "PROCESSING"}
 
     except HTTPException:
@@ -5878,31 +6058,36 @@ def restart_mapping_processing(order_id: int, db: Session = Depends(get_db)):
             logger.info(f"   Template path: {template_path}")
             logger.info(f"   Document type: {order.primary_doc_type.type_name if order.primary_doc_type else 'Unknown'}")
 
-        # Trigger mapping processing
-        from utils.order_processor import OrderProcessor
-        processor = OrderProcessor()
-        logger.info(f"   OrderProcessor initialized, starting async processing...")
-
-        # Process asynchronously with enhanced logging
-        import asyncio
-        def run_async():
-            logger.info(f"   Starting async processing for order {order_id}")
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(processor.process_order_mapping_only(order_id))
-                logger.info(f"   Async processing completed for order {order_id}")
-            except Exception as e:
-                logger.error(f"   Async processing failed for order {order_id}: {str(e)}")
-                raise
-            finally:
-                loop.close()
+        if job_queue_enabled():
+            enqueue_order_job(db, order_id, OrderJobType.MAPPING_ONLY)
+            logger.info(f"✅ Order {order_id} mapping processing restarted - queued for workers")
+        else:
+            # Trigger mapping processing
+            from utils.order_processor import OrderProcessor
+            processor = OrderProcessor()
+            logger.info(f"   OrderProcessor initialized, starting async processing...")
+
+            # Process asynchronously with enhanced logging
+            import asyncio
+            def run_async():
+                logger.info(f"   Starting async processing for order {order_id}")
+                loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(loop)
+                try:
+                    loop.run_until_complete(processor.process_order_mapping_only(order_id))
+                    logger.info(f"   Async processing completed for order {order_id}")
+                except Exception as e:
+                    logger.error(f"   Async processing failed for order {order_id}: {str(e)}")
+                    raise
+                finally:
+                    loop.close()
+
+            import threading
+            thread = threading.Thread(target=run_async)
+            thread.start()
 
-        import threading
-        thread = threading.Thread(target=run_async)
-        thread.start()
+            logger.info(f"✅ Order {order_id} mapping processing restarted - background thread started")
 
-        logger.info(f"✅ Order {order_id} mapping processing restarted - background thread started")
         return {"message": "Mapping processing restarted successfully", "order_id": order_id, "status": "MAPPING"}
 
     except HTTPException:
@@ -6642,6 +6827,8 @@ async def process_monthly_awb(
         if 1 + len(invoices) > 0:
             order.status = OrderStatus.PROCESSING
             db.commit()
+            # OCR runs through the shared scheduler, same as /orders/{id}/submit
+            _dispatch_order_job(db, background_tasks, order_id, OrderJobType.PROCESS_ORDER, start_order_processing)
             logger.info(f"✅ Order {order_id} submitted to processing pipeline")
 
         # If no invoices found, trigger OneDrive sync as fallback
@@ -5,9 +5,13 @@
 
 import os
 import json
+import time
+import asyncio
 import boto3
 import logging
-from typing import List, Dict, Any, Optional
+import threading
+from collections import deque
+from typing import List, Dict, Any, Optional, Deque, Tuple
 from botocore.exceptions import ClientError, NoCredentialsError
 from dotenv import load_dotenv
 
@@ -382,86 +386,279 @@ config_loader = ConfigLoader()
 
 
 # API Key 管理類
+class _KeyState:
+    """單把 API key 的滑動窗口與冷卻狀態"""
+
+    __slots__ = ("requests", "tokens", "token_total", "cooldown_until", "strikes", "last_error_at", "invalid", "total_requests", "total_errors")
+
+    def __init__(self):
+        self.requests: Deque[float] = deque()
+        self.tokens: Deque[Tuple[float, int]] = deque()
+        self.token_total = 0
+        self.cooldown_until = 0.0
+        self.strikes = 0
+        self.last_error_at = 0.0
+        self.invalid = False
+        self.total_requests = 0
+        self.total_errors = 0
+
+
 class APIKeyManager:
-    """API Key 輪換管理器"""
+    """API Key 調度器：按每把 key 的 RPM/TPM 剩餘額度選 key，429 後進入冷卻。
+
+    - 每把 key 以 60 秒滑動窗口記錄請求數與 token 數
+    - 選擇剩餘額度（min(RPM 剩餘比例, TPM 剩餘比例)）最大的 key
+    - 429/配額錯誤後冷卻 base * 2^(strikes-1) 秒（上限 max），strikes 隨時間衰減
+    - 無效 key 永久排除（除非所有 key 都無效）
+    - acquire_key_async 在所有 key 都超出 RPM/TPM 窗口或冷卻中時先等待額度恢復再分配，
+      由限流器預防 429 而不是事後補救（最長等待 GEMINI_KEY_MAX_WAIT_SECONDS，超時後退回額度最多的 key）
+    - 其餘操作持鎖且不阻塞，可同時被 asyncio 與線程調用
+
+    配置（環境變量）：GEMINI_KEY_RPM、GEMINI_KEY_TPM、GEMINI_KEY_COOLDOWN_SECONDS、
+    GEMINI_KEY_MAX_COOLDOWN_SECONDS、GEMINI_KEY_STRIKE_DECAY_SECONDS、GEMINI_KEY_MAX_WAIT_SECONDS
+    """
+
+    WINDOW_SECONDS = 60.0
 
     def __init__(self):
         self.api_keys = config_loader.get_gemini_api_keys()
+        self.rpm_limit = max(1, int(os.getenv("GEMINI_KEY_RPM", "60")))
+        self.tpm_limit = max(1, int(os.getenv("GEMINI_KEY_TPM", "1000000")))
+        self.base_cooldown = float(os.getenv("GEMINI_KEY_COOLDOWN_SECONDS", "15"))
+        self.max_cooldown = float(os.getenv("GEMINI_KEY_MAX_COOLDOWN_SECONDS", "300"))
+        self.strike_decay = float(os.getenv("GEMINI_KEY_STRIKE_DECAY_SECONDS", "300"))
+        self.max_wait = max(0.0, float(os.getenv("GEMINI_KEY_MAX_WAIT_SECONDS", "120")))
+
+        self._lock = threading.Lock()
+        self._states: Dict[int, _KeyState] = {i: _KeyState() for i in range(len(self.api_keys))}
+        self._index_by_key = {key: i for i, key in enumerate(self.api_keys)}
+        self._rr_cursor = 0
+        # 最近一次分配出去的 key 索引（兼容舊接口）
         self.current_index = 0
-        self.usage_count = {}
-
-        # 初始化使用計數
-        for i, key in enumerate(self.api_keys):
-            self.usage_count[i] = 0
-
-    def get_current_key(self) -> str:
-        """獲取當前 API key"""
-        if not self.api_keys:
-            raise ValueError("No API keys available")
-        return self.api_keys[self.current_index]
 
-    def get_next_key(self) -> str:
-        """獲取下一個 API key（輪換）"""
+    # ------------------------------------------------------------------
+    # 內部計算（調用方須持鎖）
+    # ------------------------------------------------------------------
+
+    def _prune(self, state: _KeyState, now: float) -> None:
+        horizon = now - self.WINDOW_SECONDS
+        while state.requests and state.requests[0] <= horizon:
+            state.requests.popleft()
+        while state.tokens and state.tokens[0][0] <= horizon:
+            state.token_total -= state.tokens.popleft()[1]
+        # 冷卻懲罰隨時間衰減：每個衰減周期無錯誤則減少一次 strike
+        if state.strikes and self.strike_decay > 0:
+            decayed = int((now - state.last_error_at) // self.strike_decay)
+            if decayed:
+                state.strikes = max(0, state.strikes - decayed)
+                state.last_error_at += decayed * self.strike_decay
+
+    def _headroom(self, state: _KeyState) -> float:
+        rpm_left = 1.0 - len(state.requests) / self.rpm_limit
+        tpm_left = 1.0 - state.token_total / self.tpm_limit
+        return min(rpm_left, tpm_left)
+
+    def _wait_seconds(self, state: _KeyState, now: float) -> float:
+        """該 key 還需等待多久才能在不超出 RPM/TPM 窗口、且不在冷卻中的情況下再發一次請求"""
+        wait = max(0.0, state.cooldown_until - now)
+        overflow = len(state.requests) - self.rpm_limit
+        if overflow >= 0:
+            # 需等到最舊的 overflow+1 個請求滑出窗口
+            wait = max(wait, state.requests[overflow] + self.WINDOW_SECONDS - now)
+        if state.token_total >= self.tpm_limit and state.tokens:
+            excess = state.token_total - self.tpm_limit
+            for recorded_at, tokens in state.tokens:
+                excess -= tokens
+                if excess < 0:
+                    wait = max(wait, recorded_at + self.WINDOW_SECONDS - now)
+                    break
+        return wait
+
+    def _select_locked(self, exclude: Optional[int] = None) -> int:
         if not self.api_keys:
             raise ValueError("No API keys available")
 
-        self.current_index = (self.current_index + 1) % len(self.api_keys)
-        self.usage_count[self.current_index] += 1
-        return self.api_keys[self.current_index]
+        now = time.monotonic()
+        count = len(self.api_keys)
+        candidates = []
+        for offset in range(count):
+            # 從輪詢游標開始，讓額度相同的 key 輪流被選中
+            index = (self._rr_cursor + offset) % count
+            state = self._states[index]
+            self._prune(state, now)
+            candidates.append((index, state))
+
+        usable = [(i, st) for i, st in candidates if not st.invalid] or candidates
+        if exclude is not None and len(usable) > 1:
+            usable = [(i, st) for i, st in usable if i != exclude] or usable
+
+        within = [(i, st) for i, st in usable if self._wait_seconds(st, now) <= 0]
+        ready = within or [(i, st) for i, st in usable if st.cooldown_until <= now]
+        if ready:
+            # 剩餘額度最大者優先；額度相同時保持輪詢順序
+            index, _ = max(ready, key=lambda item: self._headroom(item[1]))
+        else:
+            # 全部冷卻中：選最早恢復的 key，由調用方決定是否等待
+            index, _ = min(usable, key=lambda item: item[1].cooldown_until)
+
+        self._rr_cursor = (index + 1) % count
+        return index
+
+    def _record_request_locked(self, index: int) -> str:
+        state = self._states[index]
+        state.requests.append(time.monotonic())
+        state.total_requests += 1
+        self.current_index = index
+        return self.api_keys[index]
+
+    # ------------------------------------------------------------------
+    # 選 key
+    # ------------------------------------------------------------------
+
+    def acquire_key(self, exclude_key: Optional[str] = None) -> str:
+        """分配剩餘額度最多的 API key 並記錄一次請求"""
+        with self._lock:
+            exclude = self._index_by_key.get(exclude_key) if exclude_key else None
+            index = self._select_locked(exclude)
+            return self._record_request_locked(index)
+
+    def try_acquire_key(self, exclude_key: Optional[str] = None) -> Tuple[Optional[str], float]:
+        """有 key 在額度內時分配並記錄一次請求，返回 (key, 0)；否則不分配，返回 (None, 需等待秒數)"""
+        with self._lock:
+            exclude = self._index_by_key.get(exclude_key) if exclude_key else None
+            index = self._select_locked(exclude)
+            wait = self._wait_seconds(self._states[index], time.monotonic())
+            if wait > 0:
+                return None, wait
+            return self._record_request_locked(index), 0.0
+
+    async def acquire_key_async(self, exclude_key: Optional[str] = None) -> str:
+        """等待直到有 key 在 RPM/TPM 額度內且未冷卻，再分配並記錄一次請求"""
+        deadline = time.monotonic() + self.max_wait
+        waited = False
+        while True:
+            key, wait = self.try_acquire_key(exclude_key)
+            if key is not None:
+                return key
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(
+                    f"⚠️ No API key regained headroom within {self.max_wait:.0f}s; dispatching on the least loaded key"
+                )
+                return self.acquire_key(exclude_key)
+            if not waited:
+                logger.info(f"⏳ All API keys at their RPM/TPM limit or cooling down; waiting {wait:.1f}s for headroom")
+                waited = True
+            # 其他協程可能先拿到恢復的額度，所以醒來後重新選擇
+            await asyncio.sleep(min(wait, remaining) + 0.01)
 
-    def get_least_used_key(self) -> str:
-        """獲取使用次數最少的 API key"""
+    def get_current_key(self) -> str:
+        """獲取最近一次分配的 API key"""
         if not self.api_keys:
             raise ValueError("No API keys available")
+        return self.api_keys[self.current_index]
 
-        # 找到使用次數最少的 key
-        min_usage = min(self.usage_count.values())
-        for index, usage in self.usage_count.items():
-            if usage == min_usage:
-                self.current_index = index
-                self.usage_count[index] += 1
-                return self.api_keys[index]
+    def get_next_key(self, exclude_key: Optional[str] = None) -> str:
+        """獲取下一個 API key（避開 exclude_key，默認避開最近一次分配的 key）"""
+        if exclude_key is None and self.api_keys:
+            exclude_key = self.api_keys[self.current_index]
+        return self.acquire_key(exclude_key)
 
-    def mark_key_error(self, key: str):
-        """標記 API key 出現錯誤"""
-        try:
-            key_index = self.api_keys.index(key)
-            # 增加錯誤權重，降低該 key 的優先級
-            self.usage_count[key_index] += 10
-            logger.warning(
-                f"API key {key_index} marked with error, usage count increased"
-            )
-        except ValueError:
-            logger.warning(f"API key not found in list: {key[:10]}...")
+    def get_least_used_key(self) -> str:
+        """獲取剩餘額度最多的 API key（兼容舊接口）"""
+        return self.acquire_key()
+
+    def seconds_until_available(self) -> float:
+        """距離最早有 key 可用（未冷卻且未超出 RPM/TPM）還需等待的秒數"""
+        with self._lock:
+            if not self.api_keys:
+                return 0.0
+            now = time.monotonic()
+            waits = []
+            for state in self._states.values():
+                if state.invalid:
+                    continue
+                self._prune(state, now)
+                waits.append(self._wait_seconds(state, now))
+            return min(waits) if waits else 0.0
+
+    # ------------------------------------------------------------------
+    # 用量與錯誤回報
+    # ------------------------------------------------------------------
+
+    def record_usage(self, key: str, tokens: int) -> None:
+        """記錄一次成功請求消耗的 token 數"""
+        if not tokens:
+            return
+        with self._lock:
+            index = self._index_by_key.get(key)
+            if index is None:
+                return
+            state = self._states[index]
+            state.tokens.append((time.monotonic(), int(tokens)))
+            state.token_total += int(tokens)
+
+    def mark_key_error(self, key: str, retry_after: Optional[float] = None):
+        """標記 API key 觸發限流/配額錯誤，進入指數冷卻"""
+        with self._lock:
+            index = self._index_by_key.get(key)
+            if index is None:
+                logger.warning(f"API key not found in list: {key[:10]}...")
+                return
+            now = time.monotonic()
+            state = self._states[index]
+            self._prune(state, now)
+            state.strikes += 1
+            state.total_errors += 1
+            state.last_error_at = now
+            cooldown = min(self.max_cooldown, self.base_cooldown * (2 ** (state.strikes - 1)))
+            if retry_after:
+                cooldown = max(cooldown, float(retry_after))
+            state.cooldown_until = max(state.cooldown_until, now + cooldown)
+        logger.warning(f"API key {index} rate limited; cooling down {cooldown:.0f}s (strike {state.strikes})")
 
     def mark_key_invalid(self, key: str):
-        """將無效的 API key 快速降級，避免再次選用。
-
-        將其 usage 設為當前最⼤值+1000，實現強烈的降權效果。
-        """
-        try:
-            key_index = self.api_keys.index(key)
-            max_usage = max(self.usage_count.values()) if self.usage_count else 0
-            self.usage_count[key_index] = max_usage + 1000
-            logger.warning(
-                f"API key {key_index} marked INVALID; deprioritized with usage={self.usage_count[key_index]}"
-            )
-        except ValueError:
-            logger.warning(f"API key not found in list: {key[:10]}...")
-
-    def get_usage_stats(self) -> Dict[int, int]:
-        """獲取使用統計"""
-        return self.usage_count.copy()
+        """將無效的 API key 排除出調度"""
+        with self._lock:
+            index = self._index_by_key.get(key)
+            if index is None:
+                logger.warning(f"API key not found in list: {key[:10]}...")
+                return
+            self._states[index].invalid = True
+            self._states[index].total_errors += 1
+        logger.warning(f"API key {index} marked INVALID; excluded from scheduling")
+
+    def get_usage_stats(self) -> Dict[int, Dict[str, Any]]:
+        """獲取每把 key 的窗口用量、冷卻與累計統計"""
+        with self._lock:
+            now = time.monotonic()
+            stats = {}
+            for index, state in self._states.items():
+                self._prune(state, now)
+                stats[index] = {
+                    "requests_last_minute": len(state.requests),
+                    "tokens_last_minute": state.token_total,
+                    "headroom": round(self._headroom(state), 3),
+                    "cooldown_remaining": round(max(0.0, state.cooldown_until - now), 1),
+                    "strikes": state.strikes,
+                    "invalid": state.invalid,
+                    "total_requests": state.total_requests,
+                    "total_errors": state.total_errors,
+                }
+            return stats
 
 
 # 全局 API Key 管理器 (延遲初始化)
 api_key_manager = None
+_api_key_manager_lock = threading.Lock()
 
 def get_api_key_manager():
     """獲取 API Key 管理器 (延遲初始化)"""
     global api_key_manager
     if api_key_manager is None:
-        api_key_manager = APIKeyManager()
+        with _api_key_manager_lock:
+            if api_key_manager is None:
+                api_key_manager = APIKeyManager()
     return api_key_manager
 
 
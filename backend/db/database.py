@@ -200,6 +200,9 @@ def _ensure_mapping_schema(engine):
                 else:
                     statements.append("ALTER TABLE ocr_order_items ADD COLUMN mapping_config TEXT NULL")
 
+            if "mapping_fingerprint" not in existing_columns:
+                statements.append("ALTER TABLE ocr_order_items ADD COLUMN mapping_fingerprint VARCHAR(64) NULL")
+
             if statements:
                 with engine.begin() as connection:
                     for stmt in statements:
@@ -223,6 +226,32 @@ def _ensure_mapping_schema(engine):
                     for stmt in statements:
                         connection.execute(text(stmt))
                 logger.info("Ensured company_doc_mapping_defaults columns exist.")
+
+        if inspector.has_table("order_item_files"):
+            link_columns = {col["name"] for col in inspector.get_columns("order_item_files")}
+            statements = []
+            if "ocr_status" not in link_columns:
+                statements.append("ALTER TABLE order_item_files ADD COLUMN ocr_status VARCHAR(20) NULL")
+            if "ocr_result_path" not in link_columns:
+                statements.append("ALTER TABLE order_item_files ADD COLUMN ocr_result_path VARCHAR(500) NULL")
+            if "ocr_completed_at" not in link_columns:
+                timestamp_type = "TIMESTAMP WITHOUT TIME ZONE" if dialect == "postgresql" else "TIMESTAMP"
+                statements.append(f"ALTER TABLE order_item_files ADD COLUMN ocr_completed_at {timestamp_type} NULL")
+            if "ocr_error" not in link_columns:
+                statements.append("ALTER TABLE order_item_files ADD COLUMN ocr_error TEXT NULL")
+
+            if statements:
+                with engine.begin() as connection:
+                    for stmt in statements:
+                        connection.execute(text(stmt))
+                logger.info("Ensured order_item_files OCR checkpoint columns exist.")
+
+        if inspector.has_table("document_types"):
+            doc_type_columns = {col["name"] for col in inspector.get_columns("document_types")}
+            if "pdf_pages_per_chunk" not in doc_type_columns:
+                with engine.begin() as connection:
+                    connection.execute(text("ALTER TABLE document_types ADD COLUMN pdf_pages_per_chunk INTEGER NULL"))
+                logger.info("Ensured document_types.pdf_pages_per_chunk column exists.")
     except Exception as err:
         logger.error(f"Failed to ensure mapping schema: {err}")
 
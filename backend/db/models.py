@@ -73,6 +73,11 @@ class DocumentType(Base):
         nullable=True,
         comment="S3 key or URL for uploaded template JSON file",
     )
+    pdf_pages_per_chunk = Column(
+        Integer,
+        nullable=True,
+        comment="Pages per OCR chunk for multi-page PDFs (NULL = global default, 0 = whole document)",
+    )
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -401,6 +406,7 @@ class OcrOrderItem(Base):
     ocr_result_json_path = Column(String(500), nullable=True, comment='S3 path to primary file OCR result JSON')
     ocr_result_csv_path = Column(String(500), nullable=True, comment='S3 path to mapped CSV result (primary + attachments)')
     mapping_config = Column(JSON, nullable=True, comment='Per-item mapping configuration (join keys, master CSV path, template references)')
+    mapping_fingerprint = Column(String(64), nullable=True, comment='Hash of the inputs behind the stored mapped frame (OCR results, config, master version)')
     processing_started_at = Column(DateTime, nullable=True)
     processing_completed_at = Column(DateTime, nullable=True)
     processing_time_seconds = Column(Float, nullable=True)
@@ -423,6 +429,10 @@ class OrderItemFile(Base):
     item_id = Column(Integer, ForeignKey("ocr_order_items.item_id", ondelete="CASCADE"), primary_key=True)
     file_id = Column(Integer, ForeignKey("files.file_id", ondelete="CASCADE"), primary_key=True)
     upload_order = Column(Integer, nullable=True, comment='Order in which file was uploaded to this item')
+    ocr_status = Column(String(20), nullable=True, comment='Per-file OCR checkpoint: COMPLETED or FAILED (NULL = not processed yet)')
+    ocr_result_path = Column(String(500), nullable=True, comment='S3 path to the checkpointed OCR result for this file')
+    ocr_completed_at = Column(DateTime, nullable=True)
+    ocr_error = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
@@ -430,6 +440,42 @@ class OrderItemFile(Base):
     file = relationship("File")
 
 
+class OrderJobType(enum.Enum):
+    PROCESS_ORDER = "PROCESS_ORDER"  # Full pipeline: OCR + mapping
+    OCR_ONLY = "OCR_ONLY"
+    MAPPING_ONLY = "MAPPING_ONLY"
+
+
+class OrderJobStatus(enum.Enum):
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    SUCCEEDED = "SUCCEEDED"
+    FAILED = "FAILED"
+
+
+class OrderJob(Base):
+    """Durable queue entry for order processing, claimed by worker processes via leases"""
+    __tablename__ = "order_jobs"
+
+    job_id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, ForeignKey("ocr_orders.order_id", ondelete="CASCADE"), nullable=False, index=True)
+    job_type = Column(Enum(OrderJobType), nullable=False, comment='Pipeline stage to run for the order')
+    status = Column(Enum(OrderJobStatus), nullable=False, default=OrderJobStatus.QUEUED, index=True)
+    attempts = Column(Integer, nullable=False, default=0, comment='Number of times the job has been claimed')
+    max_attempts = Column(Integer, nullable=False, default=3)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow, comment='Earliest time the job may be claimed (retry backoff)')
+    lease_owner = Column(String(255), nullable=True, comment='Worker id currently holding the lease')
+    lease_expires_at = Column(DateTime, nullable=True, comment='Lease deadline; expired RUNNING jobs are reclaimed')
+    heartbeat_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    order = relationship("OcrOrder")
+
+
 # OneDrive Sync Tracking
 
 class OneDriveSync(Base):
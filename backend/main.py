@@ -11,7 +11,9 @@ from datetime import datetime
 import asyncio
 import time
 import logging
+import io
 from functools import wraps
+from typing import Optional
 
 # 導入配置管理器
 try:
@@ -22,9 +24,31 @@ except ImportError:
     CONFIG_AVAILABLE = False
     logging.warning("Config loader not available, using fallback methods")
 
+from utils.ocr_backend import get_ocr_backend
+from utils.ocr_scheduler import get_ocr_scheduler
+from utils.pdf_chunking import merge_chunk_results, split_pdf_bytes
+
+# OCR 結果緩存（可選）
+try:
+    from utils.ocr_result_cache import get_ocr_result_cache, build_cache_key
+
+    OCR_CACHE_AVAILABLE = True
+except ImportError:
+    OCR_CACHE_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
 
+def get_model_name() -> str:
+    """獲取模型名稱（不佔用 API key）"""
+    if CONFIG_AVAILABLE:
+        try:
+            return config_loader.get_app_config().get("model_name", "gemini-2.5-flash-preview-05-20")
+        except Exception as e:
+            logger.error(f"Failed to get model name from config loader: {e}")
+    return os.getenv("MODEL_NAME", "gemini-2.5-flash-preview-05-20")
+
+
 def get_api_key_and_model() -> tuple[str, str]:
     """獲取 API key 和模型名稱"""
     if CONFIG_AVAILABLE:
@@ -50,139 +74,156 @@ def get_api_key_and_model() -> tuple[str, str]:
     return api_key, model_name
 
 
-def configure_gemini_with_retry(api_key: str, max_retries: int = 3):
-    """配置 Gemini API 並支持重試機制"""
-    for attempt in range(max_retries):
-        try:
-            genai.configure(api_key=api_key)
-            logger.info(
-                f"✅ Gemini API configured successfully (attempt {attempt + 1})"
-            )
-            return True
-        except Exception as e:
-            logger.warning(
-                f"⚠️  Failed to configure Gemini API (attempt {attempt + 1}): {e}"
-            )
-            if attempt == max_retries - 1:
-                raise ValueError(
-                    f"Failed to configure Gemini API after {max_retries} attempts: {e}"
-                )
-            time.sleep(1)  # Wait before retry
-    return False
+RATE_LIMIT_SIGNALS = [
+    "quota",  # 包括 "exceeded your current quota" 錯誤
+    "rate limit",
+    "429",  # HTTP 429 狀態碼
+    "resource exhausted",
+    "resource has been exhausted",
+    "resource_exhausted",
+]
+
+INVALID_KEY_SIGNALS = [
+    "api key not valid",
+    "api_key_invalid",
+    "invalid api key",
+]
+
+
+def is_key_scoped_error(error: Exception) -> bool:
+    """限流或 key 無效的錯誤：換 key 重試有意義，同 key 做 fallback 則沒有"""
+    error_msg = str(error).lower()
+    return any(sig in error_msg for sig in RATE_LIMIT_SIGNALS + INVALID_KEY_SIGNALS)
+
+
+def _get_call_api_key(args, kwargs):
+    if "api_key" in kwargs:
+        return kwargs["api_key"]
+    return args[3] if len(args) >= 4 else None
+
+
+def _set_call_api_key(args, kwargs, api_key):
+    if "api_key" in kwargs or len(args) < 4:
+        kwargs["api_key"] = api_key
+        return args, kwargs
+    args = list(args)
+    args[3] = api_key  # api_key 是第4個參數
+    return tuple(args), kwargs
+
+
+class _DeferredKey:
+    """由 api_error_handler 傳入的延遲 key：在 OCR 調度器槽位內、真正發送前才向調度器取 key。
+
+    在排隊等槽位時不佔用 RPM/TPM 窗口，請求時間戳也與實際發送時間一致；
+    每次模型調用（含 fallback）各記錄一次請求，key 記錄最近一次實際使用的 key。
+    """
+
+    __slots__ = ("manager", "exclude_key", "key")
+
+    def __init__(self, manager, exclude_key: Optional[str] = None):
+        self.manager = manager
+        self.exclude_key = exclude_key
+        self.key: Optional[str] = None
+
+    async def acquire(self) -> str:
+        self.key = await self.manager.acquire_key_async(exclude_key=self.exclude_key)
+        return self.key
+
+
+def _used_api_key(args, kwargs) -> Optional[str]:
+    api_key = _get_call_api_key(args, kwargs)
+    return api_key.key if isinstance(api_key, _DeferredKey) else api_key
 
 
 def api_error_handler(func):
-    """API 錯誤處理裝飾器"""
+    """API 錯誤處理裝飾器
+
+    調用方未指定 key 時傳入延遲 key，由 _scheduled_generate 在調度器槽位內分配（所有 key 都超出
+    RPM/TPM 窗口時先等待額度），成功後回報 token 用量；限流錯誤讓該 key 進入冷卻並在重試時避開它。
+    """
 
     @wraps(func)
     async def wrapper(*args, **kwargs):
         max_retries = 3
         last_exception = None
+        api_key_manager = None
 
-        for attempt in range(max_retries):
+        if CONFIG_AVAILABLE:
             try:
-                # 如果有API key manager，嘗試獲取不同的key
-                if CONFIG_AVAILABLE and attempt > 0:
-                    try:
-                        api_key_manager = get_api_key_manager()
-                        old_index = api_key_manager.current_index
-                        old_key = api_key_manager.get_current_key()
-
-                        new_api_key = api_key_manager.get_next_key()
-                        new_index = api_key_manager.current_index
-
-                        logger.info(f"🔄 API Key 切換: 從索引 {old_index} ({old_key[:20]}...) 切換到索引 {new_index} ({new_api_key[:20]}...)")
-
-                        configure_gemini_with_retry(new_api_key)
-                        # 更新函數參數中的api_key
-                        if "api_key" in kwargs:
-                            kwargs["api_key"] = new_api_key
-                        elif len(args) >= 4:  # 假設api_key是第4個參數
-                            args = list(args)
-                            args[3] = new_api_key
-                            args = tuple(args)
-
-                        logger.info(f"✅ API Key 切換成功，重試中...")
-                    except Exception as e:
-                        logger.warning(f"❌ API Key 切換失敗: {e}")
+                api_key_manager = get_api_key_manager()
+                if not _get_call_api_key(args, kwargs):
+                    args, kwargs = _set_call_api_key(args, kwargs, _DeferredKey(api_key_manager))
+            except Exception as e:
+                logger.warning(f"⚠️  API Key 調度器不可用: {e}")
+                api_key_manager = None
 
-                return await func(*args, **kwargs)
+        attempt = 0
+        invalid_key_rotations = 0
+        while attempt < max_retries:
+            try:
+                result = await func(*args, **kwargs)
+                used_key = _used_api_key(args, kwargs)
+                if api_key_manager and used_key and isinstance(result, dict):
+                    tokens = (result.get("input_tokens") or 0) + (result.get("output_tokens") or 0)
+                    api_key_manager.record_usage(used_key, tokens)
+                return result
 
             except Exception as e:
                 last_exception = e
+                used_key = _used_api_key(args, kwargs)
                 error_msg = str(e).lower()
 
                 # 檢查是否是可重試的錯誤
-                retryable_errors = [
-                    "quota",
-                    "rate limit",
+                retryable_errors = RATE_LIMIT_SIGNALS + [
                     "timeout",
+                    "deadline exceeded",
                     "connection",
                     "service unavailable",
-                    "429",  # HTTP 429 狀態碼
-                    "exceeded",  # "exceeded your current quota" 錯誤
                 ]
                 if any(err in error_msg for err in retryable_errors):
                     matched_error = [err for err in retryable_errors if err in error_msg][0]
                     logger.warning(
                         f"⚠️  可重試的 API 錯誤 (匹配: {matched_error}) - 嘗試 {attempt + 1}/{max_retries}: {e}"
                     )
+                    attempt += 1
+                    if attempt >= max_retries:
+                        break
 
-                    # 標記當前API key有問題
-                    if CONFIG_AVAILABLE:
-                        try:
-                            api_key_manager = get_api_key_manager()
-                            current_api_key = api_key_manager.get_current_key()
-                            current_index = api_key_manager.current_index
+                    wait_time = (2 ** (attempt - 1)) + 1  # 指數退避
+                    if api_key_manager and used_key and matched_error in RATE_LIMIT_SIGNALS:
+                        # 限流只針對這把 key：冷卻它，換 key 時由調度器等到有 key 恢復額度
+                        api_key_manager.mark_key_error(used_key)
+                        wait_time = 0
 
-                            logger.info(f"🔴 標記 API Key 索引 {current_index} ({current_api_key[:20]}...) 有問題")
-                            api_key_manager.mark_key_error(current_api_key)
+                    if wait_time > 0:
+                        logger.info(f"⏳ 等待 {wait_time:.1f}s 後進行重試...")
+                        await asyncio.sleep(wait_time)
 
-                            usage_stats = api_key_manager.get_usage_stats()
-                            logger.info(f"📊 API Key 使用統計: {usage_stats}")
-                        except Exception as key_error:
-                            logger.warning(f"⚠️  無法標記 API Key 錯誤: {key_error}")
+                    if api_key_manager and used_key:
+                        # 新 key 在重試的調度器槽位內分配
+                        args, kwargs = _set_call_api_key(args, kwargs, _DeferredKey(api_key_manager, used_key))
+                        logger.info(f"🔄 API Key 切換: 重試將避開 {used_key[:20]}...")
+                    continue
 
-                    if attempt < max_retries - 1:
-                        wait_time = (2**attempt) + 1  # 指數退避
-                        logger.info(f"⏳ 等待 {wait_time}s 後進行重試...")
-                        await asyncio.sleep(wait_time)
-                        continue
-                else:
-                    # 特判：API key 無效時，標記降級並嘗試切換一次 key
-                    invalid_key_signals = [
-                        "api key not valid",
-                        "api_key_invalid",
-                        "invalid api key",
-                    ]
-                    if any(sig in error_msg for sig in invalid_key_signals) and CONFIG_AVAILABLE:
-                        try:
-                            api_key_manager = get_api_key_manager()
-                            bad_key = api_key_manager.get_current_key()
-                            bad_index = api_key_manager.current_index
-                            logger.warning(
-                                f"🔑 Detected INVALID API key at index {bad_index} ({bad_key[:20]}...). Deprioritizing and rotating."
-                            )
-                            # 強降級，使其後續極少被選中
-                            api_key_manager.mark_key_invalid(bad_key)
-
-                            # 嘗試切換到下一把 key 後重試當前 attempt（不增加 attempt 次數）
-                            new_api_key = api_key_manager.get_next_key()
-                            configure_gemini_with_retry(new_api_key)
-                            if "api_key" in kwargs:
-                                kwargs["api_key"] = new_api_key
-                            elif len(args) >= 4:
-                                args = list(args)
-                                args[3] = new_api_key
-                                args = tuple(args)
-                            logger.info("✅ Switched to next API key after invalid key; retrying current attempt...")
-                            continue
-                        except Exception as key_exc:
-                            logger.error(f"Failed to rotate after invalid key: {key_exc}")
-
-                    # 其他不可重試錯誤直接拋出
-                    logger.error(f"Non-retryable API error: {e}")
-                    raise e
+                # 特判：API key 無效時，排除該 key 並換 key 重試（不增加 attempt 次數）
+                if (
+                    any(sig in error_msg for sig in INVALID_KEY_SIGNALS)
+                    and api_key_manager
+                    and used_key
+                    and invalid_key_rotations < len(api_key_manager.api_keys)
+                ):
+                    logger.warning(
+                        f"🔑 Detected INVALID API key ({used_key[:20]}...). Excluding and rotating."
+                    )
+                    api_key_manager.mark_key_invalid(used_key)
+                    args, kwargs = _set_call_api_key(args, kwargs, _DeferredKey(api_key_manager, used_key))
+                    invalid_key_rotations += 1
+                    logger.info("✅ Switched to next API key after invalid key; retrying current attempt...")
+                    continue
+
+                # 其他不可重試錯誤直接拋出
+                logger.error(f"Non-retryable API error: {e}")
+                raise e
 
         # 所有重試都失敗了
         logger.error(f"All API retry attempts failed. Last error: {last_exception}")
@@ -191,6 +232,51 @@ def api_error_handler(func):
     return wrapper
 
 
+async def _scheduled_generate(backend, api_key, *args, **kwargs):
+    """模型調用佔用 OCR 調度器的一個槽位（整個檔案、PDF 分頁區塊與 fallback 各算一次調用）
+
+    延遲 key 在取得槽位後才分配，API Key 調度器記錄的請求時間即實際發送時間。
+    """
+    async with get_ocr_scheduler().slot():
+        if isinstance(api_key, _DeferredKey):
+            api_key = await api_key.acquire()
+        return await backend.generate_content(api_key, *args, **kwargs)
+
+
+def ocr_result_cached(func):
+    """OCR 結果緩存裝飾器：以 (文件內容, prompt, schema, 模型) 的 SHA-256 為鍵。
+
+    命中時直接返回已保存的結果（零 token），未命中時調用 Gemini 並保存成功結果。
+    """
+
+    @wraps(func)
+    async def wrapper(file_bytes, enhanced_prompt, response_schema, api_key=None, model_name=None):
+        if not OCR_CACHE_AVAILABLE:
+            return await func(file_bytes, enhanced_prompt, response_schema, api_key, model_name)
+
+        cache = None
+        cache_key = None
+        resolved_model = model_name or get_model_name()
+        try:
+            cache = get_ocr_result_cache()
+            if cache.enabled:
+                cache_key = build_cache_key(file_bytes, enhanced_prompt, response_schema, resolved_model)
+                cached = await asyncio.to_thread(cache.get, cache_key)
+                if cached is not None:
+                    return cached
+        except Exception as e:
+            logger.warning(f"⚠️  OCR cache lookup skipped: {e}")
+            cache_key = None
+
+        result = await func(file_bytes, enhanced_prompt, response_schema, api_key, model_name)
+
+        if cache is not None and cache_key:
+            await asyncio.to_thread(cache.put, cache_key, result, resolved_model)
+        return result
+
+    return wrapper
+
+
 def preprocess_image(image_path):
     """
     Enhance image to improve text detection.
@@ -388,31 +474,24 @@ def get_response_schema(doc_type, provider_name):
         return None
 
 
+@ocr_result_cached
 @api_error_handler
-async def extract_text_from_image(
-    image_path, enhanced_prompt, response_schema, api_key=None, model_name=None
+async def extract_text_from_image_bytes(
+    image_bytes, enhanced_prompt, response_schema, api_key=None, model_name=None
 ):
     """
-    Extract text from image using the enhanced pipeline (async version with retry).
+    Extract text from in-memory image bytes (async version with retry).
     """
     # 如果沒有提供 API key 和模型名稱，從配置獲取
-    if not api_key or not model_name:
-        api_key, model_name = get_api_key_and_model()
-
-    processed_image = PIL.Image.open(image_path)
-
-    # 配置 Gemini API（帶重試）
-    configure_gemini_with_retry(api_key)
-
-    # Configure the model
-    model = genai.GenerativeModel(
-        model_name=model_name,
-        generation_config={
-            "temperature": 0.3,
-            "top_p": 0.95,
-            "top_k": 40,
-        },
-    )
+    if not api_key:
+        api_key, default_model_name = get_api_key_and_model()
+        model_name = model_name or default_model_name
+    model_name = model_name or get_model_name()
+
+    processed_image = PIL.Image.open(io.BytesIO(image_bytes))
+
+    # 模型調用由可插拔後端完成（gemini / replay / record）
+    backend = get_ocr_backend()
     # Start timing
     start_time = time.time()
     status_updates = {}
@@ -425,14 +504,18 @@ async def extract_text_from_image(
         print(f"Gemini API processing started at {start_time}")
         # Make API request with proper structure for response schema
 
-        # Use asyncio.to_thread to run the blocking API call in a separate thread
-        response = await asyncio.to_thread(
-            model.generate_content,
+        response = await _scheduled_generate(
+            backend,
+            api_key,
+            model_name,
             contents=[enhanced_prompt, processed_image],
             generation_config=genai.GenerationConfig(
                 response_mime_type="application/json",
                 response_schema=response_schema,
             ),
+            source_bytes=image_bytes,
+            prompt=enhanced_prompt,
+            response_schema=response_schema,
         )
         # Calculate processing time
         processing_time = time.time() - start_time
@@ -452,14 +535,22 @@ async def extract_text_from_image(
         }
     except Exception as e:
         print(f"Error generating content: {e}")
+        if is_key_scoped_error(e):
+            # 限流/無效 key：同一把 key 的 fallback 也會失敗，交給 api_error_handler 換 key
+            raise
         # Try a fallback approach without the schema if there's an error
         try:
-            fallback_response = await asyncio.to_thread(
-                model.generate_content,
+            fallback_response = await _scheduled_generate(
+                backend,
+                api_key,
+                model_name,
                 contents=[enhanced_prompt, processed_image],
                 generation_config=genai.GenerationConfig(
                     response_mime_type="application/json",
                 ),
+                source_bytes=image_bytes,
+                prompt=enhanced_prompt,
+                response_schema=None,
             )
             return {
                 "text": fallback_response.text,
@@ -471,34 +562,34 @@ async def extract_text_from_image(
             return {"text": f"Error: {e}", "input_tokens": 0, "output_tokens": 0}
 
 
+async def extract_text_from_image(
+    image_path, enhanced_prompt, response_schema, api_key=None, model_name=None
+):
+    """
+    Extract text from image using the enhanced pipeline (async version with retry).
+    """
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+    return await extract_text_from_image_bytes(image_bytes, enhanced_prompt, response_schema, api_key, model_name)
+
+
+@ocr_result_cached
 @api_error_handler
-async def extract_text_from_pdf(
-    pdf_path, enhanced_prompt, response_schema, api_key=None, model_name=None
+async def extract_text_from_pdf_bytes(
+    pdf_data, enhanced_prompt, response_schema, api_key=None, model_name=None
 ):
     """
-    Extract text directly from PDF using Gemini API (async version with retry).
+    Extract text directly from in-memory PDF bytes using Gemini API (async version with retry).
     With timing and status tracking.
     """
     # 如果沒有提供 API key 和模型名稱，從配置獲取
-    if not api_key or not model_name:
-        api_key, model_name = get_api_key_and_model()
-
-    # 配置 Gemini API（帶重試）
-    configure_gemini_with_retry(api_key)
-
-    # Load PDF as bytes
-    with open(pdf_path, "rb") as f:
-        pdf_data = f.read()
+    if not api_key:
+        api_key, default_model_name = get_api_key_and_model()
+        model_name = model_name or default_model_name
+    model_name = model_name or get_model_name()
 
-    # Configure the model
-    model = genai.GenerativeModel(
-        model_name=model_name,
-        generation_config={
-            "temperature": 0.3,
-            "top_p": 0.95,
-            "top_k": 40,
-        },
-    )
+    # 模型調用由可插拔後端完成（gemini / replay / record）
+    backend = get_ocr_backend()
 
     # Start timing
     start_time = time.time()
@@ -511,8 +602,10 @@ async def extract_text_from_pdf(
         status_updates["step"] = "calling_gemini_api"
         print(f"Gemini API processing started at {start_time}")
         # Make API request with PDF
-        response = await asyncio.to_thread(
-            model.generate_content,
+        response = await _scheduled_generate(
+            backend,
+            api_key,
+            model_name,
             contents=[
                 enhanced_prompt,
                 {"mime_type": "application/pdf", "data": pdf_data},
@@ -521,6 +614,9 @@ async def extract_text_from_pdf(
                 response_mime_type="application/json",
                 response_schema=response_schema,
             ),
+            source_bytes=pdf_data,
+            prompt=enhanced_prompt,
+            response_schema=response_schema,
         )
 
         # Calculate processing time
@@ -540,6 +636,9 @@ async def extract_text_from_pdf(
             "status_updates": status_updates,
         }
     except Exception as e:
+        if is_key_scoped_error(e):
+            # 限流/無效 key：同一把 key 的 fallback 也會失敗，交給 api_error_handler 換 key
+            raise
         # Calculate time until error
         error_time = time.time() - start_time
         status_updates["processing_time_seconds"] = error_time
@@ -553,8 +652,10 @@ async def extract_text_from_pdf(
             fallback_start = time.time()
             status_updates["step"] = "fallback_attempt"
 
-            fallback_response = await asyncio.to_thread(
-                model.generate_content,
+            fallback_response = await _scheduled_generate(
+                backend,
+                api_key,
+                model_name,
                 contents=[
                     enhanced_prompt,
                     {"mime_type": "application/pdf", "data": pdf_data},
@@ -562,6 +663,9 @@ async def extract_text_from_pdf(
                 generation_config=genai.GenerationConfig(
                     response_mime_type="application/json",
                 ),
+                source_bytes=pdf_data,
+                prompt=enhanced_prompt,
+                response_schema=None,
             )
 
             fallback_time = time.time() - fallback_start
@@ -608,6 +712,97 @@ async def extract_text_from_pdf(
             }
 
 
+async def extract_text_from_pdf(
+    pdf_path, enhanced_prompt, response_schema, api_key=None, model_name=None
+):
+    """
+    Extract text directly from PDF using Gemini API (async version with retry).
+    With timing and status tracking.
+    """
+    # Load PDF as bytes
+    with open(pdf_path, "rb") as f:
+        pdf_data = f.read()
+    return await extract_text_from_pdf_bytes(pdf_data, enhanced_prompt, response_schema, api_key, model_name)
+
+
+async def extract_text_from_pdf_chunked(
+    pdf_data, enhanced_prompt, response_schema, pages_per_chunk=0, api_key=None, model_name=None
+):
+    """
+    Split in-memory PDF bytes into page chunks, OCR them concurrently with the same
+    prompt/schema and merge the array fields back into one result.
+    Falls back to a single extract_text_from_pdf_bytes call when chunking does not apply.
+    If any chunk fails the whole document is returned as an "Error: ..." result: a merge
+    of the remaining chunks would silently drop those pages' line items.
+    """
+    # PyMuPDF 拆分是 CPU 密集操作，放到線程避免阻塞事件循環
+    chunks = await asyncio.to_thread(split_pdf_bytes, pdf_data, pages_per_chunk) if pages_per_chunk else [pdf_data]
+    if len(chunks) <= 1:
+        return await extract_text_from_pdf_bytes(pdf_data, enhanced_prompt, response_schema, api_key, model_name)
+
+    start_time = time.time()
+    semaphore = asyncio.Semaphore(max(1, int(os.getenv("OCR_PDF_CHUNK_CONCURRENCY", "4"))))
+
+    async def _ocr_chunk(chunk_bytes):
+        async with semaphore:
+            return await extract_text_from_pdf_bytes(chunk_bytes, enhanced_prompt, response_schema, api_key, model_name)
+
+    chunk_results = await asyncio.gather(*[_ocr_chunk(chunk) for chunk in chunks], return_exceptions=True)
+
+    parsed_chunks = []
+    failed_chunks = []
+    input_tokens = 0
+    output_tokens = 0
+    for index, result in enumerate(chunk_results):
+        if isinstance(result, Exception) or not isinstance(result, dict):
+            failed_chunks.append({"chunk": index, "error": str(result)})
+            continue
+        input_tokens += result.get("input_tokens") or 0
+        output_tokens += result.get("output_tokens") or 0
+        text = result.get("text") or ""
+        try:
+            if text.startswith("Error:"):
+                raise ValueError(text)
+            parsed_chunks.append(json.loads(text))
+        except (ValueError, json.JSONDecodeError) as e:
+            failed_chunks.append({"chunk": index, "error": str(e)})
+
+    total_time = time.time() - start_time
+    status_updates = {
+        "status": "failed" if failed_chunks else "success",
+        "step": "page_chunks_merged",
+        "chunks": len(chunks),
+        "pages_per_chunk": pages_per_chunk,
+        "failed_chunks": failed_chunks,
+        "processing_time_seconds": total_time,
+    }
+    logger.info(f"📄 Chunked PDF OCR: {len(chunks)} chunks, {len(failed_chunks)} failed, {total_time:.2f}s")
+
+    merged = None if failed_chunks else merge_chunk_results(parsed_chunks)
+    if merged is None:
+        if failed_chunks:
+            failed = ", ".join(str(chunk["chunk"]) for chunk in failed_chunks)
+            error = f"{len(failed_chunks)}/{len(chunks)} page chunks failed (chunks {failed}): {failed_chunks[0]['error']}"
+        else:
+            error = "no chunk results"
+        logger.error(f"❌ Chunked PDF OCR failed: {error}")
+        return {
+            "text": f"Error: {error}",
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "processing_time": total_time,
+            "status_updates": status_updates,
+        }
+
+    return {
+        "text": json.dumps(merged, ensure_ascii=False),
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "processing_time": total_time,
+        "status_updates": status_updates,
+    }
+
+
 def main():
     try:
         with open(
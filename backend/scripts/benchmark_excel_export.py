@@ -0,0 +1,146 @@
+"""Memory/time harness and differential check for the consolidated XLSX export.
+
+Compares json_to_excel (openpyxl write-only worksheet, rows streamed from the
+JSON flattener) with the previous export, copied below as a reference: a
+DataFrame written through pd.ExcelWriter, which builds the whole workbook in
+memory, then column widths from astype(str) on every column.
+
+Payloads are consolidated orders: a list of invoice documents (see
+benchmark_json_flatten) with --columns extra header fields. With more than
+about 690 the sheet goes past column ZZ, where the reference cannot name
+columns (use --legacy-max-rows 0). For doubling row counts this prints the
+time (under tracemalloc, so slower than normal) and peak traced memory of both
+paths; the payload itself is built before tracing. Cell values of both files
+are compared up to --compare-max-rows.
+
+Usage:
+  python -m scripts.benchmark_excel_export
+  python -m scripts.benchmark_excel_export --min-rows 10000 --max-rows 160000 --legacy-max-rows 40000
+  python -m scripts.benchmark_excel_export --columns 720 --legacy-max-rows 0
+
+Exits with status 1 if any cell differs or the streaming peak at the largest
+size exceeds twice the peak at the smallest.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+ITEMS_PER_DOCUMENT = 50
+
+
+def make_payload(rows: int, columns: int, seed: int) -> List[Dict[str, Any]]:
+    from scripts.benchmark_json_flatten import invoice
+
+    rng = random.Random(seed)
+    documents = []
+    for d in range(max(1, rows // ITEMS_PER_DOCUMENT)):
+        document = invoice(rng, ITEMS_PER_DOCUMENT)
+        for c in range(columns):
+            document[f"field_{c}"] = f"doc {d} value {c}" if c % 2 else rng.randint(0, 10 ** 6)
+        documents.append(document)
+    return documents
+
+
+def legacy_json_to_excel(json_data: Any, output_path: str, sheet_name: str = "Sheet1") -> str:
+    import pandas as pd
+
+    from utils.excel_converter import flatten_json_recursive
+
+    df = pd.DataFrame(flatten_json_recursive(json_data))
+    with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
+        df.to_excel(writer, sheet_name=sheet_name, index=False)
+        worksheet = writer.sheets[sheet_name]
+        worksheet.auto_filter.ref = worksheet.dimensions
+        for idx, col in enumerate(df.columns):
+            series = df[col]
+            max_len = max(series.astype(str).map(len).max(), len(str(series.name))) + 2
+            col_letter = chr(65 + idx) if idx < 26 else chr(65 + idx // 26 - 1) + chr(65 + idx % 26)
+            worksheet.column_dimensions[col_letter].width = min(max_len, 60)
+    return output_path
+
+
+def _measure(fn: Callable[[str], Any]) -> Tuple[str, float, int]:
+    handle, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(handle)
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn(path)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return path, seconds, peak
+
+
+def _read_cells(path: str) -> List[Tuple[Any, ...]]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True)
+    try:
+        return [tuple(row) for row in workbook.active.iter_rows(values_only=True)]
+    finally:
+        workbook.close()
+
+
+def _compare(path: str, legacy_path: str) -> str:
+    current, legacy = _read_cells(path), _read_cells(legacy_path)
+    if len(current) != len(legacy):
+        return f"MISMATCH: {len(current)} rows vs {len(legacy)}"
+    for number, (row, expected) in enumerate(zip(current, legacy), 1):
+        if row != expected:
+            return f"MISMATCH at row {number}"
+    return "cells identical"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark streaming vs in-memory XLSX export")
+    parser.add_argument("--min-rows", type=int, default=2000, help="Smallest row count")
+    parser.add_argument("--max-rows", type=int, default=16000, help="Largest row count (doubling from --min-rows)")
+    parser.add_argument("--legacy-max-rows", type=int, default=8000, help="Largest row count for the reference path")
+    parser.add_argument("--compare-max-rows", type=int, default=4000, help="Largest row count for the cell comparison")
+    parser.add_argument("--columns", type=int, default=40, help="Extra header fields per document")
+    parser.add_argument("--seed", type=int, default=0, help="RNG seed")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    logging.disable(logging.INFO)
+    from utils.excel_converter import json_to_excel
+
+    failures = 0
+    peaks: List[int] = []
+    rows = args.min_rows
+    print(f"{'rows':>8} {'stream':>9} {'peak':>10} {'reference':>10} {'peak':>10}  check")
+    while rows <= args.max_rows:
+        payload = make_payload(rows, args.columns, args.seed)
+        path, seconds, peak = _measure(lambda out: json_to_excel(payload, out))
+        peaks.append(peak)
+        line = f"{rows:>8,} {seconds:>8.2f}s {peak / 1e6:>8.1f}MB"
+        if rows <= args.legacy_max_rows:
+            legacy_path, legacy_seconds, legacy_peak = _measure(lambda out: legacy_json_to_excel(payload, out))
+            line += f" {legacy_seconds:>9.2f}s {legacy_peak / 1e6:>8.1f}MB"
+            if rows <= args.compare_max_rows:
+                status = _compare(path, legacy_path)
+                failures += status.startswith("MISMATCH")
+                line += f"  {status}"
+            os.unlink(legacy_path)
+        os.unlink(path)
+        print(line)
+        rows *= 2
+
+    if len(peaks) > 1 and peaks[-1] > 2 * peaks[0]:
+        failures += 1
+        print(f"streaming peak grew {peaks[-1] / peaks[0]:.1f}x  NOT FLAT")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Scaling benchmark for aggregate functions in computed-column expressions.
+
+Aggregates such as sum_matched('Amount') scan the whole DataFrame. Evaluated
+once per row (the previous DataFrame.apply path, copied below as a
+reference) they make a column O(n^2); the expression engine now hoists
+row-independent aggregates and memoizes them per column evaluation.
+
+For doubling row counts this prints the time of each path and the fitted
+scaling exponent (time ~ rows^k: k ~ 1 is linear, k ~ 2 quadratic). It covers
+one column-wise expression and one that needs per-row evaluation. The
+reference path is only run up to --legacy-max-rows; at those sizes the fixed
+pandas overhead of each aggregate call still dominates its per-row cost, so its
+exponent only approaches 2 for larger frames.
+
+Usage:
+  python -m scripts.benchmark_expression_aggregates
+  python -m scripts.benchmark_expression_aggregates --min-rows 2000 --max-rows 256000
+
+Exits with status 1 if the outputs differ or the engine scales worse than k = 1.5.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import math
+import os
+import random
+import sys
+import time
+from typing import Any, Callable, List, Tuple
+
+EXPRESSIONS = {
+    # Column-wise: share of the matched total, flag against the overall average
+    "column-wise": "{Amount} * 100 / sum_matched('Amount') if {Amount} > avg_all('Amount') else 0",
+    # Subscripts need per-row evaluation; the aggregate is still computed once
+    "per-row": "split({Service Number}, '-')[0] if {Amount} > sum_all('Amount') / count_all() else ''",
+}
+
+
+def make_orders(rows: int, seed: int):
+    import pandas as pd
+
+    rng = random.Random(seed)
+    return pd.DataFrame(
+        {
+            "Service Number": [f"{rng.randint(2000, 9999)}-{rng.randint(1000, 9999)}" for _ in range(rows)],
+            "Amount": [round(rng.uniform(1, 400), 2) for _ in range(rows)],
+            "Matched": [rng.random() < 0.9 for _ in range(rows)],
+        }
+    )
+
+
+def legacy_evaluate(engine, expression: str, df):
+    parsed = engine.parse_expression(expression)
+    return df.apply(lambda row: engine.evaluate(parsed, row.to_dict(), "", df), axis=1)
+
+
+def _timed(fn: Callable[[], Any]) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def _exponent(points: List[Tuple[int, float]]) -> float:
+    """Least-squares slope of log(time) against log(rows)."""
+    xs = [math.log(rows) for rows, _ in points]
+    ys = [math.log(max(seconds, 1e-9)) for _, seconds in points]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    denominator = sum((x - mean_x) ** 2 for x in xs)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / denominator if denominator else float("nan")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark aggregate hoisting in the expression engine")
+    parser.add_argument("--min-rows", type=int, default=1000, help="Smallest row count")
+    parser.add_argument("--max-rows", type=int, default=64000, help="Largest row count (doubling from --min-rows)")
+    parser.add_argument("--legacy-max-rows", type=int, default=8000, help="Largest row count for the reference path")
+    parser.add_argument("--seed", type=int, default=0, help="RNG seed")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    logging.disable(logging.WARNING)  # aggregates log per call on the reference path
+    import pandas as pd
+
+    from utils.expression_engine import ExpressionEngine
+
+    sizes = []
+    rows = args.min_rows
+    while rows <= args.max_rows:
+        sizes.append(rows)
+        rows *= 2
+
+    failures = 0
+    for label, expression in EXPRESSIONS.items():
+        print(f"{label}: {expression}")
+        print(f"  {'rows':>8} {'engine':>10} {'per row':>10} {'reference':>10} {'per row':>10}")
+        engine_points: List[Tuple[int, float]] = []
+        legacy_points: List[Tuple[int, float]] = []
+        for rows in sizes:
+            df = make_orders(rows, args.seed)
+            result, seconds = _timed(lambda: ExpressionEngine().evaluate_column(expression, df, ""))
+            engine_points.append((rows, seconds))
+            line = f"  {rows:>8,} {seconds * 1000:>8.1f}ms {seconds / rows * 1e6:>8.2f}us"
+            if rows <= args.legacy_max_rows:
+                expected, legacy_seconds = _timed(lambda: legacy_evaluate(ExpressionEngine(), expression, df))
+                legacy_points.append((rows, legacy_seconds))
+                line += f" {legacy_seconds * 1000:>8.1f}ms {legacy_seconds / rows * 1e6:>8.2f}us"
+                try:
+                    pd.testing.assert_series_equal(result, expected, check_names=False)
+                except AssertionError as exc:
+                    failures += 1
+                    line += f"  MISMATCH: {str(exc).splitlines()[0]}"
+            print(line)
+
+        exponent = _exponent(engine_points)
+        summary = f"  scaling exponent: engine {exponent:.2f}"
+        if len(legacy_points) > 1:
+            summary += f", reference {_exponent(legacy_points):.2f}"
+        if exponent > 1.5:
+            failures += 1
+            summary += "  NOT LINEAR"
+        print(summary)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
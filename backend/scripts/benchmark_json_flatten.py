@@ -0,0 +1,231 @@
+"""Micro-benchmark and differential check for JSON flattening.
+
+Compares the iterative flattener (utils.json_flattener, used by
+excel_converter) with the previous recursive implementations, copied below as
+references, on generated OCR-shaped payloads:
+
+  invoice    header + nested summary + N line items with nested tax objects
+  statement  accounts -> charges (nested arrays, one array per level)
+  siblings   line items + charges + payments side by side (previously a Cartesian product)
+  batch      a list of invoice documents, as consolidated order results
+
+For shapes with at most one multi-row array per level the outputs must be
+identical (records and DataFrames); for sibling arrays the row counts are
+reported (product vs stacked). Time is the best of --repeat runs; peak memory
+is measured with tracemalloc.
+
+Usage:
+  python -m scripts.benchmark_json_flatten
+  python -m scripts.benchmark_json_flatten --items 200 --siblings 60 --docs 50 --repeat 5
+
+Exits with status 1 if any identical-shape check fails.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+
+# --- Previous implementations (reference only) ---
+
+def legacy_flatten_json_recursive(data: Any, parent_key: str = "", sep: str = ".") -> List[Dict[str, Any]]:
+    flattened_records = []
+    if isinstance(data, dict):
+        simple_items = {}
+        nested_list_items = {}
+        for k, v in data.items():
+            new_key = f"{parent_key}{sep}{k}" if parent_key else k
+            if isinstance(v, list) and v and all(isinstance(i, dict) for i in v):
+                nested_list_items[new_key] = v
+            else:
+                simple_items[new_key] = v
+        if not nested_list_items:
+            flattened_records.append(simple_items)
+        else:
+            list_key, list_to_explode = list(nested_list_items.items())[0]
+            remaining_nested_lists = {k: v for i, (k, v) in enumerate(nested_list_items.items()) if i > 0}
+            for item in list_to_explode:
+                new_record_base = simple_items.copy()
+                combined_item = {**item, **remaining_nested_lists}
+                for sub_record in legacy_flatten_json_recursive(combined_item, parent_key=parent_key, sep=sep):
+                    flattened_records.append({**new_record_base, **sub_record})
+    elif isinstance(data, list):
+        for item in data:
+            flattened_records.extend(legacy_flatten_json_recursive(item, parent_key, sep))
+    return flattened_records
+
+
+def legacy_deep_flatten_json_universal(data: Any, parent_key: str = "", sep: str = ".") -> List[Dict[str, Any]]:
+    flattened_records = []
+    if isinstance(data, list):
+        for item in data:
+            flattened_records.extend(legacy_deep_flatten_json_universal(item, parent_key, sep))
+        return flattened_records
+    if not isinstance(data, dict):
+        return [{parent_key: data}] if parent_key else [{"value": data}]
+    simple_items = {}
+    expandable_items = {}
+    for k, v in data.items():
+        new_key = f"{parent_key}{sep}{k}" if parent_key else k
+        if isinstance(v, list) and v:
+            if all(isinstance(i, dict) for i in v):
+                expandable_items[new_key] = v
+            else:
+                simple_items[new_key] = v
+        elif isinstance(v, dict):
+            expandable_items[new_key] = [v]
+        else:
+            simple_items[new_key] = v
+    if not expandable_items:
+        return [simple_items]
+    first_key, first_array = list(expandable_items.items())[0]
+    remaining_expandable = {k: v for i, (k, v) in enumerate(expandable_items.items()) if i > 0}
+    for item in first_array:
+        base_record = simple_items.copy()
+        combined_item = {**item, **remaining_expandable}
+        for sub_record in legacy_deep_flatten_json_universal(combined_item, parent_key, sep):
+            flattened_records.append({**base_record, **sub_record})
+    return flattened_records
+
+
+# --- Payload generators ---
+
+def _line_item(rng: random.Random, index: int) -> Dict[str, Any]:
+    return {
+        "line_no": index + 1,
+        "service_number": f"{rng.randint(20000000, 99999999)}",
+        "description": rng.choice(["Monthly fee", "Data roaming", "IDD call", "Adjustment"]),
+        "quantity": rng.randint(1, 5),
+        "amount": round(rng.uniform(1, 500), 2),
+        "tax": {"rate": 0.05, "amount": round(rng.uniform(0, 25), 2)},
+        "tags": ["billable", "recurring"] if index % 3 else [],
+    }
+
+
+def invoice(rng: random.Random, items: int) -> Dict[str, Any]:
+    return {
+        "invoice_number": f"INV-{rng.randint(100000, 999999)}",
+        "invoice_date": "2025-10-01",
+        "vendor": {"name": "Telecom Ltd", "address": {"city": "Hong Kong", "district": "Kowloon"}},
+        "summary": {"subtotal": 1234.5, "tax": 61.7, "total": 1296.2, "currency": "HKD"},
+        "line_items": [_line_item(rng, i) for i in range(items)],
+    }
+
+
+def statement(rng: random.Random, items: int) -> Dict[str, Any]:
+    accounts = max(1, items // 10)
+    return {
+        "statement_no": "ST-001",
+        "period": {"from": "2025-09-01", "to": "2025-09-30"},
+        "accounts": [
+            {
+                "account_no": f"AC{a:04d}",
+                "holder": {"name": f"User {a}", "dept": "IT"},
+                "charges": [_line_item(rng, i) for i in range(10)],
+            }
+            for a in range(accounts)
+        ],
+    }
+
+
+def siblings(rng: random.Random, items: int) -> Dict[str, Any]:
+    doc = invoice(rng, items)
+    doc["charges"] = [{"charge_code": f"C{i}", "charge_amount": i * 1.5} for i in range(items)]
+    doc["payments"] = [{"payment_ref": f"P{i}", "paid": i * 10.0} for i in range(max(1, items // 4))]
+    return doc
+
+
+# --- Measurement ---
+
+def _measure(fn: Callable[[], Any], repeat: int) -> Tuple[Any, float, int]:
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    del result
+    gc.collect()
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark iterative vs recursive JSON flattening")
+    parser.add_argument("--items", type=int, default=100, help="Line items per invoice/statement")
+    parser.add_argument("--siblings", type=int, default=40, help="Items per sibling array")
+    parser.add_argument("--docs", type=int, default=20, help="Documents in the batch payload")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions (best is reported)")
+    parser.add_argument("--seed", type=int, default=0, help="RNG seed")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import pandas as pd
+
+    from utils.excel_converter import deep_flatten_json_universal, flatten_json_recursive
+    from utils.json_flattener import JsonFlattener
+
+    rng = random.Random(args.seed)
+    payloads = {
+        "invoice": invoice(rng, args.items),
+        "statement": statement(rng, args.items),
+        "batch": [invoice(rng, args.items // 4 or 1) for _ in range(args.docs)],
+        "siblings": siblings(rng, args.siblings),
+    }
+    pairs = [
+        ("deep_flatten_json_universal", legacy_deep_flatten_json_universal, deep_flatten_json_universal, {}),
+        ("flatten_json_recursive", legacy_flatten_json_recursive, flatten_json_recursive,
+         {"expand_objects": False, "scalar_key": None}),
+    ]
+
+    failures = 0
+    print(f"{'payload':<10} {'function':<28} {'rows old/new':>17} {'time old':>9} {'time new':>9} "
+          f"{'peak old':>10} {'peak new':>10}  check")
+    for payload_name, payload in payloads.items():
+        for func_name, legacy, current, frame_options in pairs:
+            old_rows, old_time, old_peak = _measure(lambda: legacy(payload), args.repeat)
+            new_rows, new_time, new_peak = _measure(lambda: current(payload), args.repeat)
+
+            if payload_name == "siblings":
+                status = "stacked instead of product"
+            else:
+                status = "ok"
+                try:
+                    assert new_rows == old_rows, "records differ"
+                    frame = JsonFlattener(**frame_options).frame(payload)
+                    pd.testing.assert_frame_equal(frame, pd.DataFrame(old_rows))
+                except AssertionError as exc:
+                    failures += 1
+                    status = f"MISMATCH: {str(exc).splitlines()[0]}"
+
+            print(
+                f"{payload_name:<10} {func_name:<28} {len(old_rows):>8,}/{len(new_rows):<8,} "
+                f"{old_time * 1000:>7.1f}ms {new_time * 1000:>7.1f}ms "
+                f"{old_peak / 1e6:>8.2f}MB {new_peak / 1e6:>8.2f}MB  {status}"
+            )
+
+    for payload_name, payload in payloads.items():
+        _, frame_time, frame_peak = _measure(lambda: JsonFlattener().frame(payload), args.repeat)
+        _, legacy_time, legacy_peak = _measure(
+            lambda: pd.DataFrame(legacy_deep_flatten_json_universal(payload)), args.repeat
+        )
+        print(
+            f"DataFrame {payload_name:<10} old {legacy_time * 1000:8.1f}ms {legacy_peak / 1e6:7.2f}MB | "
+            f"columnar {frame_time * 1000:8.1f}ms {frame_peak / 1e6:7.2f}MB"
+        )
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
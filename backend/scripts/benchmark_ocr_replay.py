@@ -0,0 +1,159 @@
+"""Benchmark the OCR call path offline using the replay backend.
+
+Runs synthetic orders through the OCR scheduler -> cache -> retry/key rotation ->
+backend stack with no network access, so concurrency, retry and key-scheduling
+changes can be compared reproducibly.
+
+Usage:
+  python -m scripts.benchmark_ocr_replay --requests 200 --orders 4 --concurrency 8 --keys 9 \
+      --latency lognormal:6,0.4 --rate-429 0.05 --rpm-per-key 10
+
+  # Replay recorded responses (captured earlier with OCR_BACKEND=record)
+  python -m scripts.benchmark_ocr_replay --files ./samples --replay-dir uploads/ocr_replay
+
+Notes:
+  - Fake API keys are installed unless --use-configured-keys is given.
+  - The OCR result cache is disabled so every request reaches the backend.
+  - Without --files every request gets unique synthetic bytes and a synthetic response.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+
+def _configure_environment(args: argparse.Namespace) -> None:
+    # Must run before importing main/config_loader
+    os.environ["OCR_CACHE_BACKEND"] = "off"
+    if not args.use_configured_keys:
+        for i in range(1, 10):
+            os.environ[f"GEMINI_API_KEY_{i}"] = f"replay-key-{i:02d}" if i <= args.keys else ""
+    if args.key_rpm:
+        os.environ["GEMINI_KEY_RPM"] = str(args.key_rpm)
+    if args.cooldown is not None:
+        os.environ["GEMINI_KEY_COOLDOWN_SECONDS"] = str(args.cooldown)
+
+
+def _load_inputs(args: argparse.Namespace) -> List[bytes]:
+    if args.files:
+        inputs = []
+        for name in sorted(os.listdir(args.files)):
+            path = os.path.join(args.files, name)
+            if os.path.isfile(path) and name.lower().endswith(".pdf"):
+                with open(path, "rb") as f:
+                    inputs.append(f.read())
+        if not inputs:
+            raise SystemExit(f"No PDF files found in {args.files}")
+        return [inputs[i % len(inputs)] for i in range(args.requests)]
+    return [f"%PDF-replay-{i}".encode("utf-8") for i in range(args.requests)]
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+async def _run(args: argparse.Namespace) -> Dict[str, Any]:
+    from config_loader import get_api_key_manager
+    from main import extract_text_from_pdf_bytes
+    from utils.ocr_backend import ReplayBackend, set_ocr_backend
+    from utils.ocr_scheduler import OcrScheduler, ocr_order, set_ocr_scheduler
+
+    backend = ReplayBackend(
+        replay_dir=args.replay_dir,
+        latency=args.latency,
+        rate_429=args.rate_429,
+        timeout_rate=args.timeout_rate,
+        timeout_seconds=args.timeout_seconds,
+        rpm_per_key=args.rpm_per_key,
+        seed=args.seed,
+    )
+    set_ocr_backend(backend)
+    # Every model call (including schema-less fallbacks) takes a slot from the call scheduler
+    scheduler = OcrScheduler(args.concurrency, args.max_per_order)
+    set_ocr_scheduler(scheduler)
+
+    prompt = args.prompt
+    schema = json.loads(args.schema) if args.schema else {"type": "object"}
+    inputs = _load_inputs(args)
+    latencies: List[float] = []
+    outcomes = {"success": 0, "error_text": 0, "exception": 0}
+
+    async def _one(data: bytes) -> None:
+        start = time.monotonic()
+        try:
+            result = await extract_text_from_pdf_bytes(data, prompt, schema)
+            text = (result or {}).get("text") or ""
+            outcomes["error_text" if text.startswith("Error:") else "success"] += 1
+        except Exception:
+            outcomes["exception"] += 1
+        finally:
+            latencies.append(time.monotonic() - start)
+
+    orders = max(1, args.orders)
+    per_order: Dict[int, List[tuple]] = {order_id: [] for order_id in range(1, orders + 1)}
+    for i, data in enumerate(inputs):
+        per_order[(i % orders) + 1].append((data,))
+
+    async def _order(order_id: int, units: List[tuple]) -> None:
+        with ocr_order(order_id):
+            await asyncio.gather(*[_one(*unit) for unit in units])
+
+    wall_start = time.monotonic()
+    await asyncio.gather(*[_order(order_id, units) for order_id, units in per_order.items()])
+    wall = time.monotonic() - wall_start
+
+    return {
+        "requests": len(inputs),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(inputs) / wall, 3) if wall else 0.0,
+        "latency_p50": round(_percentile(latencies, 50), 3),
+        "latency_p95": round(_percentile(latencies, 95), 3),
+        "latency_p99": round(_percentile(latencies, 99), 3),
+        "latency_mean": round(statistics.mean(latencies), 3) if latencies else 0.0,
+        "outcomes": outcomes,
+        "backend": backend.get_stats(),
+        "scheduler": scheduler.get_stats(),
+        "keys": get_api_key_manager().get_usage_stats(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the OCR pipeline offline with the replay backend")
+    parser.add_argument("--requests", type=int, default=100, help="Number of OCR requests")
+    parser.add_argument("--orders", type=int, default=1, help="Spread requests across this many orders")
+    parser.add_argument("--concurrency", type=int, default=8, help="Scheduler max concurrency")
+    parser.add_argument("--max-per-order", type=int, default=0, help="Scheduler per-order cap (0 = none)")
+    parser.add_argument("--keys", type=int, default=9, help="Number of fake API keys (1-9)")
+    parser.add_argument("--use-configured-keys", action="store_true", help="Use keys from the environment instead")
+    parser.add_argument("--key-rpm", type=int, default=0, help="Override GEMINI_KEY_RPM for the key scheduler")
+    parser.add_argument("--cooldown", type=float, default=None, help="Override GEMINI_KEY_COOLDOWN_SECONDS")
+    parser.add_argument("--latency", default="lognormal:6,0.4", help="Latency distribution spec")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Injected 429 probability per call")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Injected timeout probability per call")
+    parser.add_argument("--timeout-seconds", type=float, default=30.0, help="Latency of an injected timeout")
+    parser.add_argument("--rpm-per-key", type=int, default=0, help="Emulated per-key RPM limit (0 = off)")
+    parser.add_argument("--seed", type=int, default=0, help="RNG seed")
+    parser.add_argument("--files", default=None, help="Directory of sample PDFs to replay")
+    parser.add_argument("--replay-dir", default=os.path.join("uploads", "ocr_replay"), help="Recordings directory")
+    parser.add_argument("--prompt", default="Extract all fields as JSON.", help="Prompt used for every request")
+    parser.add_argument("--schema", default=None, help="JSON schema used for every request")
+    args = parser.parse_args()
+
+    _configure_environment(args)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    report = asyncio.run(_run(args))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
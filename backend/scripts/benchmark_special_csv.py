@@ -0,0 +1,230 @@
+"""Time/memory harness and differential check for special CSV generation.
+
+Runs SpecialCsvGenerator.generate_special_csv on a synthetic mapped order
+DataFrame (optionally widened with filler columns) and a representative
+template extended with chained computed columns. The current single-pass
+generator is compared with the previous assembly, copied below as a
+reference: after each computed column the growing result was joined back with
+pd.concat([standard_df, result_df]). The reference is run with both
+expression evaluators:
+
+  row apply + concat    the original generator (DataFrame.apply per row)
+  column-wise + concat  column-wise expression evaluation, previous assembly
+  single pass           current generator (plan, narrow frames, one output frame)
+
+Time is the best of --repeat runs; peak memory is measured with tracemalloc in
+a separate run. All outputs must be identical.
+
+Usage:
+  python -m scripts.benchmark_special_csv
+  python -m scripts.benchmark_special_csv --rows 50000 --computed 40 --extra-columns 40
+
+Exits with status 1 if any output differs.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Tuple
+
+BASE_TEMPLATE: Dict[str, Any] = {
+    "template_name": "benchmark",
+    "version": "1",
+    "column_order": [
+        "Service Number",
+        "Description",
+        "Cost Center",
+        "Amount",
+        "Amount incl. Tax",
+        "Total",
+        "High Value",
+        "Area Code",
+        "Dial String",
+        "Period",
+        "Status",
+        "Prefix",
+    ],
+    "column_definitions": {
+        "Service Number": {"type": "source", "source_column": "Service Number"},
+        "Description": {"type": "computed", "expression": "concat({Item}, ' - ', upper({Service Type}))"},
+        "Cost Center": {"type": "computed", "expression": "if({Department}, {Department}, 'UNASSIGNED')"},
+        "Amount": {"type": "source", "source_column": "Amount"},
+        "Amount incl. Tax": {"type": "computed", "expression": "{Amount} * 1.05"},
+        "Total": {"type": "computed", "expression": "{Amount incl. Tax} + {Surcharge}"},
+        "High Value": {"type": "computed", "expression": "{Total} > 100"},
+        "Area Code": {"type": "computed", "expression": "substring({Service Number}, 0, 4)"},
+        "Dial String": {"type": "computed", "expression": "replace(trim({Service Number}), '-', '')"},
+        "Period": {"type": "constant", "value": "2025-10"},
+        "Status": {"type": "computed", "expression": "'OK' if {Amount} >= 0 else 'CREDIT'"},
+        # Subscripts have no column-wise form: evaluated row by row with the cached AST
+        "Prefix": {"type": "computed", "expression": "split({Service Number}, '-')[0]"},
+    },
+}
+
+
+def make_template(extra_computed: int) -> Dict[str, Any]:
+    """Base template plus chained computed columns that read earlier template columns."""
+    template = {
+        **BASE_TEMPLATE,
+        "column_order": list(BASE_TEMPLATE["column_order"]),
+        "column_definitions": dict(BASE_TEMPLATE["column_definitions"]),
+    }
+    previous = "Total"
+    for i in range(extra_computed):
+        name = f"Calc {i}"
+        if i % 3 == 0:
+            expression = f"{{{previous}}} * 1.01 + {{Surcharge}}"
+        elif i % 3 == 1:
+            expression = f"concat({{Cost Center}}, '/', {{{previous}}})"
+        else:
+            expression = f"if({{Amount}} > {i}, {{Amount}} - {i}, 0)"
+        template["column_order"].append(name)
+        template["column_definitions"][name] = {"type": "computed", "expression": expression}
+        previous = name
+    return template
+
+
+def make_orders(rows: int, extra_columns: int, seed: int):
+    import pandas as pd
+
+    rng = random.Random(seed)
+    departments = ["IT", "HR", "Finance", "Sales", None]
+    data = {
+        "Service Number": [f"{rng.randint(2000, 9999)}-{rng.randint(1000, 9999)}" for _ in range(rows)],
+        "Item": [rng.choice(["Monthly fee", "IDD call", "Data roaming"]) for _ in range(rows)],
+        "Service Type": [rng.choice(["mobile", "fixed", "data"]) for _ in range(rows)],
+        "Department": [rng.choice(departments) for _ in range(rows)],
+        "Amount": [round(rng.uniform(-20, 400), 2) for _ in range(rows)],
+        "Surcharge": [rng.choice([0.0, 1.5, 3.0]) for _ in range(rows)],
+        "Matched": [rng.random() < 0.9 for _ in range(rows)],
+    }
+    # Mapped order files carry many OCR/master columns the template never reads
+    for j in range(extra_columns):
+        data[f"Extra {j}"] = [f"value {rng.randint(0, 999)}" for _ in range(rows)]
+    return pd.DataFrame(data)
+
+
+def legacy_generate_special_csv(engine, standard_df, template_config: Dict[str, Any], row_apply: bool):
+    """Previous assembly: computed columns see pd.concat([standard_df, result_df]) rebuilt per column."""
+    import pandas as pd
+
+    def evaluate(df, expression, default_value, column_name):
+        if row_apply:
+            parsed = engine.parse_expression(expression)
+
+            def _compute(row):
+                try:
+                    return engine.evaluate(parsed, row.to_dict(), default_value, df)
+                except Exception as exc:
+                    raise ValueError(f"Failed to evaluate expression for column '{column_name}': {exc}") from exc
+
+            series = df.apply(_compute, axis=1)
+        else:
+            series = engine.evaluate_column(expression, df, default_value)
+        return series.fillna(default_value) if default_value is not None else series
+
+    column_order = template_config["column_order"]
+    column_definitions = template_config["column_definitions"]
+    matched_mask = standard_df["Matched"].astype(bool) if "Matched" in standard_df.columns else None
+    use_matched_logic = matched_mask is not None and 0 < matched_mask.sum() < len(matched_mask)
+
+    result_df = pd.DataFrame(index=standard_df.index)
+    for column_name in column_order:
+        definition = column_definitions[column_name]
+        column_type = definition.get("type")
+        default_value = definition.get("default_value", "")
+        if column_type == "source":
+            result_df[column_name] = standard_df[definition["source_column"]]
+        elif column_type == "computed":
+            merged_df = pd.concat([standard_df, result_df], axis=1)
+            if use_matched_logic:
+                computed_values = pd.Series(index=standard_df.index, data=default_value)
+                computed_values[matched_mask] = evaluate(
+                    merged_df[matched_mask], definition["expression"], default_value, column_name
+                )
+                result_df[column_name] = computed_values
+            else:
+                result_df[column_name] = evaluate(merged_df, definition["expression"], default_value, column_name)
+        else:
+            result_df[column_name] = definition.get("value", default_value)
+        if default_value is not None:
+            result_df[column_name] = result_df[column_name].fillna(default_value)
+    return result_df[column_order]
+
+
+def _measure(fn: Callable[[], Any], repeat: int) -> Tuple[Any, float, int]:
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        result = None
+        gc.collect()
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    result = None
+    gc.collect()
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark special CSV generation")
+    parser.add_argument("--rows", type=int, default=10000, help="Rows in the mapped order DataFrame")
+    parser.add_argument("--computed", type=int, default=30, help="Chained computed columns added to the template")
+    parser.add_argument("--extra-columns", type=int, default=30, help="Filler columns added to the mapped DataFrame")
+    parser.add_argument("--apply-max-rows", type=int, default=10000, help="Largest row count for the row-apply reference")
+    parser.add_argument("--repeat", type=int, default=1, help="Timing repetitions (best is reported)")
+    parser.add_argument("--seed", type=int, default=0, help="RNG seed")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    logging.disable(logging.INFO)  # per-column diagnostics are not part of the measurement
+    import pandas as pd
+
+    from utils.expression_engine import ExpressionEngine
+    from utils.special_csv_generator import SpecialCsvGenerator
+
+    orders = make_orders(args.rows, args.extra_columns, args.seed)
+    template = make_template(args.computed)
+    computed = sum(1 for d in template["column_definitions"].values() if d["type"] == "computed")
+    input_mb = orders.memory_usage(deep=True).sum() / 1e6
+    print(f"{args.rows:,} rows x {orders.shape[1]} mapped columns ({input_mb:.1f} MB), "
+          f"{len(template['column_order'])} output columns ({computed} computed)")
+
+    variants = []
+    if args.rows <= args.apply_max_rows:
+        variants.append(("row apply + concat",
+                         lambda: legacy_generate_special_csv(ExpressionEngine(), orders, template, row_apply=True)))
+    variants.append(("column-wise + concat",
+                     lambda: legacy_generate_special_csv(ExpressionEngine(), orders, template, row_apply=False)))
+    variants.append(("single pass", lambda: SpecialCsvGenerator().generate_special_csv(orders, template)))
+
+    results = {}
+    for label, run in variants:
+        results[label], seconds, peak = _measure(run, args.repeat)
+        print(f"  {label:<22} {seconds:8.2f}s  peak {peak / 1e6:8.1f} MB")
+
+    current = results["single pass"]
+    failures = 0
+    for label, result in results.items():
+        try:
+            pd.testing.assert_frame_equal(current, result)
+        except AssertionError as exc:
+            failures += 1
+            print(f"MISMATCH vs {label}: {str(exc).splitlines()[0]}")
+    if not failures:
+        print("outputs identical")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Check that a job keeps its lease while a pipeline step blocks the event loop.
+
+Runs against a throwaway SQLite database (DATABASE_URL is overridden). A job is
+claimed with a short lease, then a coroutine blocks the event loop with a
+synchronous sleep well past the lease length, like a large consolidated export.
+
+- Without a LeaseKeeper, a second worker reclaims the job (the failure mode).
+- With a LeaseKeeper, the second worker gets nothing and the first worker can
+  still complete the job.
+
+Usage:
+  python -m scripts.check_job_lease
+  python -m scripts.check_job_lease --lease 3 --block 8
+
+Exits with status 1 if the lease is lost while the LeaseKeeper runs.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Lease retention across a blocked event loop")
+    parser.add_argument("--lease", type=int, default=3, help="Lease length in seconds")
+    parser.add_argument("--block", type=float, default=8.0, help="Seconds the event loop is blocked")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="job_lease_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'jobs.db')}"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from sqlalchemy.orm import Session
+
+    from db.database import engine
+    from db.models import OrderJobType
+    from utils.job_queue import LeaseKeeper, claim_next_job, complete_job, enqueue_order_job
+
+    def run(keep_lease: bool) -> bool:
+        """Block the loop while holding a job; True if the first worker still owns it afterwards."""
+        with Session(engine) as db:
+            enqueue_order_job(db, order_id=1, job_type=OrderJobType.PROCESS_ORDER)
+        job = claim_next_job("worker-a", lease=args.lease)
+        assert job is not None, "job was not claimed"
+
+        async def blocking_step() -> None:
+            time.sleep(args.block)  # Synchronous work inside a coroutine, e.g. json_to_excel
+
+        async def execute() -> None:
+            keeper = LeaseKeeper(job.job_id, "worker-a", args.lease, lambda: None).start() if keep_lease else None
+            try:
+                await blocking_step()
+            finally:
+                if keeper:
+                    await asyncio.to_thread(keeper.stop)
+
+        asyncio.run(execute())
+        stolen = claim_next_job("worker-b", lease=args.lease)
+        owned = stolen is None and complete_job(job.job_id, "worker-a")
+        if stolen is not None:
+            complete_job(stolen.job_id, "worker-b")
+        return owned
+
+    without = run(keep_lease=False)
+    with_keeper = run(keep_lease=True)
+    print(f"lease={args.lease}s, loop blocked {args.block}s")
+    print(f"  without LeaseKeeper: {'kept' if without else 'lost (reclaimed by another worker)'}")
+    print(f"  with LeaseKeeper:    {'kept' if with_keeper else 'LOST'}")
+    sys.exit(0 if with_keeper else 1)
+
+
+if __name__ == "__main__":
+    main()
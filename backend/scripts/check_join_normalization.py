@@ -0,0 +1,105 @@
+"""Differential check and timing for join-key normalization.
+
+Compares utils.join_normalization.normalize_join_series (fused, per distinct
+value) with normalize_join_series_rowwise (the original per-transform .apply
+implementation) on generated keys that exercise full-width digits, invisible
+and unicode whitespace, case folding edge cases, signs, NaN/None and numbers,
+for every join_normalize option combination used by mapping configs.
+
+Usage:
+  python -m scripts.check_join_normalization                   # 20k rows, all configs
+  python -m scripts.check_join_normalization --rows 200000 --distinct 0.9
+
+Exits with status 1 if any configuration produces a different result.
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+SAMPLES = [
+    "12345", " 00123 ", "１２３４５", "A-12 34", "-42", "+7", "ab cd", "x​y", "　全角　",
+    "İstanbul", "ß", "ǅ", "Ⅻ", "ﬁle", "tab\tsep", "line sep", "\u0085nel", "", "nan", "None",
+    "TELECOM", "telecom ", "Tele­com", "٣٤٥", "9" * 12, "混合 Mixed　Case",
+]
+
+
+def _values(rows: int, distinct: float, seed: int) -> List[Any]:
+    rng = random.Random(seed)
+    pool_size = max(len(SAMPLES), int(rows * distinct))
+    pool: List[Any] = list(SAMPLES)
+    while len(pool) < pool_size:
+        base = rng.choice(SAMPLES)
+        pool.append(f"{base}{rng.randint(0, 10 ** 6)}" if rng.random() < 0.7 else rng.randint(0, 10 ** 6))
+    pool.extend([None, float("nan"), 12.0, 7])
+    return [rng.choice(pool) for _ in range(rows)]
+
+
+def _configs() -> List[Dict[str, Any]]:
+    flags = ["strip_non_digits", "strip_invisible", "nfkc", "normalize_ws", "lower"]
+    configs: List[Dict[str, Any]] = [{}]
+    for n in range(1, len(flags) + 1):
+        for combo in itertools.combinations(flags, n):
+            configs.append({flag: True for flag in combo})
+    configs.append({"zfill": 8})
+    configs.append({"zfill": {"key": 6}, "strip_non_digits": True})
+    configs.append({"zfill": {"key": "bad"}, "strip_non_digits": True})
+    configs.append({"nfkc": True, "normalize_ws": True, "lower": True, "value_alias_map": {"telecom": "TEL"}})
+    configs.append({"lower": True, "value_alias_map": {"key": {"12345": "canonical"}}})
+    configs.append({"strip_non_digits": True, "aliases": {"12345": 12345, "7": 7}})
+    configs.append({"strip_invisible": True, "nfkc": True, "normalize_ws": True, "lower": True, "zfill": 10})
+    return configs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Differential check of fused vs row-wise join normalization")
+    parser.add_argument("--rows", type=int, default=20000, help="Rows per generated column")
+    parser.add_argument("--distinct", type=float, default=0.5, help="Fraction of distinct values (0-1)")
+    parser.add_argument("--seed", type=int, default=0, help="RNG seed")
+    parser.add_argument("--timing-only", action="store_true", help="Only time the full configuration")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import pandas as pd
+
+    from utils.join_normalization import normalize_join_series, normalize_join_series_rowwise
+
+    series = pd.Series(_values(args.rows, args.distinct, args.seed), name="key")
+    configs = _configs()
+    if args.timing_only:
+        configs = configs[-1:]
+
+    failures = 0
+    total_reference = total_fused = 0.0
+    for config in configs:
+        start = time.perf_counter()
+        expected = normalize_join_series_rowwise(series, config, "key")
+        reference_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        actual = normalize_join_series(series, config, "key")
+        fused_seconds = time.perf_counter() - start
+        total_reference += reference_seconds
+        total_fused += fused_seconds
+
+        try:
+            pd.testing.assert_series_equal(actual, expected)
+            status = "ok"
+        except AssertionError as exc:
+            failures += 1
+            status = f"MISMATCH: {str(exc).splitlines()[0]}"
+        print(f"{reference_seconds:8.3f}s {fused_seconds:8.3f}s  {config}  {status}")
+
+    print(
+        f"\n{len(configs)} configs, {args.rows:,} rows: row-wise {total_reference:.2f}s, "
+        f"fused {total_fused:.2f}s ({total_reference / total_fused if total_fused else 0:.1f}x), failures={failures}"
+    )
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Round-trip check for cached mapped frames (incremental remap reuse).
+
+A remap reuses an item's stored mapped frame when its input fingerprint is
+unchanged, so the frame read back by read_parquet_sidecar must equal the one
+given to frame_to_parquet. This writes and reads frames shaped like mapped OCR
+output: typed columns, NaN/None gaps (read back as NaN), a merged master
+column, and columns mixing numbers and formatted strings (common in flattened
+OCR JSON), which Parquet cannot store directly.
+
+Usage:
+  python -m scripts.check_mapped_frame_roundtrip
+
+Exits with status 1 if any frame is not stored or does not round-trip.
+"""
+from __future__ import annotations
+
+import os
+import sys
+from typing import Any, Dict
+
+
+def _frames() -> Dict[str, Any]:
+    import numpy as np
+    import pandas as pd
+
+    base = {
+        "invoice_no": ["INV-1", "INV-2", np.nan, "INV-4"],
+        "line": [1, 2, 3, 4],
+        "amount": [12.5, np.nan, 3.0, 7.25],
+        "Department": ["IT", "HR", np.nan, "Ops"],
+    }
+    mixed = dict(base, total=[1234, "1,234.00", np.nan, 12.5], qty=["3", 3, True, np.nan])
+    return {
+        "typed": pd.DataFrame(base),
+        "mixed": pd.DataFrame(mixed),
+        "int_and_str": pd.DataFrame({"total": pd.Series([1, "1", np.nan], dtype=object)}),
+        "empty": pd.DataFrame({"total": pd.Series([], dtype=object)}),
+    }
+
+
+def main() -> None:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import pandas as pd
+
+    from utils.master_file_loader import PARQUET_AVAILABLE, frame_to_parquet, read_parquet_sidecar
+
+    if not PARQUET_AVAILABLE:
+        print("pyarrow is not installed; mapped frames cannot be cached")
+        sys.exit(1)
+
+    failures = 0
+    for name, frame in _frames().items():
+        content = frame_to_parquet(frame)
+        if content is None:
+            failures += 1
+            print(f"{name:18s} NOT STORED")
+            continue
+        restored = read_parquet_sidecar(content)
+        try:
+            pd.testing.assert_frame_equal(restored, frame, check_dtype=False)
+            # Values must keep their own types (1234 must not come back as "1234")
+            for col in frame.columns[frame.dtypes == object]:
+                expected = [type(v) for v in frame[col] if not pd.isna(v)]
+                actual = [type(v) for v in restored[col] if not pd.isna(v)]
+                assert expected == actual, f"{col}: value types {actual} != {expected}"
+            status = "ok"
+        except AssertionError as exc:
+            failures += 1
+            status = f"MISMATCH: {str(exc).splitlines()[0]}"
+        print(f"{name:18s} {len(content):8,} bytes  {status}")
+
+    print(f"\nfailures={failures}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Differential check and timing for MatchingEngine.match_many.
+
+Compares match_many(values, candidates) with the nested loop it replaces: for
+each value, smart_match against every candidate in order, keeping the first
+success. Values and candidates are generated to exercise exact, contains,
+split (compound identifiers), fuzzy and regex matches, case folding, short
+values, numbers and NaN/None, for several MatchingConfig combinations.
+
+Usage:
+  python -m scripts.check_match_many                        # 400 values x 300 candidates
+  python -m scripts.check_match_many --values 2000 --candidates 1000
+
+Exits with status 1 if any configuration produces a different result.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Any, List
+
+WORDS = ["Telecom", "IT", "HR", "Ops", "Finance", "Legal", "Sales", "Marketing", "R&D", "Facilities"]
+
+
+def _candidates(count: int, rng: random.Random) -> List[Any]:
+    pool: List[Any] = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.4:
+            pool.append(f"{rng.randint(10 ** 5, 10 ** 8)}")
+        elif kind < 0.7:
+            pool.append(f"{rng.choice(WORDS)} {rng.randint(1, 999)}")
+        elif kind < 0.9:
+            pool.append(f"ACC-{rng.randint(100, 9999)}/{rng.choice(WORDS)}")
+        else:
+            pool.append(rng.choice(WORDS))
+    pool.extend(["ab", "", None, 12345, "TELECOM"])
+    return pool
+
+
+def _values(count: int, candidates: List[Any], rng: random.Random) -> List[Any]:
+    values: List[Any] = []
+    strings = [c for c in candidates if isinstance(c, str) and c]
+    for _ in range(count):
+        base = rng.choice(strings)
+        kind = rng.random()
+        if kind < 0.2:
+            values.append(base)
+        elif kind < 0.35:
+            values.append(f"  {base.upper()} ")
+        elif kind < 0.5:
+            values.append(f"INV {base} / {rng.choice(strings)}")  # Compound field
+        elif kind < 0.6:
+            values.append(base[1:-1] if len(base) > 4 else base)  # Contained in a candidate
+        elif kind < 0.75:
+            chars = list(base)
+            chars[rng.randrange(len(chars))] = rng.choice("xyz0")  # Typo for fuzzy
+            values.append("".join(chars))
+        elif kind < 0.85:
+            values.append(f"{rng.randint(10 ** 5, 10 ** 8)}")  # Usually unmatched
+        else:
+            values.append(rng.choice([None, float("nan"), 12345, 12345.0, True, "ab", "", "hr"]))
+    return values
+
+
+def _configs(MatchingConfig, MatchingStrategy) -> List[Any]:
+    smart = [MatchingStrategy.EXACT, MatchingStrategy.CONTAINS, MatchingStrategy.SPLIT, MatchingStrategy.FUZZY]
+    return [
+        MatchingConfig(strategies=[MatchingStrategy.EXACT]),
+        MatchingConfig(strategies=[MatchingStrategy.CONTAINS]),
+        MatchingConfig(strategies=[MatchingStrategy.SPLIT]),
+        MatchingConfig(strategies=[MatchingStrategy.FUZZY], fuzzy_threshold=0.75),
+        MatchingConfig(strategies=smart),
+        MatchingConfig(strategies=smart, case_sensitive=True, min_match_length=2),
+        MatchingConfig(strategies=smart, min_match_length=0, fuzzy_threshold=0.9),
+        MatchingConfig(
+            strategies=smart + [MatchingStrategy.REGEX],
+            priority_order=[MatchingStrategy.REGEX] + smart,
+            regex_patterns={"account": r"(\d{3,})"},
+        ),
+        MatchingConfig(
+            strategies=[MatchingStrategy.REGEX, MatchingStrategy.EXACT],
+            priority_order=[MatchingStrategy.REGEX, MatchingStrategy.EXACT],
+            regex_patterns={"account": r"[A-Z]{2,}"},
+        ),
+    ]
+
+
+def _reference(engine, values: List[Any], candidates: List[Any], field_name: str) -> List[Any]:
+    results = []
+    for value in values:
+        for candidate in candidates:
+            result = engine.smart_match(value, candidate, field_name)
+            if result.success:
+                results.append(result)
+                break
+        else:
+            results.append(None)
+    return results
+
+
+def _same(actual, expected) -> bool:
+    if expected is None:
+        return not actual.success and actual.mapping_value == ""
+    return actual == expected
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Differential check of match_many vs pairwise smart_match")
+    parser.add_argument("--values", type=int, default=400, help="Values per column")
+    parser.add_argument("--candidates", type=int, default=300, help="Candidate list length")
+    parser.add_argument("--seed", type=int, default=0, help="RNG seed")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from utils.order_processor import MatchingConfig, MatchingEngine, MatchingStrategy
+
+    rng = random.Random(args.seed)
+    candidates = _candidates(args.candidates, rng)
+    values = _values(args.values, candidates, rng)
+
+    failures = 0
+    total_reference = total_batch = 0.0
+    for config in _configs(MatchingConfig, MatchingStrategy):
+        engine = MatchingEngine(config)
+        start = time.perf_counter()
+        expected = _reference(engine, values, candidates, "account")
+        reference_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        actual = engine.match_many(values, candidates, "account")
+        batch_seconds = time.perf_counter() - start
+        total_reference += reference_seconds
+        total_batch += batch_seconds
+
+        mismatches = [i for i, (a, e) in enumerate(zip(actual, expected)) if not _same(a, e)]
+        if len(actual) != len(values):
+            mismatches.append(-1)
+        matched = sum(1 for result in expected if result is not None)
+        status = "ok" if not mismatches else f"MISMATCH at {mismatches[:5]} (value {values[mismatches[0]]!r})"
+        failures += bool(mismatches)
+        strategies = "+".join(s.value for s in config.priority_order if s in config.strategies)
+        print(f"{reference_seconds:8.3f}s {batch_seconds:8.3f}s  {strategies:28s} matched={matched:4d}  {status}")
+
+    print(
+        f"\n{args.values:,} values x {len(candidates):,} candidates: pairwise {total_reference:.2f}s, "
+        f"match_many {total_batch:.2f}s ({total_reference / total_batch if total_batch else 0:.1f}x), failures={failures}"
+    )
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,9 +5,9 @@ from datetime import datetime
 from io import BytesIO
 
 import pandas as pd
-from difflib import SequenceMatcher
 
 from utils.s3_storage import S3StorageManager
+from utils.fuzzy_index import FuzzyIndex
 from utils.excel_converter import json_to_excel, json_to_csv
 from main import extract_text_from_pdf
 from db.models import File, BatchJob, Company
@@ -231,6 +231,8 @@ class AWBProcessor:
         try:
             # Create summary lookup
             summary_map = {item.get('order_number'): item.get('charge') for item in summary_results}
+            # Build the employee name index once for all detail records
+            name_index = self._build_name_index(employee_map)
 
             for detail in detail_results:
                 order_num = detail.get('order_number')
@@ -244,7 +246,8 @@ class AWBProcessor:
                 # Layer 3: Department matching
                 department, dept_matched, confidence, matched_name = self._match_department(
                     colleague,
-                    employee_map
+                    employee_map,
+                    name_index
                 )
 
                 enriched_record = {
@@ -266,10 +269,19 @@ class AWBProcessor:
             logger.error(f"❌ Error in 3-layer matching: {str(e)}")
             return []
 
+    @staticmethod
+    def _build_name_index(employee_map: Dict[str, str]) -> FuzzyIndex:
+        """Case-insensitive fuzzy index over employee names (non-string names are skipped)"""
+        return FuzzyIndex(
+            list(employee_map.keys()),
+            normalize=lambda name: name.lower() if isinstance(name, str) else None,
+        )
+
     def _match_department(
         self,
         colleague_name: str,
-        employee_map: Dict[str, str]
+        employee_map: Dict[str, str],
+        name_index: Optional[FuzzyIndex] = None
     ) -> Tuple[Optional[str], bool, float, Optional[str]]:
         """Match colleague name to department
 
@@ -282,18 +294,13 @@ class AWBProcessor:
         if colleague_name in employee_map:
             return employee_map[colleague_name], True, 1.0, colleague_name
 
-        # Fuzzy match
-        best_match = None
-        best_score = 0.0
-
-        for emp_name in employee_map.keys():
-            similarity = SequenceMatcher(None, colleague_name.lower(), emp_name.lower()).ratio()
-
-            if similarity > best_score:
-                best_score = similarity
-                best_match = emp_name
-
-        if best_score >= self.fuzzy_threshold and best_match:
+        # Fuzzy match: best SequenceMatcher ratio over all names, earliest name on ties
+        if name_index is None:
+            name_index = self._build_name_index(employee_map)
+        best = name_index.best(colleague_name, self.fuzzy_threshold)
+        if best:
+            position, best_score = best
+            best_match = name_index.candidates[position]
             return employee_map[best_match], True, best_score, best_match
 
         # No match
@@ -3,7 +3,17 @@ import json
 import os
 import logging
 import itertools
-from typing import Dict, List, Any, Union, Tuple
+import datetime
+import math
+import numbers
+from typing import Dict, List, Any, Iterable, Optional, Union, Tuple
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+from openpyxl.utils import get_column_letter
+
+from utils.json_flattener import JsonFlattener
 
 # --- 日誌設定 (Setup Logging) ---
 # 建立一個 logger，用於在程式執行時輸出資訊
@@ -17,81 +27,22 @@ def flatten_json_recursive(
     data: Any, parent_key: str = "", sep: str = "."
 ) -> List[Dict[str, Any]]:
     """
-    遞迴地將複雜的巢狀 JSON (字典和列表) 轉換為扁平化的記錄列表。
+    將複雜的巢狀 JSON (字典和列表) 轉換為扁平化的記錄列表。
     每一筆記錄都代表 Excel 中的一列。
 
+    只展開「字典組成的列表」；巢狀字典保留為儲存格值。由 JsonFlattener 迭代處理，
+    同層的多個列表會依序堆疊而不再產生笛卡爾積。
+
     Args:
         data (Any): 要處理的 JSON 資料 (可以是字典或列表)。
-        parent_key (str): 用於追蹤巢狀結構的父鍵。
+        parent_key (str): 加在所有欄位名稱前的前綴。
         sep (str): 用於連接父鍵和子鍵的分隔符。
 
     Returns:
         List[Dict[str, Any]]: 一個扁平化的字典列表，準備好轉換為 DataFrame。
     """
-
-    # 用於存放最終扁平化結果的列表
-    flattened_records = []
-
-    # --- 情況 1: 輸入的資料是字典 (dict) ---
-    if isinstance(data, dict):
-        # 將字典中的鍵值對分為兩類：
-        # 1. simple_items: 值是簡單類型 (字串、數字等) 的項目
-        # 2. nested_list_items: 值是列表 (list) 的項目，這部分需要展開
-        simple_items = {}
-        nested_list_items = {}
-
-        for k, v in data.items():
-            # 建立新的鍵名，例如 'statement_details.number'
-            new_key = f"{parent_key}{sep}{k}" if parent_key else k
-
-            # 如果值是列表且包含字典，則視為需要展開的巢狀列表
-            if isinstance(v, list) and v and all(isinstance(i, dict) for i in v):
-                nested_list_items[new_key] = v
-            # 否則，視為簡單的鍵值對
-            else:
-                simple_items[new_key] = v
-
-        # 如果沒有需要展開的巢狀列表
-        if not nested_list_items:
-            flattened_records.append(simple_items)
-        else:
-            # 這是核心的「展開」邏輯
-            # 取得第一個需要展開的列表
-            list_key, list_to_explode = list(nested_list_items.items())[0]
-
-            # 取得其他尚未處理的巢狀列表
-            remaining_nested_lists = {
-                k: v for i, (k, v) in enumerate(nested_list_items.items()) if i > 0
-            }
-
-            # 遍歷要展開的列表中的每一個項目
-            for item in list_to_explode:
-                # 建立一個新的基礎記錄，包含父層級的簡單鍵值對
-                new_record_base = simple_items.copy()
-
-                # 將列表中的項目 (它本身是一個字典) 與剩餘的巢狀列表合併
-                # 這樣可以遞迴地處理多層巢狀列表
-                combined_item = {**item, **remaining_nested_lists}
-
-                # 遞迴呼叫函式，處理這個合併後的項目
-                # 將父層級的鍵名傳入，以維持正確的層級關係
-                # 例如，處理 'charge_description' 時，父鍵是 'statement_details'
-                sub_records = flatten_json_recursive(
-                    combined_item, parent_key=parent_key, sep=sep
-                )
-
-                # 將父層級的簡單資料，與遞迴展開後的子記錄合併
-                for sub_record in sub_records:
-                    final_record = {**new_record_base, **sub_record}
-                    flattened_records.append(final_record)
-
-    # --- 情況 2: 輸入的資料是列表 (list) ---
-    elif isinstance(data, list):
-        # 如果是列表，則遍歷其中的每一個項目，並分別進行遞迴處理
-        for item in data:
-            flattened_records.extend(flatten_json_recursive(item, parent_key, sep))
-
-    return flattened_records
+    flattener = JsonFlattener(expand_objects=False, sep=sep, scalar_key=None)
+    return _prefix_keys(flattener.records(data), parent_key, sep)
 
 
 def sanitize_sheet_name(name: str) -> str:
@@ -116,61 +67,145 @@ def sanitize_sheet_name(name: str) -> str:
     return sanitized[:31]
 
 
+# --- Excel 串流輸出設定 ---
+# 欄寬只依前 N 筆記錄估算，不再對每個欄位做 astype(str)
+COLUMN_WIDTH_SAMPLE_ROWS = 1000
+MAX_COLUMN_WIDTH = 60
+# Excel 工作表上限 (含標題列)
+EXCEL_MAX_ROWS = 1048576
+EXCEL_MAX_COLUMNS = 16384
+
+# 與 pandas to_excel 相同的標題樣式
+_HEADER_FONT = Font(bold=True)
+_HEADER_BORDER = Border(
+    left=Side(style="thin"), right=Side(style="thin"), top=Side(style="thin"), bottom=Side(style="thin")
+)
+_HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="top")
+
+
+def _excel_cell_value(value: Any) -> Any:
+    """將扁平化後的值轉為儲存格值 (與 pandas to_excel 相同：缺值為空白，巢狀值轉為字串)。"""
+    if value is None or isinstance(value, (str, bool)):
+        return value
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real):
+        value = float(value)
+        if math.isnan(value):
+            return None
+        if math.isinf(value):
+            return "inf" if value > 0 else "-inf"
+        return value
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value
+    return str(value)
+
+
+def _scan_columns(
+    flattener: JsonFlattener, json_data: Any, sample_rows: int
+) -> Tuple[Dict[str, int], Dict[str, int], int]:
+    """
+    第一次走訪：取得欄位順序、以前 sample_rows 筆估算的欄寬，以及總筆數。
+    只保留每個欄位的名稱與寬度，記憶體與筆數無關。
+    """
+    positions: Dict[str, int] = {}
+    widths: Dict[str, int] = {}
+    total = 0
+    for rows in flattener.iter_document_rows(json_data):
+        for row in rows:
+            sampled = total < sample_rows
+            total += 1
+            for fragment in row:
+                for name in fragment:
+                    if name not in positions:
+                        positions[name] = len(positions)
+                if sampled:
+                    for name, value in fragment.items():
+                        value = _excel_cell_value(value)
+                        width = len(str(value)) if value is not None else 0
+                        if width > widths.get(name, 0):
+                            widths[name] = width
+    return positions, widths, total
+
+
 def json_to_excel(
-    json_data: Union[Dict, List], output_path: str, doc_type_code: str = "Sheet1"
+    json_data: Union[Dict, List],
+    output_path: str,
+    doc_type_code: str = "Sheet1",
+    row_axes: Optional[Iterable[str]] = None,
 ) -> str:
     """
     將 JSON 資料轉換為極度扁平化的 Excel 檔案。
 
+    以 openpyxl 的 write-only 工作表逐列串流寫入：不建立 DataFrame，也不在記憶體中
+    保留整本活頁簿，記憶體用量不隨筆數增加。扁平化規則與 flatten_json_recursive 相同；
+    JSON 會走訪兩次 (先取得欄位與欄寬，再寫入資料列)。
+
     Args:
         json_data (Union[Dict, List]): 輸入的 JSON 資料。
         output_path (str): Excel 檔案的儲存路徑。
         doc_type_code (str): Excel 工作表的名稱。
+        row_axes: 要展開為列的陣列路徑 (以點分隔，可由 row_axes_from_schema 從 OCR schema 取得)；
+            None 表示展開所有字典組成的列表。
 
     Returns:
         str: 輸出檔案的路徑。
     """
     logger.info("開始將 JSON 轉換為扁平化記錄...")
 
-    # 呼叫核心遞迴函式，將 JSON 轉換為扁平化的字典列表
-    flattened_data = flatten_json_recursive(json_data)
+    flattener = JsonFlattener(row_axes=row_axes, expand_objects=False, scalar_key=None)
+    positions, widths, total = _scan_columns(flattener, json_data, COLUMN_WIDTH_SAMPLE_ROWS)
 
-    if not flattened_data:
+    empty = total == 0 or not positions
+    if empty:
         logger.warning("在 JSON 中找不到可處理的資料，將建立一個空的 Excel 檔案。")
-        df = pd.DataFrame({"Message": ["No data found in the JSON input."]})
+        message = "No data found in the JSON input."
+        positions, widths, total = {"Message": 0}, {"Message": len(message)}, 1
     else:
-        # 將扁平化的記錄列表轉換為 pandas DataFrame
-        df = pd.DataFrame(flattened_data)
-        logger.info(f"資料轉換完成，共產生 {len(df)} 筆記錄。")
+        logger.info(f"資料轉換完成，共產生 {total} 筆記錄。")
 
-    # --- 將 DataFrame 寫入 Excel 檔案 ---
-    try:
-        with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
-            sheet_name = sanitize_sheet_name(doc_type_code)
-            logger.info(f"正在寫入資料到工作表: '{sheet_name}'...")
-
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
-
-            # --- 自動調整欄位寬度與套用篩選 ---
-            worksheet = writer.sheets[sheet_name]
-            worksheet.auto_filter.ref = worksheet.dimensions
-
-            for idx, col in enumerate(df.columns):
-                series = df[col]
-                max_len = (
-                    max(series.astype(str).map(len).max(), len(str(series.name))) + 2
-                )
-
-                # 將欄位索引轉換為字母 (A, B, C...)
-                col_letter = (
-                    chr(65 + idx)
-                    if idx < 26
-                    else chr(65 + idx // 26 - 1) + chr(65 + idx % 26)
-                )
-                worksheet.column_dimensions[col_letter].width = min(
-                    max_len, 60
-                )  # 寬度上限為 60
+    if total + 1 > EXCEL_MAX_ROWS or len(positions) > EXCEL_MAX_COLUMNS:
+        raise ValueError(
+            f"This sheet is too large! Your sheet size is: {total + 1}, {len(positions)} "
+            f"Max sheet size is: {EXCEL_MAX_ROWS}, {EXCEL_MAX_COLUMNS}"
+        )
 
+    # --- 以串流方式寫入 Excel 檔案 ---
+    try:
+        workbook = Workbook(write_only=True)
+        sheet_name = sanitize_sheet_name(doc_type_code)
+        worksheet = workbook.create_sheet(title=sheet_name)
+        logger.info(f"正在寫入資料到工作表: '{sheet_name}'...")
+
+        # write-only 工作表的欄寬與篩選範圍必須在寫入資料列之前設定
+        # 欄位字母由 get_column_letter 產生 (支援 ZZ 之後的 AAA、AAB...)
+        for name, idx in positions.items():
+            width = max(widths.get(name, 0), len(str(name))) + 2
+            worksheet.column_dimensions[get_column_letter(idx + 1)].width = min(width, MAX_COLUMN_WIDTH)
+        worksheet.auto_filter.ref = f"A1:{get_column_letter(len(positions))}{total + 1}"
+
+        header = []
+        for name in positions:
+            cell = WriteOnlyCell(worksheet, value=str(name))
+            cell.font = _HEADER_FONT
+            cell.border = _HEADER_BORDER
+            cell.alignment = _HEADER_ALIGNMENT
+            header.append(cell)
+        worksheet.append(header)
+
+        if empty:
+            worksheet.append([message])
+        else:
+            width = len(positions)
+            for rows in flattener.iter_document_rows(json_data):
+                for row in rows:
+                    values: List[Any] = [None] * width
+                    for fragment in row:
+                        for name, value in fragment.items():
+                            values[positions[name]] = value  # 後面的片段優先，與 dict.update 相同
+                    worksheet.append([_excel_cell_value(value) for value in values])
+
+        workbook.save(output_path)
         logger.info(f"成功建立 Excel 檔案: {output_path}")
 
     except Exception as e:
@@ -278,77 +313,20 @@ def generate_array_combinations(arrays_info: List[Tuple[str, List]]) -> List[Dic
 def deep_flatten_json_universal(data: Any, parent_key: str = "", sep: str = ".") -> List[Dict[str, Any]]:
     """
     通用深度扁平化函式，將任何巢狀 JSON 結構完全展開到最深層級。
-    
-    這個函式會遞迴地展開所有陣列，確保每一行代表最深層級的一個項目。
-    與原始演算法不同的是，這個版本會持續深入到最深層級。
-    
+
+    每一行代表最深層級的一個項目；巢狀字典展開為欄位 (欄位名稱為葉節點鍵名)。
+    同層的多個陣列依序堆疊，每個陣列元素只出現在一行，不再產生笛卡爾積。
+
     Args:
         data: 輸入的 JSON 資料
-        parent_key: 父級鍵名（用於維持層次結構）
+        parent_key: 加在所有欄位名稱前的前綴
         sep: 路徑分隔符
-        
+
     Returns:
         完全扁平化的記錄列表
     """
-    flattened_records = []
-    
-    # 如果輸入是陣列，遞迴處理每個項目
-    if isinstance(data, list):
-        for item in data:
-            flattened_records.extend(deep_flatten_json_universal(item, parent_key, sep))
-        return flattened_records
-    
-    # 如果不是字典，直接返回原始值
-    if not isinstance(data, dict):
-        return [{parent_key: data}] if parent_key else [{"value": data}]
-    
-    # 分離簡單值和需要展開的項目
-    simple_items = {}
-    expandable_items = {}
-    
-    for k, v in data.items():
-        new_key = f"{parent_key}{sep}{k}" if parent_key else k
-        
-        if isinstance(v, list) and v:
-            # 檢查是否為包含字典的陣列（需要展開的陣列）
-            if all(isinstance(i, dict) for i in v):
-                expandable_items[new_key] = v
-            else:
-                # 包含原始值的陣列，直接當作簡單值處理
-                simple_items[new_key] = v
-        elif isinstance(v, dict):
-            # 嵌套字典，展開其內容
-            expandable_items[new_key] = [v]  # 將字典包裝成單項目陣列，方便統一處理
-        else:
-            # 原始值
-            simple_items[new_key] = v
-    
-    # 如果沒有需要展開的項目，返回簡單值
-    if not expandable_items:
-        return [simple_items]
-    
-    # 處理展開邏輯 - 類似原始演算法，但確保到達最深層級
-    # 選擇第一個需要展開的項目
-    first_key, first_array = list(expandable_items.items())[0]
-    remaining_expandable = {k: v for i, (k, v) in enumerate(expandable_items.items()) if i > 0}
-    
-    # 為第一個陣列的每個項目建立記錄
-    for item in first_array:
-        # 建立基礎記錄（包含簡單值）
-        base_record = simple_items.copy()
-        
-        # 將目前項目與剩餘的展開項目結合
-        combined_item = {**item, **remaining_expandable}
-        
-        # 遞迴處理結合後的項目
-        sub_records = deep_flatten_json_universal(combined_item, parent_key, sep)
-        
-        # 將基礎記錄與子記錄結合
-        for sub_record in sub_records:
-            final_record = {**base_record, **sub_record}
-            flattened_records.append(final_record)
-    
-    return flattened_records
+    records = JsonFlattener(sep=sep).records(data)
+    return _prefix_keys(records, parent_key, sep)
 
 
 def ultra_deep_flatten_json(data: Any, parent_key: str = "", sep: str = ".", max_depth: int = 20) -> List[Dict[str, Any]]:
@@ -357,6 +335,9 @@ def ultra_deep_flatten_json(data: Any, parent_key: str = "", sep: str = ".", max
     
     This function ensures EVERY nested object and array is completely flattened with 
     full path traceability in column names.
+
+    Not built on JsonFlattener: its column names (items[0].sku, tags_list, *_empty_list,
+    *_empty_dict) and sibling-array product are the established output of this mode.
     
     Args:
         data: Input JSON data
@@ -448,8 +429,17 @@ def ultra_deep_flatten_json(data: Any, parent_key: str = "", sep: str = ".", max
     return flattened_records
 
 
+def _prefix_keys(records: List[Dict[str, Any]], parent_key: str, sep: str) -> List[Dict[str, Any]]:
+    if not parent_key:
+        return records
+    return [{f"{parent_key}{sep}{key}": value for key, value in record.items()} for record in records]
+
+
 def json_to_csv(
-    json_data: Union[Dict, List], output_path: str, doc_type_code: str = "data"
+    json_data: Union[Dict, List],
+    output_path: str,
+    doc_type_code: str = "data",
+    row_axes: Optional[Iterable[str]] = None,
 ) -> str:
     """
     將 JSON 資料轉換為完全扁平化的 CSV 檔案。
@@ -458,21 +448,20 @@ def json_to_csv(
         json_data: 輸入的 JSON 資料
         output_path: CSV 檔案的儲存路徑
         doc_type_code: 用於日誌的文件類型代碼
+        row_axes: 要展開為列的陣列路徑 (見 json_to_excel)；None 表示全部展開
         
     Returns:
         輸出檔案的路徑
     """
     logger.info("開始將 JSON 轉換為深度扁平化 CSV...")
     
-    # 使用新的通用深度扁平化函式
-    flattened_data = deep_flatten_json_universal(json_data)
+    # 與 deep_flatten_json_universal 相同的扁平化規則，直接以欄位緩衝區建立 DataFrame
+    df = JsonFlattener(row_axes=row_axes).frame(json_data)
     
-    if not flattened_data:
+    if len(df) == 0:
         logger.warning("在 JSON 中找不到可處理的資料，將建立一個空的 CSV 檔案。")
         df = pd.DataFrame({"Message": ["No data found in the JSON input."]})
     else:
-        # 將扁平化的記錄列表轉換為 pandas DataFrame
-        df = pd.DataFrame(flattened_data)
         logger.info(f"資料轉換完成，共產生 {len(df)} 筆記錄，{len(df.columns)} 個欄位。")
         logger.info(f"欄位名稱: {list(df.columns)}")
     
@@ -505,15 +494,14 @@ def json_to_csv_ultra_flat(
     """
     logger.info("開始將 JSON 轉換為極度扁平化 CSV (Ultra-flat mode)...")
     
-    # 使用極度扁平化函式
+    # 呼叫 ultra_deep_flatten_json 進行扁平化 (保留原有欄位命名：[i] 索引、_list/_empty_* 標記)
     flattened_data = ultra_deep_flatten_json(json_data)
+    df = pd.DataFrame(flattened_data)
     
-    if not flattened_data:
+    if len(df) == 0:
         logger.warning("在 JSON 中找不到可處理的資料，將建立一個空的 CSV 檔案。")
         df = pd.DataFrame({"Message": ["No data found in the JSON input."]})
     else:
-        # 將扁平化的記錄列表轉換為 pandas DataFrame
-        df = pd.DataFrame(flattened_data)
         logger.info(f"極度扁平化完成，共產生 {len(df)} 筆記錄，{len(df.columns)} 個欄位。")
         logger.info(f"前15個欄位名稱: {list(df.columns)[:15]}")
         
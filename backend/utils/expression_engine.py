@@ -1,18 +1,41 @@
-"""Expression evaluation utilities for computed template columns."""
+"""Expression evaluation utilities for computed template columns.
+
+Expressions are parsed once per engine into an AST. ``evaluate_column`` runs a
+compiled expression over whole DataFrame columns (pandas/NumPy operations)
+when every node has a column-wise equivalent with the same per-row result,
+and otherwise evaluates the cached AST row by row with a single SimpleEval
+instance. Only the whitelisted functions below are available in either mode.
+
+Aggregate calls with constant arguments (e.g. ``sum_matched('Amount')``) do
+not depend on the row; they are detected at compile time, evaluated once per
+column evaluation and memoized per (function, arguments), so expressions
+using them stay linear in the row count.
+"""
 
 from __future__ import annotations
 
+import ast
+import functools
 import logging
+import operator
 import re
 from dataclasses import dataclass
-from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
 
+import numpy as np
+import pandas as pd
+import simpleeval
 from simpleeval import SimpleEval
 
 from .template_service import extract_expression_variables
 
 logger = logging.getLogger(__name__)
 
+# Functions over the whole DataFrame context; their result depends only on their arguments
+AGGREGATE_FUNCTIONS = frozenset(
+    {"sum_matched", "count_matched", "avg_matched", "sum_all", "count_all", "avg_all"}
+)
+
 
 @dataclass
 class ParsedExpression:
@@ -23,6 +46,23 @@ class ParsedExpression:
     variables: List[str]
 
 
+@dataclass
+class CompiledExpression:
+    """A parsed expression with its AST and, when available, a column-wise evaluator."""
+
+    parsed: ParsedExpression
+    tree: ast.AST
+    column_evaluator: Optional[Callable[["_ColumnScope"], Any]] = None
+    # Row-independent aggregate calls as (function, arguments), in expression order
+    aggregates: Tuple[Tuple[str, Tuple[Any, ...]], ...] = ()
+    # Columns the expression can read (references, aggregate columns, Matched); None = any column
+    columns: Optional[Tuple[Any, ...]] = None
+
+    @property
+    def vectorized(self) -> bool:
+        return self.column_evaluator is not None
+
+
 class ExpressionEngine:
     """Safe expression evaluator with template-specific helpers."""
 
@@ -51,6 +91,8 @@ class ExpressionEngine:
         # Track logging state per DataFrame context to avoid noisy repeats
         self._last_df_id: Optional[int] = None
         self._no_matched_logged_once: bool = False
+        # Compiled expressions keyed by processed expression text
+        self._compiled: Dict[str, CompiledExpression] = {}
 
     # ------------------------------------------------------------------
     # Public API
@@ -77,17 +119,105 @@ class ExpressionEngine:
 
         return ParsedExpression(original=expr_string, expression=processed, variables=variables)
 
+    def compile_expression(self, expression: Union[str, ParsedExpression, CompiledExpression]) -> CompiledExpression:
+        """Parse an expression to an AST once and compile its column-wise evaluator.
+
+        A CompiledExpression (e.g. from a cached template plan) is returned as is;
+        it holds no engine state and can be shared between engines.
+        """
+
+        if isinstance(expression, CompiledExpression):
+            return expression
+        parsed = self.parse_expression(expression) if isinstance(expression, str) else expression
+        compiled = self._compiled.get(parsed.expression)
+        if compiled is None:
+            tree = SimpleEval.parse(parsed.expression)
+            try:
+                column_evaluator = _compile_columnwise(tree)
+            except _NotVectorizable as exc:
+                logger.debug(f"Expression '{parsed.original}' will be evaluated row by row: {exc}")
+                column_evaluator = None
+            compiled = CompiledExpression(
+                parsed=parsed,
+                tree=tree,
+                column_evaluator=column_evaluator,
+                aggregates=_row_independent_aggregates(tree),
+                columns=_referenced_columns(tree),
+            )
+            self._compiled[parsed.expression] = compiled
+        return compiled
+
+    def evaluate_column(
+        self,
+        expression: Union[str, ParsedExpression, CompiledExpression],
+        dataframe: pd.DataFrame,
+        default_value: Optional[Any] = None,
+        dataframe_context: Optional[Any] = None,
+        row_dtype: Optional[Any] = None,
+    ) -> pd.Series:
+        """Evaluate an expression for every row of a DataFrame.
+
+        Each row sees the same values as a ``dataframe.apply(axis=1)`` row. The
+        column-wise evaluator is used when the expression compiled and its
+        operands behave exactly like per-row Python (e.g. no division by zero,
+        no nulls in object columns); otherwise rows are evaluated one by one.
+        Aggregate functions use ``dataframe_context`` (default: ``dataframe``)
+        and are computed at most once per (function, arguments) in this call.
+
+        ``dataframe`` may hold only ``CompiledExpression.columns`` of a wider
+        frame; ``row_dtype`` is then that frame's row dtype (object unless all of
+        its columns are numeric), so values are upcast as in the wider frame.
+        """
+
+        compiled = self.compile_expression(expression)
+        if dataframe_context is None:
+            dataframe_context = dataframe
+        self._set_dataframe_context(dataframe_context)
+        aggregates = self._memoized_aggregates()
+
+        if len(dataframe):
+            # Hoist row-independent aggregates: evaluated once, before any row
+            for name, args in compiled.aggregates:
+                try:
+                    aggregates[name](*args)
+                except Exception:
+                    pass  # e.g. a malformed call in an untaken branch; it fails where the row uses it
+
+        if compiled.column_evaluator is not None and len(dataframe):
+            try:
+                scope = _ColumnScope(dataframe, default_value, aggregates, row_dtype)
+                return scope.evaluate(compiled.column_evaluator)
+            except Exception as exc:
+                logger.debug(f"Expression '{compiled.parsed.original}' falls back to row evaluation: {exc}")
+
+        return self._evaluate_rows(compiled, dataframe, default_value, aggregates, row_dtype)
+
     def evaluate(
         self,
-        expression: Union[str, ParsedExpression],
+        expression: Union[str, ParsedExpression, CompiledExpression],
         context: Dict[str, Any],
         default_value: Optional[Any] = None,
         dataframe_context: Optional[Any] = None,
     ) -> Any:
         """Evaluate an expression against the provided context."""
 
-        parsed = self.parse_expression(expression) if isinstance(expression, str) else expression
+        compiled = self.compile_expression(expression)
+        self._set_dataframe_context(dataframe_context)
+        evaluator = self._row_evaluator(lambda column_name: context.get(column_name, default_value))
+        return evaluator.eval(compiled.parsed.expression, previously_parsed=compiled.tree)
 
+    def evaluate_with_context(  # pragma: no cover - convenience wrapper
+        self, expression: str, context: Dict[str, Any], default_value: Optional[Any] = None
+    ) -> Any:
+        """Backward-compatible helper to evaluate raw expressions."""
+
+        parsed = self.parse_expression(expression)
+        return self.evaluate(parsed, context, default_value=default_value)
+
+    # ------------------------------------------------------------------
+    # Row evaluation
+    # ------------------------------------------------------------------
+    def _set_dataframe_context(self, dataframe_context: Optional[Any]) -> None:
         # Set DataFrame context for aggregate functions and reset one-shot log flag per DF
         self._current_dataframe = dataframe_context
         try:
@@ -98,22 +228,59 @@ class ExpressionEngine:
             self._last_df_id = df_id
             self._no_matched_logged_once = False
 
+    def _row_evaluator(
+        self, getter: Callable[[str], Any], functions: Optional[Dict[str, Callable[..., Any]]] = None
+    ) -> SimpleEval:
         evaluator = SimpleEval()
         evaluator.names = {}
-        evaluator.functions = {
-            **self._base_functions,
-            "__get__": lambda column_name: context.get(column_name, default_value),
-        }
+        evaluator.functions = {**self._base_functions, **(functions or {}), "__get__": getter}
+        return evaluator
 
-        return evaluator.eval(parsed.expression)
+    def _memoized_aggregates(self) -> Dict[str, Callable[..., Any]]:
+        """Aggregate functions memoized per (function, arguments) for one column evaluation.
 
-    def evaluate_with_context(  # pragma: no cover - convenience wrapper
-        self, expression: str, context: Dict[str, Any], default_value: Optional[Any] = None
-    ) -> Any:
-        """Backward-compatible helper to evaluate raw expressions."""
+        The DataFrame context is fixed for the evaluation, so the column and the
+        Matched filter implied by the function name determine the result.
+        """
+        memo: Dict[Tuple[str, Tuple[Any, ...]], Any] = {}
 
-        parsed = self.parse_expression(expression)
-        return self.evaluate(parsed, context, default_value=default_value)
+        def memoized(name: str, function: Callable[..., Any]) -> Callable[..., Any]:
+            def aggregate(*args: Any) -> Any:
+                key = (name, args)
+                try:
+                    return memo[key]
+                except KeyError:
+                    result = memo[key] = function(*args)
+                    return result
+                except TypeError:  # unhashable arguments
+                    return function(*args)
+
+            return aggregate
+
+        return {name: memoized(name, self._base_functions[name]) for name in AGGREGATE_FUNCTIONS}
+
+    def _evaluate_rows(
+        self,
+        compiled: CompiledExpression,
+        dataframe: pd.DataFrame,
+        default_value: Optional[Any],
+        aggregates: Dict[str, Callable[..., Any]],
+        row_dtype: Optional[Any] = None,
+    ) -> pd.Series:
+        """Evaluate the cached AST once per row with a single evaluator (DataFrame context already set)."""
+
+        context: Dict[str, Any] = {}
+        evaluator = self._row_evaluator(lambda column_name: context.get(column_name, default_value), aggregates)
+        columns = list(dataframe.columns)
+        expression = compiled.parsed.expression
+
+        results = []
+        # to_numpy() rows carry the same values (and dtype upcasting) as DataFrame.apply(axis=1) rows
+        for values in dataframe.to_numpy(dtype=row_dtype).tolist():
+            context.clear()
+            context.update(zip(columns, values))
+            results.append(evaluator.eval(expression, previously_parsed=compiled.tree))
+        return pd.Series(results, index=dataframe.index)
 
     # ------------------------------------------------------------------
     # Built-in functions
@@ -287,3 +454,354 @@ class ExpressionEngine:
             return float(values.mean()) if len(values) else 0.0
         except (KeyError, ValueError, TypeError):
             return 0.0
+
+
+# ----------------------------------------------------------------------
+# Column-wise compilation
+# ----------------------------------------------------------------------
+class _NotVectorizable(Exception):
+    """The expression (or an operand at run time) needs per-row evaluation."""
+
+
+_ARITHMETIC_OPERATORS: Dict[type, Callable[[Any, Any], Any]] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+}
+_DIVISION_OPERATORS = (ast.Div, ast.FloorDiv, ast.Mod)
+_COMPARISON_OPERATORS: Dict[type, Callable[[Any, Any], Any]] = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+_TEXT_METHODS: Dict[str, Callable[[str], str]] = {
+    "upper": str.upper,
+    "lower": str.lower,
+    "trim": str.strip,
+    "strip": str.strip,
+}
+
+
+class _ColumnScope:
+    """Columns of one DataFrame as row evaluation would see them."""
+
+    def __init__(
+        self,
+        dataframe: pd.DataFrame,
+        default_value: Optional[Any],
+        aggregates: Dict[str, Callable[..., Any]],
+        row_dtype: Optional[Any] = None,
+    ) -> None:
+        self.dataframe = dataframe
+        self.index = dataframe.index
+        self.default_value = default_value
+        self.aggregates = aggregates
+        # Later duplicate columns win, as in a row dict
+        self._positions = {name: position for position, name in enumerate(dataframe.columns)}
+        # apply(axis=1) upcasts all-numeric frames to one dtype per row; object otherwise
+        self._row_dtype = np.dtype(row_dtype) if row_dtype is not None else row_dtype_of(dataframe)
+        self._columns: Dict[Any, pd.Series] = {}
+
+    def column(self, name: str) -> Any:
+        position = self._positions.get(name)
+        if position is None:
+            return self.default_value
+        series = self._columns.get(name)
+        if series is None:
+            series = self.dataframe.iloc[:, position]
+            if self._row_dtype != object:
+                series = series.astype(self._row_dtype, copy=False)
+            if not isinstance(series.dtype, np.dtype) or series.dtype.kind not in "biufO":
+                raise _NotVectorizable(f"column '{name}' has dtype {series.dtype}")
+            self._columns[name] = series
+        return series
+
+    def full(self, value: Any) -> np.ndarray:
+        values = np.empty(len(self.index), dtype=object)
+        values[:] = [value] * len(self.index)
+        return values
+
+    def evaluate(self, column_evaluator: Callable[["_ColumnScope"], Any]) -> pd.Series:
+        value = column_evaluator(self)
+        if not isinstance(value, pd.Series):
+            return pd.Series([value] * len(self.index), index=self.index)
+        if value.dtype == object:
+            # Same dtype inference as a Series built from per-row results
+            return pd.Series(value.tolist(), index=self.index)
+        return value.rename(None)
+
+
+def row_dtype_of(dataframe: pd.DataFrame) -> np.dtype:
+    """Dtype of DataFrame.apply(axis=1) rows: the common dtype of all columns (object if mixed)."""
+    return dataframe.iloc[:0].to_numpy().dtype
+
+
+def _compile_columnwise(node: ast.AST) -> Callable[[_ColumnScope], Any]:
+    """Compile an AST into a function of a _ColumnScope returning a Series or a scalar.
+
+    Raises _NotVectorizable for nodes without an exact column-wise equivalent.
+    """
+    if isinstance(node, ast.Expr):
+        return _compile_columnwise(node.value)
+
+    if isinstance(node, ast.Constant):
+        value = node.value
+        return lambda scope: value
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _ARITHMETIC_OPERATORS:
+        left, right = _compile_columnwise(node.left), _compile_columnwise(node.right)
+        op_type = type(node.op)
+        return lambda scope: _arithmetic(op_type, left(scope), right(scope))
+
+    if isinstance(node, ast.Compare) and all(type(op) in _COMPARISON_OPERATORS for op in node.ops):
+        operands = [_compile_columnwise(operand) for operand in [node.left, *node.comparators]]
+        ops = [_COMPARISON_OPERATORS[type(op)] for op in node.ops]
+        return lambda scope: _compare_chain(ops, [operand(scope) for operand in operands], scope)
+
+    if isinstance(node, ast.BoolOp):
+        values = [_compile_columnwise(value) for value in node.values]
+        is_and = isinstance(node.op, ast.And)
+        return lambda scope: _bool_op(is_and, [value(scope) for value in values], scope)
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Not, ast.USub, ast.UAdd)):
+        operand = _compile_columnwise(node.operand)
+        op_type = type(node.op)
+        return lambda scope: _unary(op_type, operand(scope))
+
+    if isinstance(node, ast.IfExp):
+        test, body, orelse = (_compile_columnwise(part) for part in (node.test, node.body, node.orelse))
+        return lambda scope: _select(_truthy(test(scope)), body(scope), orelse(scope), scope)
+
+    if isinstance(node, ast.Call):
+        return _compile_call(node)
+
+    raise _NotVectorizable(f"unsupported syntax {type(node).__name__}")
+
+
+def _compile_call(node: ast.Call) -> Callable[[_ColumnScope], Any]:
+    if not isinstance(node.func, ast.Name) or node.keywords:
+        raise _NotVectorizable("unsupported call")
+    name = node.func.id
+    if any(isinstance(arg, ast.Starred) for arg in node.args):
+        raise _NotVectorizable("unsupported call")
+
+    if name == "__get__":
+        if len(node.args) != 1 or not isinstance(node.args[0], ast.Constant):
+            raise _NotVectorizable("dynamic column reference")
+        column_name = node.args[0].value
+        return lambda scope: scope.column(column_name)
+
+    if name in AGGREGATE_FUNCTIONS:
+        if not all(isinstance(arg, ast.Constant) for arg in node.args):
+            raise _NotVectorizable(f"{name}() with row-dependent arguments")
+        values = tuple(arg.value for arg in node.args)
+        return lambda scope: scope.aggregates[name](*values)
+
+    args = [_compile_columnwise(arg) for arg in node.args]
+
+    if name == "concat":
+        return lambda scope: functools.reduce(operator.add, (_text(arg(scope)) for arg in args), "")
+    if name in _TEXT_METHODS and len(args) == 1:
+        method = _TEXT_METHODS[name]
+        return lambda scope: _text_map(args[0](scope), method)
+    if name == "replace" and len(args) == 3:
+        return lambda scope: _replace(*(arg(scope) for arg in args))
+    if name == "substring" and len(args) in (2, 3):
+        return lambda scope: _substring(*(arg(scope) for arg in args))
+    if name in ("if", "iif") and len(args) == 3:
+        return lambda scope: _select(_truthy(args[0](scope)), args[1](scope), args[2](scope), scope)
+
+    raise _NotVectorizable(f"function '{name}' has no column-wise form")
+
+
+def _row_independent_aggregates(tree: ast.AST) -> Tuple[Tuple[str, Tuple[Any, ...]], ...]:
+    """Aggregate calls whose arguments are all constants, as (function, arguments)."""
+    found: List[Tuple[str, Tuple[Any, ...]]] = []
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id in AGGREGATE_FUNCTIONS
+            and not node.keywords
+            and all(isinstance(arg, ast.Constant) for arg in node.args)
+        ):
+            found.append((node.func.id, tuple(arg.value for arg in node.args)))
+    return tuple(dict.fromkeys(found))
+
+
+def _referenced_columns(tree: ast.AST) -> Optional[Tuple[Any, ...]]:
+    """Columns an expression can read, or None when a reference is computed at run time."""
+    columns: List[Any] = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Name):
+            continue
+        name = node.func.id
+        if name != "__get__" and name not in AGGREGATE_FUNCTIONS:
+            continue
+        if node.keywords or not all(isinstance(arg, ast.Constant) for arg in node.args):
+            return None
+        if name in AGGREGATE_FUNCTIONS:
+            columns.append("Matched")
+        columns.extend(arg.value for arg in node.args)
+    return tuple(dict.fromkeys(columns))
+
+
+def _is_series(value: Any) -> bool:
+    return isinstance(value, pd.Series)
+
+
+def _has_nulls(value: Any) -> bool:
+    if _is_series(value):
+        return bool(value.isna().any())
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def _is_object(value: Any) -> bool:
+    return _is_series(value) and value.dtype == object
+
+
+def _require_exact_operand(value: Any) -> None:
+    """Reject operands whose pandas semantics differ from per-row Python."""
+    if value is None:
+        raise _NotVectorizable("None operand")
+    # pandas skips nulls in object columns where Python would raise or compare differently
+    if _is_object(value) and value.isna().any():
+        raise _NotVectorizable("nulls in object column")
+
+
+def _require_exact_pair(left: Any, right: Any) -> None:
+    _require_exact_operand(left)
+    _require_exact_operand(right)
+    # NaN against an object column: pandas propagates NaN where Python raises (e.g. "a" + nan)
+    if (_is_object(left) and _has_nulls(right)) or (_is_object(right) and _has_nulls(left)):
+        raise _NotVectorizable("nulls combined with object column")
+
+
+def _arithmetic(op_type: type, left: Any, right: Any) -> Any:
+    if not _is_series(left) and not _is_series(right):
+        # SimpleEval's own operators, including its length limits on string/list + and *
+        return simpleeval.DEFAULT_OPERATORS[op_type](left, right)
+    op = _ARITHMETIC_OPERATORS[op_type]
+    _require_exact_pair(left, right)
+    for value in (left, right):
+        if _is_series(value) and value.dtype == bool:
+            raise _NotVectorizable("arithmetic on boolean column")
+    if op_type is ast.Mult:
+        # Sequence repetition is bounded per row by SimpleEval's MAX_STRING_LENGTH; only numbers multiply here
+        for value in (left, right):
+            if _is_object(value) or not (_is_series(value) or isinstance(value, (int, float))):
+                raise _NotVectorizable("sequence repetition")
+        return left * right
+    if op_type is ast.Add and (_is_object(left) or _is_object(right)):
+        result = left + right
+        limit = simpleeval.MAX_STRING_LENGTH
+        if any(hasattr(item, "__len__") and len(item) > limit for item in result.tolist()):
+            raise _NotVectorizable("result longer than MAX_STRING_LENGTH")
+        return result
+    if op_type in _DIVISION_OPERATORS:
+        if op_type is ast.Mod and (isinstance(left, str) or (_is_series(left) and left.dtype == object)):
+            raise _NotVectorizable("string formatting")
+        # Python raises ZeroDivisionError where NumPy returns inf/nan
+        if (right == 0).any() if _is_series(right) else right == 0:
+            raise _NotVectorizable("division by zero")
+    return op(left, right)
+
+
+def _compare_chain(ops: List[Callable[[Any, Any], Any]], operands: List[Any], scope: _ColumnScope) -> Any:
+    result: Any = True
+    for op, left, right in zip(ops, operands, operands[1:]):
+        if _is_series(left) or _is_series(right):
+            _require_exact_pair(left, right)
+        value = op(left, right)
+        result = value if result is True else (result & value)
+    return result
+
+
+def _truthy(value: Any) -> Any:
+    if not _is_series(value):
+        return bool(value)
+    if value.dtype == bool:
+        return value
+    if value.dtype == object:
+        return value.map(bool).astype(bool)
+    return value != 0  # NaN is truthy, as in Python
+
+
+def _select(condition: Any, if_true: Any, if_false: Any, scope: _ColumnScope) -> Any:
+    if not _is_series(condition):
+        return if_true if condition else if_false
+    if _is_series(if_true) and _is_series(if_false) and if_true.dtype == if_false.dtype != object:
+        return pd.Series(np.where(condition.to_numpy(), if_true.to_numpy(), if_false.to_numpy()), index=scope.index)
+    # Mixed operands keep their per-row Python values in an object column
+    true_values = if_true.to_numpy(dtype=object) if _is_series(if_true) else scope.full(if_true)
+    false_values = if_false.to_numpy(dtype=object) if _is_series(if_false) else scope.full(if_false)
+    return pd.Series(np.where(condition.to_numpy(), true_values, false_values), index=scope.index, dtype=object)
+
+
+def _bool_op(is_and: bool, values: List[Any], scope: _ColumnScope) -> Any:
+    result = values[0]
+    for value in values[1:]:
+        # `a and b` is b when a is truthy, else a; `a or b` is a when a is truthy, else b
+        if is_and:
+            result = _select(_truthy(result), value, result, scope)
+        else:
+            result = _select(_truthy(result), result, value, scope)
+    return result
+
+
+def _unary(op_type: type, value: Any) -> Any:
+    if op_type is ast.Not:
+        truthy = _truthy(value)
+        return ~truthy if _is_series(truthy) else not truthy
+    op = operator.neg if op_type is ast.USub else operator.pos
+    if not _is_series(value):
+        return op(value)
+    if value.dtype.kind not in "iuf":
+        raise _NotVectorizable("sign of non-numeric column")
+    return op(value)
+
+
+def _text(value: Any) -> Any:
+    if not _is_series(value):
+        return ExpressionEngine._coalesce_text(value)
+    coalesce = ExpressionEngine._coalesce_text
+    # Plain strings and numbers (the common cases) are converted without a function call
+    texts = [
+        item if type(item) is str and (len(item) != 3 or item.lower() != "nan")
+        else str(item) if type(item) is int or (type(item) is float and item == item)
+        else coalesce(item)
+        for item in value.tolist()
+    ]
+    return pd.Series(texts, index=value.index, dtype=object)
+
+
+def _text_map(value: Any, method: Callable[[str], Any]) -> Any:
+    text = _text(value)
+    if not _is_series(text):
+        return method(text)
+    return pd.Series([method(item) for item in text.tolist()], index=text.index, dtype=object)
+
+
+def _replace(value: Any, old: Any, new: Any) -> Any:
+    if not _is_series(value):
+        return ExpressionEngine._fn_replace(value, old, new)
+    if not isinstance(old, str) or not isinstance(new, str):
+        raise _NotVectorizable("replace() arguments must be constant strings")
+    text = _text(value)
+    return pd.Series([item.replace(old, new) for item in text.tolist()], index=text.index, dtype=object)
+
+
+def _substring(value: Any, start: Any, length: Optional[Any] = None) -> Any:
+    if not _is_series(value):
+        return ExpressionEngine._fn_substring(value, start, length)
+    if type(start) is not int or (length is not None and type(length) is not int):
+        raise _NotVectorizable("substring() bounds must be constant integers")
+    end = None if length is None else start + length
+    text = _text(value)
+    return pd.Series([item[start:end] for item in text.tolist()], index=text.index, dtype=object)
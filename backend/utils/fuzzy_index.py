@@ -0,0 +1,116 @@
+"""
+Indexed fuzzy lookup with the same results as pairwise SequenceMatcher scans.
+
+Fuzzy matching used to compare a value against every candidate with
+difflib.SequenceMatcher(None, value, candidate).ratio(), which is O(N x M)
+Python work. FuzzyIndex is built once per candidate list (e.g. once per
+employee/master file version) and answers queries in two steps:
+
+1. Character n-gram inverted lists (unigrams with counts) give, for every
+   candidate sharing characters with the query, the size of the character
+   multiset intersection. 2 * overlap / (len(a) + len(b)) is difflib's
+   quick_ratio(), a guaranteed upper bound of ratio(), computed with numpy over
+   the posting lists only.
+2. Bounded verification: candidates are checked with the real ratio() in
+   descending bound order, stopping once the bound drops below the threshold
+   (or below the k-th best score found so far).
+
+Because the bound never underestimates, the returned matches, scores and tie
+order (earliest candidate first) are identical to a full scan.
+"""
+
+from collections import Counter
+from difflib import SequenceMatcher
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class FuzzyIndex:
+    """Inverted character index over candidate strings for ratio() threshold search."""
+
+    def __init__(self, candidates: Sequence[Any], normalize: Optional[Callable[[Any], Optional[str]]] = None):
+        """
+        Args:
+            candidates: Values to search; positions in this sequence are returned by queries.
+            normalize: Maps a candidate (and each query) to the compared string, or None to
+                leave that candidate out. Defaults to using str values as they are.
+        """
+        self.candidates = list(candidates)
+        self.normalize = normalize or (lambda value: value if isinstance(value, str) else None)
+
+        self.keys: List[Optional[str]] = [self.normalize(value) for value in self.candidates]
+        self.lengths = np.array([len(key) if key is not None else 0 for key in self.keys], dtype=np.int64)
+        self.indexed = np.array([key is not None for key in self.keys], dtype=bool)
+
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        for position, key in enumerate(self.keys):
+            if not key:
+                continue
+            for char, count in Counter(key).items():
+                ids, counts = postings.setdefault(char, ([], []))
+                ids.append(position)
+                counts.append(count)
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {
+            char: (np.array(ids, dtype=np.int64), np.array(counts, dtype=np.int64))
+            for char, (ids, counts) in postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.candidates)
+
+    def upper_bounds(self, query_key: str) -> np.ndarray:
+        """quick_ratio() of query_key against every candidate (-1 for candidates left out)."""
+        overlap = np.zeros(len(self.candidates), dtype=np.int64)
+        for char, query_count in Counter(query_key).items():
+            posting = self._postings.get(char)
+            if posting is None:
+                continue
+            ids, counts = posting
+            overlap[ids] += np.minimum(counts, query_count)
+
+        total = self.lengths + len(query_key)
+        bounds = np.ones(len(self.candidates), dtype=np.float64)  # ratio("", "") == 1.0
+        nonempty = total > 0
+        bounds[nonempty] = 2.0 * overlap[nonempty] / total[nonempty]
+        bounds[~self.indexed] = -1.0
+        return bounds
+
+    def search(self, query: Any, threshold: float, top_k: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Candidates with SequenceMatcher(None, query, candidate).ratio() >= threshold.
+
+        Returns (position, score) pairs sorted by score descending, then position,
+        truncated to top_k when given.
+        """
+        query_key = self.normalize(query)
+        if query_key is None or not self.candidates:
+            return []
+
+        bounds = self.upper_bounds(query_key)
+        plausible = np.nonzero(bounds >= threshold)[0]
+        if not len(plausible):
+            return []
+        # Highest bound first; stable sort keeps earlier candidates first among equal bounds
+        order = plausible[np.argsort(-bounds[plausible], kind="stable")]
+
+        results: List[Tuple[int, float]] = []
+        cutoff = threshold
+        for position in order:
+            if bounds[position] < cutoff:
+                break  # No remaining candidate can reach the cutoff
+            score = SequenceMatcher(None, query_key, self.keys[position]).ratio()
+            if score < threshold:
+                continue
+            results.append((int(position), score))
+            if top_k and len(results) >= top_k:
+                results.sort(key=lambda item: (-item[1], item[0]))
+                del results[top_k:]
+                cutoff = max(threshold, results[-1][1])
+
+        results.sort(key=lambda item: (-item[1], item[0]))
+        return results[:top_k] if top_k else results
+
+    def best(self, query: Any, threshold: float) -> Optional[Tuple[int, float]]:
+        """Single best match (earliest candidate on ties), or None below threshold."""
+        matches = self.search(query, threshold, top_k=1)
+        return matches[0] if matches else None
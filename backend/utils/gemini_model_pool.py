@@ -0,0 +1,156 @@
+"""
+Reusable Gemini model handles.
+
+`genai.configure()` mutates process-global state, so rotating API keys while
+other requests are in flight silently switches their credentials. The pool
+instead binds each GenerativeModel to its own per-key GenerativeServiceClient
+and hands out pre-built handles keyed by (api_key, model_name, generation_config).
+
+Binding relies on GenerativeModel's private `_client` attribute, which
+google-generativeai only guarantees for the versions in
+SUPPORTED_GENAI_VERSIONS (requirements.txt pins one). The pool checks this when
+it is created and refuses to run otherwise, rather than silently sending
+requests with whichever key was configured last.
+"""
+
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import google.generativeai as genai
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GENERATION_CONFIG: Dict[str, Any] = {
+    "temperature": 0.3,
+    "top_p": 0.95,
+    "top_k": 40,
+}
+
+PoolKey = Tuple[str, str, str]
+
+# google-generativeai versions whose GenerativeModel reads its client from `_client`
+SUPPORTED_GENAI_VERSIONS = ("0.7.", "0.8.")
+
+
+def check_client_binding() -> None:
+    """Raise if this google-generativeai release may not honour a per-model `_client`."""
+    version = getattr(genai, "__version__", "unknown")
+    if not version.startswith(SUPPORTED_GENAI_VERSIONS):
+        raise RuntimeError(
+            f"google-generativeai {version} is not verified for per-key model clients "
+            f"(supported: {', '.join(v + 'x' for v in SUPPORTED_GENAI_VERSIONS)})"
+        )
+    probe = genai.GenerativeModel(model_name="models/gemini-client-binding-check")
+    if "_client" not in vars(probe):
+        raise RuntimeError(
+            f"google-generativeai {version}: GenerativeModel has no `_client` attribute; "
+            "per-key model clients cannot be bound"
+        )
+
+
+def _freeze_config(generation_config: Optional[Dict[str, Any]]) -> str:
+    return json.dumps(generation_config or {}, sort_keys=True, default=str)
+
+
+class GeminiModelPool:
+    """Checkout/checkin pool of GenerativeModel handles bound to per-key clients."""
+
+    def __init__(self, max_idle_per_key: int = 16):
+        check_client_binding()
+        self.max_idle_per_key = max_idle_per_key
+        self._lock = threading.Lock()
+        self._clients: Dict[str, Any] = {}
+        self._idle: Dict[PoolKey, List[Any]] = {}
+        self._global_config_lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def _get_client(self, api_key: str) -> Optional[Any]:
+        """One GenerativeServiceClient per API key (clients are thread-safe)."""
+        with self._lock:
+            if api_key in self._clients:
+                return self._clients[api_key]
+        try:
+            from google.ai import generativelanguage as glm
+
+            client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+        except Exception as e:
+            logger.warning(f"⚠️  Could not build per-key Gemini client, falling back to global configure: {e}")
+            client = None
+        with self._lock:
+            return self._clients.setdefault(api_key, client)
+
+    def _build_model(self, api_key: str, model_name: str, generation_config: Optional[Dict[str, Any]]) -> Any:
+        client = self._get_client(api_key)
+        if client is None:
+            # Legacy path: serialise global configure + construction so at least
+            # the model's lazily-created client captures the intended key.
+            with self._global_config_lock:
+                genai.configure(api_key=api_key)
+                model = genai.GenerativeModel(model_name=model_name, generation_config=generation_config)
+                model._client = genai.client.get_default_generative_client()
+        else:
+            model = genai.GenerativeModel(model_name=model_name, generation_config=generation_config)
+            model._client = client  # checked by check_client_binding()
+        with self._lock:
+            self.created += 1
+        return model
+
+    def acquire(self, api_key: str, model_name: str, generation_config: Optional[Dict[str, Any]] = None) -> Any:
+        key: PoolKey = (api_key, model_name, _freeze_config(generation_config))
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self.reused += 1
+                return idle.pop()
+        return self._build_model(api_key, model_name, generation_config)
+
+    def release(self, api_key: str, model_name: str, generation_config: Optional[Dict[str, Any]], model: Any) -> None:
+        key: PoolKey = (api_key, model_name, _freeze_config(generation_config))
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_key:
+                idle.append(model)
+
+    @contextmanager
+    def checkout(
+        self,
+        api_key: str,
+        model_name: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[Any]:
+        """Context manager yielding a model handle bound to api_key."""
+        model = self.acquire(api_key, model_name, generation_config)
+        try:
+            yield model
+        finally:
+            self.release(api_key, model_name, generation_config, model)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "clients": len(self._clients),
+                "idle_models": sum(len(v) for v in self._idle.values()),
+                "created": self.created,
+                "reused": self.reused,
+            }
+
+
+# 全局 Gemini 模型池實例
+_gemini_model_pool = None
+_gemini_model_pool_lock = threading.Lock()
+
+
+def get_gemini_model_pool() -> GeminiModelPool:
+    """獲取全局 Gemini 模型池實例"""
+    global _gemini_model_pool
+
+    if _gemini_model_pool is None:
+        with _gemini_model_pool_lock:
+            if _gemini_model_pool is None:
+                _gemini_model_pool = GeminiModelPool()
+
+    return _gemini_model_pool
@@ -0,0 +1,377 @@
+"""
+Durable, database-backed job queue for order processing.
+
+Order pipeline runs (full, OCR-only, mapping-only) are recorded in the
+`order_jobs` table instead of being started as FastAPI BackgroundTasks. Worker
+processes (`python worker.py`) claim jobs with a time-limited lease, renew it
+with heartbeats while the job runs, and mark it finished. If a worker dies, its
+lease expires and another worker reclaims the job. A reclaimed or retried
+attempt first resets the order (items stuck in PROCESSING go back to PENDING)
+and resumes from the order's current stage (see
+OrderProcessor.prepare_order_retry), so an interrupted order is picked up
+again instead of being left stuck. OCR capacity scales with the number of
+workers.
+
+A run that leaves its order FAILED counts as a failed attempt and is re-queued
+with backoff until ORDER_JOB_MAX_ATTEMPTS is reached. When a job fails for good
+(including a worker that keeps dying on the same order), the order and any
+items still PROCESSING are marked FAILED with the job's last error in the same
+transaction, so the restart endpoints and the UI see the failure.
+
+Claiming uses a guarded UPDATE (status/lease conditions in the WHERE clause),
+so only one worker can win a job on both PostgreSQL and SQLite.
+
+Configuration (environment):
+- ORDER_JOB_MODE:            inline | queue (default inline: BackgroundTasks in the API process)
+- ORDER_JOB_LEASE_SECONDS:   lease length, renewed every third of it (default 120)
+- ORDER_JOB_MAX_ATTEMPTS:    claims before a job is marked FAILED (default 3)
+- ORDER_JOB_RETRY_SECONDS:   base backoff before a failed job is retried (default 60)
+"""
+
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy.orm import Session
+
+from db.database import engine
+from db.models import (
+    OcrOrder,
+    OcrOrderItem,
+    OrderItemStatus,
+    OrderJob,
+    OrderJobStatus,
+    OrderJobType,
+    OrderStatus,
+)
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_JOB_STATUSES = (OrderJobStatus.QUEUED, OrderJobStatus.RUNNING)
+
+
+def job_queue_enabled() -> bool:
+    """True when order runs should be enqueued for workers instead of run in-process."""
+    return os.getenv("ORDER_JOB_MODE", "inline").strip().lower() == "queue"
+
+
+def lease_seconds() -> int:
+    return max(10, int(os.getenv("ORDER_JOB_LEASE_SECONDS", "120")))
+
+
+def _max_attempts() -> int:
+    return max(1, int(os.getenv("ORDER_JOB_MAX_ATTEMPTS", "3")))
+
+
+def _retry_seconds() -> int:
+    return max(0, int(os.getenv("ORDER_JOB_RETRY_SECONDS", "60")))
+
+
+_table_ready = False
+_table_lock = threading.Lock()
+
+
+def ensure_job_table() -> None:
+    """Create the order_jobs table if it does not exist yet (idempotent)."""
+    global _table_ready
+
+    if _table_ready:
+        return
+    with _table_lock:
+        if not _table_ready:
+            OrderJob.__table__.create(bind=engine, checkfirst=True)
+            _table_ready = True
+
+
+@dataclass
+class ClaimedJob:
+    job_id: int
+    order_id: int
+    job_type: OrderJobType
+    attempts: int
+    max_attempts: int
+    # True when an earlier attempt started (failed, lease lost or released on shutdown)
+    resumed: bool = False
+
+
+def enqueue_order_job(db: Session, order_id: int, job_type: OrderJobType) -> OrderJob:
+    """Queue a pipeline run for an order; an already queued/running job of the same type is reused."""
+    ensure_job_table()
+    existing = (
+        db.query(OrderJob)
+        .filter(
+            OrderJob.order_id == order_id,
+            OrderJob.job_type == job_type,
+            OrderJob.status.in_(ACTIVE_JOB_STATUSES),
+        )
+        .first()
+    )
+    if existing:
+        logger.info(f"ℹ️ Order {order_id} already has {job_type.value} job {existing.job_id} ({existing.status.value})")
+        return existing
+
+    job = OrderJob(
+        order_id=order_id,
+        job_type=job_type,
+        status=OrderJobStatus.QUEUED,
+        max_attempts=_max_attempts(),
+        available_at=datetime.utcnow(),
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    logger.info(f"📥 Queued {job_type.value} job {job.job_id} for order {order_id}")
+    return job
+
+
+def _fail_order(db: Session, job: OrderJob, now: datetime) -> None:
+    """Mark the job's order and its stuck PROCESSING items FAILED (caller commits)."""
+    order = db.get(OcrOrder, job.order_id)
+    if order is None or order.status in {OrderStatus.LOCKED, OrderStatus.COMPLETED}:
+        return
+    error = (job.last_error or f"Job {job.job_id} failed after {job.attempts} attempts").strip()
+
+    stuck = (
+        db.query(OcrOrderItem)
+        .filter(OcrOrderItem.order_id == job.order_id, OcrOrderItem.status == OrderItemStatus.PROCESSING)
+        .all()
+    )
+    for item in stuck:
+        item.status = OrderItemStatus.FAILED
+        item.error_message = error
+        item.updated_at = now
+
+    order.status = OrderStatus.FAILED
+    order.error_message = error
+    order.failed_items = (
+        db.query(OcrOrderItem)
+        .filter(OcrOrderItem.order_id == job.order_id, OcrOrderItem.status == OrderItemStatus.FAILED)
+        .count()
+    )
+    order.updated_at = now
+
+
+def _claimable(now: datetime):
+    return or_(
+        and_(OrderJob.status == OrderJobStatus.QUEUED, OrderJob.available_at <= now),
+        # Lease expired: the previous worker died or stalled
+        and_(OrderJob.status == OrderJobStatus.RUNNING, OrderJob.lease_expires_at < now),
+    )
+
+
+def claim_next_job(
+    worker_id: str,
+    job_types: Optional[Iterable[OrderJobType]] = None,
+    lease: Optional[int] = None,
+) -> Optional[ClaimedJob]:
+    """Claim the oldest runnable job for worker_id, or return None if there is none."""
+    ensure_job_table()
+    lease = lease or lease_seconds()
+    job_types = list(job_types) if job_types else None
+
+    with Session(engine) as db:
+        now = datetime.utcnow()
+        query = db.query(OrderJob.job_id, OrderJob.started_at).filter(_claimable(now))
+        if job_types:
+            query = query.filter(OrderJob.job_type.in_(job_types))
+        candidates = [
+            (row.job_id, row.started_at is not None)
+            for row in query.order_by(OrderJob.available_at, OrderJob.job_id).limit(10)
+        ]
+
+        for job_id, resumed in candidates:
+            result = db.execute(
+                update(OrderJob)
+                .where(OrderJob.job_id == job_id, _claimable(now))
+                .values(
+                    status=OrderJobStatus.RUNNING,
+                    lease_owner=worker_id,
+                    lease_expires_at=now + timedelta(seconds=lease),
+                    heartbeat_at=now,
+                    started_at=now,
+                    attempts=OrderJob.attempts + 1,
+                    updated_at=now,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            if result.rowcount != 1:
+                continue  # Another worker won the race
+
+            job = db.get(OrderJob, job_id)
+            if job.attempts > job.max_attempts:
+                # Reclaimed after its last attempt's lease expired: likely crashes the worker
+                job.status = OrderJobStatus.FAILED
+                job.finished_at = now
+                job.lease_owner = None
+                job.last_error = (job.last_error or "") + f"\nLease expired after {job.max_attempts} attempts"
+                _fail_order(db, job, now)
+                db.commit()
+                logger.error(f"❌ Job {job_id} (order {job.order_id}) exceeded {job.max_attempts} attempts")
+                continue
+
+            logger.info(
+                f"🔒 Worker {worker_id} claimed job {job_id} ({job.job_type.value}, order {job.order_id}, "
+                f"attempt {job.attempts}/{job.max_attempts})"
+            )
+            return ClaimedJob(job.job_id, job.order_id, job.job_type, job.attempts, job.max_attempts, resumed)
+    return None
+
+
+def heartbeat(job_id: int, worker_id: str, lease: Optional[int] = None) -> bool:
+    """Extend the lease; returns False if this worker no longer owns the job."""
+    lease = lease or lease_seconds()
+    now = datetime.utcnow()
+    with Session(engine) as db:
+        result = db.execute(
+            update(OrderJob)
+            .where(
+                OrderJob.job_id == job_id,
+                OrderJob.lease_owner == worker_id,
+                OrderJob.status == OrderJobStatus.RUNNING,
+            )
+            .values(heartbeat_at=now, lease_expires_at=now + timedelta(seconds=lease), updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount == 1
+
+
+class LeaseKeeper:
+    """Renews a job's lease from a dedicated thread.
+
+    Pipeline steps that block the worker's event loop (exports, uploads, pandas
+    work) would otherwise also block heartbeats and let the lease expire while
+    the job is still running. `on_lost` is called (from the keeper thread) when
+    the lease has been taken over.
+    """
+
+    def __init__(self, job_id: int, worker_id: str, lease: int, on_lost: Callable[[], None]):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease = lease
+        self.on_lost = on_lost
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{job_id}", daemon=True)
+
+    def start(self) -> "LeaseKeeper":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop renewing and wait for an in-flight heartbeat to finish."""
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        interval = max(1.0, self.lease / 3)
+        while not self._stop.wait(interval):
+            try:
+                still_owner = heartbeat(self.job_id, self.worker_id, self.lease)
+            except Exception as e:
+                # Transient DB error: keep going, the next beat may succeed before the lease runs out
+                logger.warning(f"⚠️ Heartbeat failed for job {self.job_id}: {e}")
+                continue
+            if not still_owner and not self._stop.is_set():
+                logger.error(f"❌ Lost lease on job {self.job_id}; cancelling to avoid duplicate processing")
+                self.on_lost()
+                return
+
+
+def complete_job(job_id: int, worker_id: str) -> bool:
+    now = datetime.utcnow()
+    with Session(engine) as db:
+        result = db.execute(
+            update(OrderJob)
+            .where(OrderJob.job_id == job_id, OrderJob.lease_owner == worker_id)
+            .values(
+                status=OrderJobStatus.SUCCEEDED,
+                finished_at=now,
+                lease_owner=None,
+                lease_expires_at=None,
+                updated_at=now,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount == 1
+
+
+def fail_job(job_id: int, worker_id: str, error: str) -> bool:
+    """Record a failure; the job is re-queued with backoff until max_attempts is reached."""
+    now = datetime.utcnow()
+    with Session(engine) as db:
+        job = db.get(OrderJob, job_id)
+        if not job or job.lease_owner != worker_id:
+            return False
+        job.last_error = error[:4000]
+        job.lease_owner = None
+        job.lease_expires_at = None
+        job.updated_at = now
+        if job.attempts < job.max_attempts:
+            job.status = OrderJobStatus.QUEUED
+            job.available_at = now + timedelta(seconds=_retry_seconds() * job.attempts)
+            logger.warning(f"⚠️ Job {job_id} failed (attempt {job.attempts}/{job.max_attempts}); retrying at {job.available_at}")
+        else:
+            job.status = OrderJobStatus.FAILED
+            job.finished_at = now
+            _fail_order(db, job, now)
+            logger.error(f"❌ Job {job_id} failed permanently after {job.attempts} attempts: {error}")
+        db.commit()
+        return True
+
+
+def release_job(job_id: int, worker_id: str) -> bool:
+    """Hand a job back untouched (e.g. on graceful shutdown) without consuming an attempt."""
+    now = datetime.utcnow()
+    with Session(engine) as db:
+        result = db.execute(
+            update(OrderJob)
+            .where(OrderJob.job_id == job_id, OrderJob.lease_owner == worker_id)
+            .values(
+                status=OrderJobStatus.QUEUED,
+                attempts=OrderJob.attempts - 1,  # Claiming always incremented it
+                lease_owner=None,
+                lease_expires_at=None,
+                available_at=now,
+                updated_at=now,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount == 1
+
+
+def get_queue_stats() -> Dict[str, Any]:
+    """Counts by status/type plus the oldest queued job age, for /health."""
+    ensure_job_table()
+    with Session(engine) as db:
+        rows = (
+            db.query(OrderJob.status, OrderJob.job_type, func.count(OrderJob.job_id))
+            .group_by(OrderJob.status, OrderJob.job_type)
+            .all()
+        )
+        oldest_queued = (
+            db.query(func.min(OrderJob.created_at)).filter(OrderJob.status == OrderJobStatus.QUEUED).scalar()
+        )
+        running: List[Dict[str, Any]] = [
+            {"job_id": job.job_id, "order_id": job.order_id, "worker": job.lease_owner}
+            for job in db.query(OrderJob).filter(OrderJob.status == OrderJobStatus.RUNNING).limit(50)
+        ]
+
+    by_status: Dict[str, int] = {}
+    by_type: Dict[str, Dict[str, int]] = {}
+    for status, job_type, count in rows:
+        by_status[status.value] = by_status.get(status.value, 0) + count
+        by_type.setdefault(job_type.value, {})[status.value] = count
+    return {
+        "mode": "queue" if job_queue_enabled() else "inline",
+        "by_status": by_status,
+        "by_type": by_type,
+        "oldest_queued_seconds": (datetime.utcnow() - oldest_queued).total_seconds() if oldest_queued else 0,
+        "running": running,
+    }
@@ -0,0 +1,346 @@
+"""
+Join-key normalization and pre-indexed master join tables.
+
+`normalize_join_series` holds the join-value normalization used by
+OrderProcessor._join_with_master_csv (string coercion, strip_non_digits,
+zfill, strip_invisible, nfkc, normalize_ws, lower, value_alias_map). The
+enabled transforms are fused into one function that runs once per distinct
+value; `normalize_join_series_rowwise` is the original per-transform .apply
+version, kept as the reference and fallback.
+
+Normalizing the master side used to run over the whole master file on every
+item join. `build_master_join_table` does it once per master version (the
+result is stored on the master data cache entry) and adds a hash index on the
+normalized key, so each join only normalizes the order's own rows and pulls
+the matching master rows by lookup before the regular pandas merge.
+"""
+
+import json
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Separator for composite (multi-column) index keys; not expected in business values
+COMPOSITE_KEY_SEPARATOR = "\x1f"
+
+INVISIBLE_WHITESPACE = (
+    "\u00A0\u1680\u180E\u2000\u2001\u2002\u2003\u2004\u2005\u2006"
+    "\u2007\u2008\u2009\u200A\u200B\u200C\u200D\u202F\u205F\u3000\uFEFF"
+)
+_INVISIBLE_TO_SPACE = str.maketrans({ch: " " for ch in INVISIBLE_WHITESPACE})
+_MISSING_MARKERS = frozenset({"nan", "None"})
+
+
+def left_join_column(position: int) -> str:
+    return f"__join_left_{position}__"
+
+
+def right_join_column(position: int) -> str:
+    return f"__join_right_{position}__"
+
+
+def join_normalize_fingerprint(join_normalize: Optional[Dict[str, Any]]) -> str:
+    """Stable text form of a join_normalize spec, used in cache keys."""
+    try:
+        return json.dumps(join_normalize or {}, sort_keys=True, ensure_ascii=False, default=str)
+    except (TypeError, ValueError):
+        return str(join_normalize)
+
+
+def _normalize_text(s: str, opts: Optional[Dict[str, Any]], key_name: Optional[str] = None) -> str:
+    if opts is None:
+        return s
+    out = s
+    try:
+        if isinstance(out, str):
+            if opts.get('strip_non_digits'):
+                import re
+                out = re.sub(r"\D+", "", out)
+            # zfill: int or per-key map
+            zfill = opts.get('zfill')
+            if isinstance(zfill, int) and zfill > 0:
+                out = out.zfill(zfill)
+            elif isinstance(zfill, dict) and key_name and key_name in zfill:
+                length = int(zfill[key_name])
+                if length > 0:
+                    out = out.zfill(length)
+    except Exception:
+        return s
+    return out
+
+
+def normalize_join_series_rowwise(
+    series: pd.Series,
+    join_normalize: Optional[Dict[str, Any]],
+    key_name: Optional[str] = None,
+) -> pd.Series:
+    """Reference implementation: one pandas .apply pass per enabled transform.
+
+    Kept as the semantic baseline for normalize_join_series (see
+    scripts/check_join_normalization.py) and as its fallback.
+    """
+    try:
+        s = series.astype(str).replace({"nan": "", "None": ""}).str.strip()
+        if join_normalize:
+            # Basic text transforms first
+            s = s.apply(lambda v: _normalize_text(v, join_normalize, key_name))
+            # Optional: strip invisible/zero-width whitespace and NBSP/full-width space
+            # Controlled via join_normalize.strip_invisible = true
+            if isinstance(join_normalize, dict) and join_normalize.get('strip_invisible'):
+                try:
+                    import re
+                    # Replace a set of invisible/spacing characters with a regular space,
+                    # then subsequent whitespace normalization can collapse them.
+                    # Note: avoid hardcoded business values; this is generic unicode cleanup.
+                    pattern = f"[{INVISIBLE_WHITESPACE}]"
+                    s = s.apply(lambda v: re.sub(pattern, " ", v) if isinstance(v, str) else v)
+                except Exception:
+                    pass
+            # Unicode normalization (NFKC)
+            if isinstance(join_normalize, dict) and join_normalize.get('nfkc'):
+                try:
+                    import unicodedata
+                    s = s.apply(lambda v: unicodedata.normalize('NFKC', v) if isinstance(v, str) else v)
+                except Exception:
+                    pass
+            # Collapse whitespaces
+            if isinstance(join_normalize, dict) and join_normalize.get('normalize_ws'):
+                try:
+                    s = s.str.replace(r"\s+", " ", regex=True).str.strip()
+                except Exception:
+                    pass
+            # Lowercase last (after unicode/ws normalization)
+            if isinstance(join_normalize, dict) and join_normalize.get('lower'):
+                s = s.str.lower()
+
+            # Optional: apply value alias mapping after transforms. This allows admin-configured
+            # alias dictionaries to canonicalise join values without hardcoding here.
+            # Accept either a global alias map or a per-key map structure.
+            #   join_normalize.value_alias_map = {"alias": "canonical", ...}
+            #   join_normalize.value_alias_map = {key_name: {"alias": "canonical"}}
+            try:
+                alias_spec = None
+                if isinstance(join_normalize, dict):
+                    alias_spec = join_normalize.get('value_alias_map') or join_normalize.get('aliases')
+                if isinstance(alias_spec, dict):
+                    cur_map = None
+                    # Per-key map has precedence when available
+                    if key_name and isinstance(alias_spec.get(key_name), dict):
+                        cur_map = alias_spec.get(key_name)
+                    else:
+                        # Global map applied to any key
+                        cur_map = alias_spec
+                    if isinstance(cur_map, dict) and cur_map:
+                        # Ensure keys are strings; apply mapping on exact post-normalized value
+                        s = s.apply(lambda v: cur_map.get(v, v) if isinstance(v, str) else v)
+            except Exception:
+                pass
+        return s
+    except Exception:
+        s = series.astype("string").fillna("").str.strip()
+        if join_normalize:
+            s = s.apply(lambda v: _normalize_text(v, join_normalize, key_name))
+            if isinstance(join_normalize, dict) and join_normalize.get('strip_invisible'):
+                try:
+                    import re
+                    pattern = f"[{INVISIBLE_WHITESPACE}]"
+                    s = s.apply(lambda v: re.sub(pattern, " ", v) if isinstance(v, str) else v)
+                except Exception:
+                    pass
+            if isinstance(join_normalize, dict) and join_normalize.get('nfkc'):
+                try:
+                    import unicodedata
+                    s = s.apply(lambda v: unicodedata.normalize('NFKC', v) if isinstance(v, str) else v)
+                except Exception:
+                    pass
+            if isinstance(join_normalize, dict) and join_normalize.get('normalize_ws'):
+                try:
+                    s = s.str.replace(r"\s+", " ", regex=True).str.strip()
+                except Exception:
+                    pass
+            if isinstance(join_normalize, dict) and join_normalize.get('lower'):
+                s = s.str.lower()
+            try:
+                alias_spec = None
+                if isinstance(join_normalize, dict):
+                    alias_spec = join_normalize.get('value_alias_map') or join_normalize.get('aliases')
+                if isinstance(alias_spec, dict):
+                    cur_map = None
+                    if key_name and isinstance(alias_spec.get(key_name), dict):
+                        cur_map = alias_spec.get(key_name)
+                    else:
+                        cur_map = alias_spec
+                    if isinstance(cur_map, dict) and cur_map:
+                        s = s.apply(lambda v: cur_map.get(v, v) if isinstance(v, str) else v)
+            except Exception:
+                pass
+        return s
+
+
+def _compile_value_normalizer(
+    join_normalize: Dict[str, Any],
+    key_name: Optional[str],
+) -> Callable[[str], Any]:
+    """Fuse the enabled transforms into one function over a single str value.
+
+    Mirrors normalize_join_series_rowwise step by step: the same transforms,
+    in the same order, with the same error fallbacks.
+    """
+    # astype(str) turned missing values into "nan"/"None"; blank them, then strip
+    steps: List[Callable[[str], Any]] = [lambda v: ("" if v in _MISSING_MARKERS else v).strip()]
+    if not join_normalize:
+        return steps[0]
+
+    # _normalize_text: strip_non_digits then zfill; any error returns the input unchanged
+    strip_digits = bool(join_normalize.get('strip_non_digits'))
+    zfill = join_normalize.get('zfill')
+    width = 0
+    text_error = False
+    if isinstance(zfill, int) and zfill > 0:
+        width = zfill
+    elif isinstance(zfill, dict) and key_name and key_name in zfill:
+        try:
+            width = max(0, int(zfill[key_name]))
+        except Exception:
+            text_error = True
+    if not text_error and (strip_digits or width):
+        non_digits = re.compile(r"\D+")
+        if strip_digits and width:
+            steps.append(lambda v: non_digits.sub("", v).zfill(width))
+        elif strip_digits:
+            steps.append(lambda v: non_digits.sub("", v))
+        else:
+            steps.append(lambda v: v.zfill(width))
+
+    if join_normalize.get('strip_invisible'):
+        # Same as re.sub over the character class, without the regex engine
+        steps.append(lambda v: v.translate(_INVISIBLE_TO_SPACE))
+    if join_normalize.get('nfkc'):
+        steps.append(lambda v: unicodedata.normalize('NFKC', v))
+    if join_normalize.get('normalize_ws'):
+        # str.split() and re's \s both use str.isspace, so this equals re.sub(r"\s+", " ", v).strip()
+        steps.append(lambda v: " ".join(v.split()))
+    if join_normalize.get('lower'):
+        steps.append(str.lower)
+
+    alias_spec = join_normalize.get('value_alias_map') or join_normalize.get('aliases')
+    if isinstance(alias_spec, dict):
+        if key_name and isinstance(alias_spec.get(key_name), dict):
+            cur_map = alias_spec.get(key_name)
+        else:
+            cur_map = alias_spec
+        if cur_map:
+            # Alias is the last step, so later steps never see a non-str value
+            steps.append(lambda v: cur_map.get(v, v))
+
+    def normalize(value: str) -> Any:
+        for step in steps:
+            value = step(value)
+        return value
+
+    return normalize
+
+
+def normalize_join_series(
+    series: pd.Series,
+    join_normalize: Optional[Dict[str, Any]],
+    key_name: Optional[str] = None,
+) -> pd.Series:
+    """Coerce a join column to normalized strings so both sides compare equal.
+
+    Same result as normalize_join_series_rowwise, but all transforms run in one
+    fused pass and only once per distinct value (codes from pd.factorize), so
+    repeated keys in large masters cost nothing extra.
+    """
+    try:
+        s = series.astype(str)
+        if s.dtype != object or (join_normalize and not isinstance(join_normalize, dict)):
+            # Non-dict specs and non-object dtypes are rare; keep the reference behaviour
+            return normalize_join_series_rowwise(series, join_normalize, key_name)
+
+        normalize = _compile_value_normalizer(join_normalize or {}, key_name)
+        codes, uniques = pd.factorize(s, use_na_sentinel=True)
+        mapped = np.empty(len(uniques), dtype=object)
+        mapped[:] = [normalize(v) if isinstance(v, str) else v for v in uniques]
+
+        values = s.to_numpy(dtype=object, copy=True)
+        present = codes >= 0
+        values[present] = mapped[codes[present]]
+        result = pd.Series(values, index=s.index, name=s.name, dtype=object)
+        if not all(isinstance(v, str) for v in mapped):
+            # Alias maps may yield numbers; match .apply's dtype inference
+            result = result.infer_objects()
+        return result
+    except Exception:
+        return normalize_join_series_rowwise(series, join_normalize, key_name)
+
+
+def composite_join_key(frame: pd.DataFrame, columns: Sequence[str]) -> pd.Series:
+    """One hashable string per row built from the normalized join columns.
+
+    Only used to pick candidate master rows: values that stringify the same
+    (e.g. 1 and "1") may collide, which is harmless because the final pandas
+    merge still compares the real key columns.
+    """
+    keys = frame[columns[0]].astype(str)
+    for column in columns[1:]:
+        keys = keys + COMPOSITE_KEY_SEPARATOR + frame[column].astype(str)
+    return keys
+
+
+@dataclass
+class MasterJoinTable:
+    """Master frame plus normalized key columns and a hash index on them."""
+
+    frame: pd.DataFrame
+    key_columns: List[str]
+    key_index: pd.Index     # unique composite keys -> group number
+    row_order: np.ndarray   # master row positions grouped by key
+    group_starts: np.ndarray
+    group_counts: np.ndarray
+
+    def candidates(self, left: pd.DataFrame, left_columns: Sequence[str]) -> pd.DataFrame:
+        """Master rows whose normalized key occurs in left, in master order."""
+        lookup = pd.unique(composite_join_key(left, left_columns).to_numpy())
+        groups = self.key_index.get_indexer(lookup)
+        groups = groups[groups >= 0]
+        if not len(groups):
+            return self.frame.iloc[0:0]
+        positions = np.concatenate(
+            [self.row_order[start:start + count] for start, count in zip(self.group_starts[groups], self.group_counts[groups])]
+        )
+        positions.sort()
+        return self.frame.iloc[positions]
+
+
+def build_master_join_table(
+    master_df: pd.DataFrame,
+    right_on: Sequence[str],
+    key_names: Sequence[str],
+    join_normalize: Optional[Dict[str, Any]],
+) -> MasterJoinTable:
+    """Normalize the master join columns once and index them."""
+    frame = master_df.copy(deep=False)
+    key_columns: List[str] = []
+    for i, (rcol, key_name) in enumerate(zip(right_on, key_names)):
+        tmp = right_join_column(i)
+        frame[tmp] = normalize_join_series(master_df[rcol], join_normalize, key_name)
+        key_columns.append(tmp)
+
+    codes, uniques = pd.factorize(composite_join_key(frame, key_columns))
+    counts = np.bincount(codes, minlength=len(uniques))
+    starts = np.zeros(len(uniques), dtype=np.int64)
+    if len(uniques) > 1:
+        starts[1:] = np.cumsum(counts)[:-1]
+    return MasterJoinTable(
+        frame=frame,
+        key_columns=key_columns,
+        key_index=pd.Index(uniques),
+        row_order=np.argsort(codes, kind="stable"),
+        group_starts=starts,
+        group_counts=counts,
+    )
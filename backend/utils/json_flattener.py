@@ -0,0 +1,269 @@
+"""
+Iterative JSON flattener for OCR results, emitting straight into columnar buffers.
+
+The original flatteners in excel_converter recursed with fresh dict copies at
+every level and expanded sibling arrays as a Cartesian product: an invoice with
+40 line items and 30 charges became 1,200 rows of mostly duplicated data. This
+flattener walks the document once with an explicit stack and:
+
+- keeps each object level as one shared fragment (a dict of its scalar fields)
+  instead of copying parent fields into every child level;
+- stacks sibling arrays instead of multiplying them: every array element appears
+  in exactly one row, with the parent's fields broadcast onto it. When at most
+  one array per level yields several rows, the output is identical to the
+  previous functions (same rows, columns, column order and precedence);
+- optionally only explodes the arrays named in `row_axes` (see
+  row_axes_from_schema); other arrays of objects stay as a single cell value;
+- merges fragments directly into per-column lists, so a DataFrame is built from
+  columns rather than from a list of per-row dicts.
+
+Columns are named by leaf key without parent path, as deep_flatten_json_universal
+and flatten_json_recursive always did. (ultra_deep_flatten_json keeps its own
+recursive implementation and path-based naming.)
+
+Row axes are dotted property names through objects and array items
+("statement.charges", "line_items.sub_items"). row_axes_from_schema derives
+them from a document type's OCR schema: every array of objects it declares.
+Without row axes, every array of objects is a row axis.
+"""
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import pandas as pd
+
+# A row is the sequence of fragments (one per contributing object level); later fragments win on key clashes
+Row = Tuple[Dict[str, Any], ...]
+
+_MISSING = float("nan")
+_EXPAND = "expand"
+_COMBINE = "combine"
+
+
+def _merge(fragments: Row) -> Dict[str, Any]:
+    """One fragment equivalent to applying fragments in order (fragments are never mutated)."""
+    if len(fragments) == 1:
+        return fragments[0]
+    merged = dict(fragments[0])
+    for fragment in fragments[1:]:
+        merged.update(fragment)
+    return merged
+
+
+class JsonFlattener:
+    """Flatten nested JSON into rows; one instance can be reused for many documents."""
+
+    def __init__(
+        self,
+        row_axes: Optional[Iterable[str]] = None,
+        expand_objects: bool = True,
+        sep: str = ".",
+        scalar_key: Optional[str] = "value",
+    ):
+        """
+        Args:
+            row_axes: Dotted paths of the arrays to explode into rows (None = every array of objects).
+            expand_objects: Flatten nested objects into columns (False keeps them as cell values).
+            sep: Separator for dotted paths.
+            scalar_key: Column for scalar top-level values (None drops them).
+        """
+        self.row_axes = set(row_axes) if row_axes is not None else None
+        self.expand_objects = expand_objects
+        self.sep = sep
+        self.scalar_key = scalar_key
+
+    def _split(self, node: Dict[str, Any], path: str) -> Tuple[Dict[str, Any], List[Tuple[str, List[Any]]]]:
+        """Scalar fields of one object level and its exploding children as (path, items)."""
+        children: List[Tuple[str, List[Any]]] = []
+        exploded: List[Any] = []
+        row_axes = self.row_axes
+        # Paths are only needed to look up row axes
+        track_paths = row_axes is not None
+        sep = self.sep
+        for name, value in node.items():
+            if isinstance(value, dict):
+                if not self.expand_objects:
+                    continue
+                child = [value]
+            elif isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+                child = value
+            else:
+                continue
+            child_path = (f"{path}{sep}{name}" if path else str(name)) if track_paths else ""
+            if child is value and row_axes is not None and child_path not in row_axes:
+                continue
+            children.append((child_path, child))
+            exploded.append(name)
+
+        if not children:
+            fields = node  # Fragments are never mutated, so a leaf object is its own fragment
+        else:
+            fields = {name: value for name, value in node.items() if name not in exploded}
+        return fields, children
+
+    def iter_document_rows(self, data: Any) -> Iterator[List[Row]]:
+        """Rows of each top-level document in turn (nested top-level lists are walked in order)."""
+        pending = [data]
+        while pending:
+            node = pending.pop()
+            if isinstance(node, list):
+                pending.extend(reversed(node))
+            elif isinstance(node, dict):
+                yield self._document_rows(node)
+            elif self.scalar_key is not None:
+                yield [({self.scalar_key: node},)]
+
+    def rows(self, data: Any) -> List[Row]:
+        """Rows of data as fragment tuples (see Row)."""
+        return [row for rows in self.iter_document_rows(data) for row in rows]
+
+    def _document_rows(self, document: Dict[str, Any]) -> List[Row]:
+        # Each object's rows are written into a slot owned by its parent. Stack frames
+        # either expand an object (visit its children) or combine it once all its
+        # children's slots are filled (post-order). Children without exploding
+        # children of their own are resolved on the spot and never reach the stack.
+        result: List[Optional[List[Row]]] = [None]
+        stack: List[Tuple] = []
+        fields, children = self._split(document, "")
+        if not children:
+            return [(fields,)]
+        self._expand(fields, children, result, 0, stack)
+        while stack:
+            frame = stack.pop()
+            if frame[0] is _COMBINE:
+                _, fields, slots, target, index = frame
+                target[index] = self._combine(fields, slots)
+            else:
+                _, fields, children, target, index = frame
+                self._expand(fields, children, target, index, stack)
+        return result[0]
+
+    def _expand(
+        self,
+        fields: Dict[str, Any],
+        children: List[Tuple[str, List[Any]]],
+        target: List[Any],
+        index: int,
+        stack: List[Tuple],
+    ) -> None:
+        slots: List[List[Optional[List[Row]]]] = []
+        pending: List[Tuple] = []
+        for child_path, items in children:
+            child_slots: List[Optional[List[Row]]] = [None] * len(items)
+            for position, item in enumerate(items):
+                child_fields, grandchildren = self._split(item, child_path)
+                if grandchildren:
+                    pending.append((_EXPAND, child_fields, grandchildren, child_slots, position))
+                else:
+                    child_slots[position] = [(child_fields,)]
+            slots.append(child_slots)
+        if not pending:
+            target[index] = self._combine(fields, slots)
+            return
+        stack.append((_COMBINE, fields, slots, target, index))
+        stack.extend(reversed(pending))
+
+    @staticmethod
+    def _combine(fields: Dict[str, Any], slots: List[List[List[Row]]]) -> List[Row]:
+        head: Row = (fields,)
+        child_rows: List[List[Row]] = [
+            item_rows[0] if len(item_rows) == 1 else [row for rows in item_rows for row in rows]
+            for item_rows in slots
+        ]
+
+        # Children with one row are broadcast onto every row of this level. Single-row
+        # levels are merged into one fragment here, once per object, so rows stay short.
+        multi = [index for index, rows in enumerate(child_rows) if len(rows) > 1]
+        if not multi:
+            # fields was built by _split for this object alone (it has children), so it can absorb them
+            for rows in child_rows:
+                for fragment in rows[0]:
+                    fields.update(fragment)
+            return [(fields,)]
+
+        result: List[Row] = []
+        for axis in multi:
+            prefix = (_merge(head + tuple(
+                fragment for rows in child_rows[:axis] if len(rows) == 1 for fragment in rows[0]
+            )),)
+            after = tuple(fragment for rows in child_rows[axis + 1:] if len(rows) == 1 for fragment in rows[0])
+            if after:
+                after = (_merge(after),)
+                result.extend(prefix + row + after for row in child_rows[axis])
+            else:
+                result.extend(prefix + row for row in child_rows[axis])
+        return result
+
+    def records(self, data: Any) -> List[Dict[str, Any]]:
+        """Rows of data as flat dicts."""
+        records: List[Dict[str, Any]] = []
+        for rows in self.iter_document_rows(data):
+            for row in rows:
+                if len(row) == 1:
+                    records.append(dict(row[0]))
+                elif len(row) == 2:
+                    records.append({**row[0], **row[1]})
+                else:
+                    records.append(_merge(row))
+        return records
+
+    def columns(self, data: Any) -> Tuple[Dict[str, List[Any]], int]:
+        """Rows of data as column lists (missing cells are NaN) and the row count."""
+        columns: Dict[str, List[Any]] = {}
+        total = 0
+        for rows in self.iter_document_rows(data):
+            # Columns are filled one document at a time; cells a document leaves empty are NaN
+            start = total
+            total += len(rows)
+            for column in columns.values():
+                column.extend([_MISSING] * len(rows))
+            for index, row in enumerate(rows, start):
+                for fragment in row:
+                    for name, value in fragment.items():
+                        column = columns.get(name)
+                        if column is None:
+                            column = columns[name] = [_MISSING] * total
+                        column[index] = value  # later fragments win, as with dict.update
+        return columns, total
+
+    def frame(self, data: Any) -> pd.DataFrame:
+        """Rows of data as a DataFrame built column-wise."""
+        columns, total = self.columns(data)
+        if not columns:
+            return pd.DataFrame(index=range(total), columns=pd.Index([]))
+        return pd.DataFrame(columns)
+
+
+def _schema_types(node: Dict[str, Any]) -> Set[str]:
+    declared = node.get("type")
+    if isinstance(declared, str):
+        return {declared.lower()}
+    if isinstance(declared, list):
+        return {str(name).lower() for name in declared}
+    return {"object"} if isinstance(node.get("properties"), dict) else set()
+
+
+def row_axes_from_schema(schema: Dict[str, Any], sep: str = ".") -> Set[str]:
+    """Dotted paths of the arrays of objects declared in a JSON schema (row axes for JsonFlattener)."""
+    axes: Set[str] = set()
+    if "array" in _schema_types(schema) and isinstance(schema.get("items"), dict):
+        schema = schema["items"]  # Top-level lists are flattened document by document
+    pending: List[Tuple[Dict[str, Any], str]] = [(schema, "")]
+    while pending:
+        node, path = pending.pop()
+        properties = node.get("properties")
+        if not isinstance(properties, dict):
+            continue
+        for name, prop in properties.items():
+            if not isinstance(prop, dict):
+                continue
+            prop_path = f"{path}{sep}{name}" if path else str(name)
+            types = _schema_types(prop)
+            if "array" in types:
+                items = prop.get("items")
+                if isinstance(items, dict) and "object" in _schema_types(items):
+                    axes.add(prop_path)
+                    # Item properties share the array's path, as in JsonFlattener
+                    pending.append((items, prop_path))
+            elif "object" in types:
+                pending.append((prop, prop_path))
+    return axes
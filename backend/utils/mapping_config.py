@@ -79,6 +79,14 @@ class BaseMappingConfig(BaseModel):
         default=None,
         description="Suffix for conflicting column names from master CSV (default '_master')",
     )
+    master_columns: Optional[List[str]] = Field(
+        default=None,
+        description="Master CSV columns to load and append besides the join keys (default: all columns)",
+    )
+    master_dtypes: Optional[Dict[str, str]] = Field(
+        default=None,
+        description="Explicit pandas dtypes for master CSV columns, e.g. {'account_no': 'str'}",
+    )
     join_normalize: Optional[dict] = Field(
         default=None,
         description="Join value normalization options: {strip_non_digits: bool, zfill: int | {key: int}}",
@@ -192,6 +200,20 @@ def normalise_mapping_config(
     if ms is not None and (not isinstance(ms, str) or len(ms) > 32):
         raise ValueError("merge_suffix must be a short string (<=32 chars)")
 
+    # Validate master_columns / master_dtypes
+    mc = data.get("master_columns")
+    if mc is not None and any(not isinstance(col, str) or not col.strip() for col in mc):
+        raise ValueError("master_columns must be a list of non-empty column names")
+    md = data.get("master_dtypes")
+    if md is not None:
+        from pandas.api.types import pandas_dtype
+
+        for col, dtype in md.items():
+            try:
+                pandas_dtype(dtype)
+            except TypeError as exc:
+                raise ValueError(f"master_dtypes['{col}'] is not a valid dtype: {dtype}") from exc
+
     return data
 
 
@@ -0,0 +1,275 @@
+"""
+Process-wide cache for parsed master CSV/Excel files.
+
+A new OrderProcessor is created for every order, so a per-instance cache never
+survived between mapping runs and every run re-downloaded and re-parsed the
+master file. This cache lives for the whole process and is keyed by master path.
+
+Each entry stores a version token (S3 ETag, OneDrive eTag or last-modified).
+After MASTER_CACHE_REVALIDATE_SECONDS the token is re-checked with a cheap
+metadata request; the file is only downloaded and parsed again when the token
+changed. If the metadata request fails, the cached frame keeps being served.
+
+Cached frames are shared between orders and must be treated as read-only;
+callers get a shallow copy so adding columns never touches the shared frame.
+Structures derived from a frame (e.g. normalized, indexed join keys) can be
+stored on its entry with `derived()`; they are dropped with the entry when the
+master file changes.
+
+Configuration (environment):
+- MASTER_CACHE_REVALIDATE_SECONDS: seconds between version checks (default 30, 0 = check every use)
+- MASTER_CACHE_MAX_ENTRIES:        master files kept in memory (default 16, 0 = disable caching)
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# loader() -> (frame, version token observed at download time)
+MasterLoader = Callable[[], Tuple[pd.DataFrame, Optional[str]]]
+# probe() -> current version token, or None when it cannot be determined
+VersionProbe = Callable[[], Optional[str]]
+
+
+@dataclass
+class MasterCacheEntry:
+    frame: pd.DataFrame
+    version: Optional[str]
+    loaded_at: float
+    checked_at: float
+    load_seconds: float
+    hits: int = 0
+    derived: Dict[Any, Any] = field(default_factory=dict)
+    derived_seconds: float = 0.0
+    derived_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+
+class MasterDataCache:
+    """LRU cache of parsed master frames with version-token revalidation."""
+
+    def __init__(self, max_entries: int = 16, revalidate_seconds: float = 30.0):
+        self.max_entries = max(0, max_entries)
+        self.revalidate_seconds = max(0.0, revalidate_seconds)
+
+        self._entries: "OrderedDict[str, MasterCacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per path so concurrent orders wait for a single download instead of all loading
+        self._path_locks: Dict[str, threading.Lock] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.reloads = 0
+        self.probe_failures = 0
+        self.total_load_seconds = 0.0
+        self.derived_hits = 0
+        self.derived_builds = 0
+
+    def _path_lock(self, path: str) -> threading.Lock:
+        with self._lock:
+            lock = self._path_locks.get(path)
+            if lock is None:
+                lock = self._path_locks[path] = threading.Lock()
+            return lock
+
+    def _lookup(self, path: str) -> Optional[MasterCacheEntry]:
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                self._entries.move_to_end(path)
+            return entry
+
+    def _store(self, path: str, entry: MasterCacheEntry) -> None:
+        with self._lock:
+            self._entries[path] = entry
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                logger.info(f"🧹 Master cache evicted {evicted}")
+
+    def _record_hit(self, entry: MasterCacheEntry) -> pd.DataFrame:
+        with self._lock:
+            self.hits += 1
+            entry.hits += 1
+        return entry.frame
+
+    def _load(self, path: str, loader: MasterLoader, reload: bool) -> MasterCacheEntry:
+        start = time.monotonic()
+        frame, version = loader()
+        elapsed = time.monotonic() - start
+        now = time.monotonic()
+        entry = MasterCacheEntry(frame=frame, version=version, loaded_at=now, checked_at=now, load_seconds=elapsed)
+        with self._lock:
+            self.total_load_seconds += elapsed
+            if reload:
+                self.reloads += 1
+            else:
+                self.misses += 1
+        logger.info(
+            f"📥 Master file {'reloaded' if reload else 'loaded'}: {path} "
+            f"({len(frame):,} rows, {elapsed:.2f}s, version={version})"
+        )
+        return entry
+
+    def get_entry(self, path: str, loader: MasterLoader, probe: Optional[VersionProbe] = None) -> MasterCacheEntry:
+        """Return the cache entry for path, loading or revalidating it as needed."""
+        if self.max_entries == 0:
+            return self._load(path, loader, reload=False)
+
+        entry = self._lookup(path)
+        if entry is not None and time.monotonic() - entry.checked_at < self.revalidate_seconds:
+            self._record_hit(entry)
+            return entry
+
+        with self._path_lock(path):
+            # Another thread may have loaded/revalidated while we waited
+            entry = self._lookup(path)
+            if entry is not None and time.monotonic() - entry.checked_at < self.revalidate_seconds:
+                self._record_hit(entry)
+                return entry
+
+            if entry is not None:
+                current = None
+                if probe is not None:
+                    try:
+                        current = probe()
+                    except Exception as e:
+                        logger.warning(f"⚠️ Master version check failed for {path}: {e}")
+                with self._lock:
+                    self.revalidations += 1
+                if current is None:
+                    with self._lock:
+                        self.probe_failures += 1
+                    if entry.version is not None:
+                        # Metadata unavailable: keep serving the cached frame rather than re-downloading
+                        entry.checked_at = time.monotonic()
+                        self._record_hit(entry)
+                        return entry
+                elif current == entry.version:
+                    entry.checked_at = time.monotonic()
+                    self._record_hit(entry)
+                    return entry
+
+            entry = self._load(path, loader, reload=entry is not None)
+            self._store(path, entry)
+            return entry
+
+    def version(self, path: str, probe: VersionProbe) -> Optional[str]:
+        """Current version token for path without loading the file.
+
+        Answers from the cached entry while it is fresh; otherwise probes (and
+        marks the entry fresh again when the version is unchanged).
+        """
+        entry = self._lookup(path)
+        if entry is not None and time.monotonic() - entry.checked_at < self.revalidate_seconds:
+            return entry.version
+        try:
+            current = probe()
+        except Exception as e:
+            logger.warning(f"⚠️ Master version check failed for {path}: {e}")
+            return None
+        if entry is not None and current is not None and current == entry.version:
+            entry.checked_at = time.monotonic()
+        return current
+
+    def get(self, path: str, loader: MasterLoader, probe: Optional[VersionProbe] = None) -> pd.DataFrame:
+        """Return a shallow copy of the cached frame for path.
+
+        The copy shares column data with the cached frame, so callers may add
+        or drop columns freely but must not modify values in place.
+        """
+        return self.get_entry(path, loader, probe).frame.copy(deep=False)
+
+    def derived(self, entry: MasterCacheEntry, key: Any, builder: Callable[[pd.DataFrame], Any]) -> Any:
+        """Return builder(entry.frame), computed once per entry and key."""
+        with self._lock:
+            if key in entry.derived:
+                self.derived_hits += 1
+                return entry.derived[key]
+
+        # Build under the entry's own lock so concurrent orders wait for one build
+        with entry.derived_lock:
+            if key in entry.derived:
+                return entry.derived[key]
+            start = time.monotonic()
+            value = builder(entry.frame)
+            elapsed = time.monotonic() - start
+            with self._lock:
+                entry.derived[key] = value
+                entry.derived_seconds += elapsed
+                self.derived_builds += 1
+            return value
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        """Drop one path (or everything) so the next use reloads it."""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.reloads
+            loads = self.misses + self.reloads
+            return {
+                "max_entries": self.max_entries,
+                "revalidate_seconds": self.revalidate_seconds,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "revalidations": self.revalidations,
+                "probe_failures": self.probe_failures,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "total_load_seconds": round(self.total_load_seconds, 3),
+                "avg_load_seconds": round(self.total_load_seconds / loads, 3) if loads else 0.0,
+                "derived_hits": self.derived_hits,
+                "derived_builds": self.derived_builds,
+                "files": [
+                    {
+                        "path": path,
+                        "version": entry.version,
+                        "rows": int(len(entry.frame)),
+                        "columns": int(len(entry.frame.columns)),
+                        "hits": entry.hits,
+                        "load_seconds": round(entry.load_seconds, 3),
+                        "derived": len(entry.derived),
+                        "derived_seconds": round(entry.derived_seconds, 3),
+                        "age_seconds": round(time.monotonic() - entry.loaded_at, 1),
+                    }
+                    for path, entry in self._entries.items()
+                ],
+            }
+
+
+# 全局主數據緩存實例
+_master_data_cache = None
+_master_data_cache_lock = threading.Lock()
+
+
+def get_master_data_cache() -> MasterDataCache:
+    """獲取全局主數據緩存實例"""
+    global _master_data_cache
+
+    if _master_data_cache is None:
+        with _master_data_cache_lock:
+            if _master_data_cache is None:
+                _master_data_cache = MasterDataCache(
+                    max_entries=int(os.getenv("MASTER_CACHE_MAX_ENTRIES", "16")),
+                    revalidate_seconds=float(os.getenv("MASTER_CACHE_REVALIDATE_SECONDS", "30")),
+                )
+                logger.info(
+                    f"✅ Master data cache initialised: max_entries={_master_data_cache.max_entries}, "
+                    f"revalidate={_master_data_cache.revalidate_seconds}s"
+                )
+
+    return _master_data_cache
@@ -0,0 +1,224 @@
+"""
+Column-pruned, typed parsing of master CSV/Excel files with a Parquet sidecar.
+
+Master files are often wide (dozens of columns), while a mapping only joins on
+a few keys and appends a handful of columns. A mapping config can name the
+master columns it needs (`master_columns`) and their dtypes (`master_dtypes`);
+only those columns are then parsed and kept in memory. Without
+`master_columns` the whole file is loaded as before.
+
+When pyarrow is installed, the first parse of a master version also writes the
+full parsed frame to a Parquet sidecar in S3, keyed by master path, version
+token and dtypes (dtypes are applied while parsing, so they are part of the
+stored data). Later loads of the same version (other processes, restarts, other column
+sets) read just the needed columns from the sidecar instead of parsing CSV/Excel.
+A changed master file has a new version token, so a stale sidecar is never read.
+Sidecars are stored as master_cache/<path>/<version>/<dtypes>.parquet; after a
+new version's sidecar is written, the other versions of that path are deleted.
+
+Parquet cannot store an object column mixing value types (e.g. `[1234,
+"1,234.00"]` from flattened OCR output). frame_to_parquet stores such columns
+as JSON-encoded strings and lists them in the file's schema metadata;
+read_parquet_sidecar decodes them back to their original values.
+
+Configuration (environment):
+- MASTER_PARQUET_SIDECAR: write/read Parquet sidecars when pyarrow is available (default true)
+"""
+
+import hashlib
+import json
+import logging
+import os
+from io import BytesIO
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    pa = None
+    pq = None
+    PARQUET_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+EXCEL_EXTENSIONS = {".xlsx", ".xls"}
+SIDECAR_PREFIX = "master_cache"
+# Schema metadata key listing the columns stored as JSON-encoded strings
+MIXED_COLUMNS_METADATA_KEY = b"kh_mixed_json_columns"
+
+
+def sidecar_enabled() -> bool:
+    return PARQUET_AVAILABLE and os.getenv("MASTER_PARQUET_SIDECAR", "true").lower() in ("1", "true", "yes")
+
+
+def master_projection(mapping_config: Optional[Dict[str, Any]]) -> Tuple[Optional[Tuple[str, ...]], Dict[str, str]]:
+    """Master columns (None = all) and dtypes a mapping config needs.
+
+    The join columns (external_join_keys through column_aliases) are always
+    included when the config restricts columns.
+    """
+    if not isinstance(mapping_config, dict):
+        return None, {}
+
+    dtypes = mapping_config.get("master_dtypes") or {}
+    dtypes = {str(col): str(dtype) for col, dtype in dtypes.items()} if isinstance(dtypes, dict) else {}
+
+    wanted = mapping_config.get("master_columns")
+    if not wanted:
+        return None, dtypes
+
+    aliases = mapping_config.get("column_aliases") or {}
+    columns: List[str] = []
+    for key in mapping_config.get("external_join_keys") or []:
+        columns.append(aliases.get(key, key))
+    columns.extend(str(col) for col in wanted)
+    return tuple(dict.fromkeys(columns)), dtypes
+
+
+def master_cache_key(path: str, columns: Optional[Iterable[str]], dtypes: Optional[Dict[str, str]]) -> str:
+    """Master cache key: the path for full frames, path + projection digest otherwise."""
+    if columns is None and not dtypes:
+        return path
+    spec = json.dumps({"columns": list(columns) if columns is not None else None, "dtypes": dtypes or {}}, sort_keys=True)
+    return f"{path}#{hashlib.sha1(spec.encode('utf-8')).hexdigest()[:12]}"
+
+
+def sidecar_path_prefix(path: str) -> str:
+    """S3 prefix holding every sidecar of one master path."""
+    return f"{SIDECAR_PREFIX}/{hashlib.sha256(path.encode('utf-8')).hexdigest()[:24]}/"
+
+
+def sidecar_version_prefix(path: str, version: str) -> str:
+    """S3 prefix holding the sidecars of one master version (one file per dtypes spec)."""
+    version_digest = hashlib.sha256(str(version).encode("utf-8")).hexdigest()[:24]
+    return f"{sidecar_path_prefix(path)}{version_digest}/"
+
+
+def sidecar_key(path: str, version: str, dtypes: Optional[Dict[str, str]] = None) -> str:
+    dtypes_digest = hashlib.sha256(json.dumps(dtypes or {}, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+    return f"{sidecar_version_prefix(path, version)}{dtypes_digest}.parquet"
+
+
+def stale_sidecar_keys(path: str, version: str, keys: Iterable[str]) -> List[str]:
+    """Sidecar keys of `path` (as listed under sidecar_path_prefix) that belong to other versions."""
+    current = sidecar_version_prefix(path, version)
+    return [key for key in keys if key.startswith(sidecar_path_prefix(path)) and not key.startswith(current)]
+
+
+def _strip(name: Any) -> Any:
+    return name.strip() if isinstance(name, str) else name
+
+
+def parse_master_bytes(
+    content: bytes,
+    extension: str,
+    columns: Optional[Iterable[str]] = None,
+    dtypes: Optional[Dict[str, str]] = None,
+) -> pd.DataFrame:
+    """Parse a master CSV/Excel file, reading only `columns` (stripped names) when given."""
+    wanted = set(columns) if columns is not None else None
+    usecols = (lambda name: _strip(name) in wanted) if wanted is not None else None
+
+    if extension in EXCEL_EXTENSIONS:
+        # Excel headers are matched by name as written (header whitespace is rare there)
+        df = pd.read_excel(BytesIO(content), usecols=usecols, dtype=dtypes or None)
+    else:
+        raw_dtypes = None
+        if dtypes:
+            # dtype= needs the raw header names; reading only the header is cheap
+            header = pd.read_csv(BytesIO(content), nrows=0).columns
+            raw_dtypes = {raw: dtypes[_strip(raw)] for raw in header if _strip(raw) in dtypes}
+        df = pd.read_csv(BytesIO(content), usecols=usecols, dtype=raw_dtypes)
+
+    df.columns = [_strip(col) for col in df.columns]
+    return df
+
+
+def project_master_frame(df: pd.DataFrame, columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """Keep `columns` of an already parsed frame, in file order."""
+    if columns is None:
+        return df
+    wanted = set(columns)
+    return df.loc[:, [col in wanted for col in df.columns]]
+
+
+def _mixed_object_columns(df: pd.DataFrame) -> List[int]:
+    """Positions of object columns Arrow cannot convert (values of mixed types)."""
+    mixed = []
+    for pos, dtype in enumerate(df.dtypes):
+        if dtype != object:
+            continue
+        try:
+            pa.array(df.iloc[:, pos], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            mixed.append(pos)
+    return mixed
+
+
+def _encode_cell(value: Any) -> Optional[str]:
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or value is pd.NA or value is pd.NaT or (isinstance(value, float) and value != value):
+        return None
+    # JSON keeps 1234 and "1234" apart; non-JSON values (timestamps etc.) fall back to str
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def _write_parquet(df: pd.DataFrame, mixed_columns: Optional[List[str]] = None) -> bytes:
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if mixed_columns:
+        metadata = dict(table.schema.metadata or {})
+        metadata[MIXED_COLUMNS_METADATA_KEY] = json.dumps(mixed_columns).encode("utf-8")
+        table = table.replace_schema_metadata(metadata)
+    buffer = BytesIO()
+    pq.write_table(table, buffer)
+    return buffer.getvalue()
+
+
+def frame_to_parquet(df: pd.DataFrame) -> Optional[bytes]:
+    """Serialize a parsed frame (master sidecar, cached mapped frame); None if it cannot round-trip."""
+    if not PARQUET_AVAILABLE:
+        return None
+    try:
+        try:
+            return _write_parquet(df)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            mixed = _mixed_object_columns(df)
+            if not mixed:
+                raise
+        encoded = df.copy(deep=False)
+        for pos in mixed:
+            encoded.isetitem(pos, pd.Series([_encode_cell(v) for v in df.iloc[:, pos]], index=df.index, dtype=object))
+        names = [str(df.columns[pos]) for pos in mixed]
+        logger.info(f"ℹ️ Storing mixed-type columns as JSON strings: {names}")
+        return _write_parquet(encoded, names)
+    except Exception as exc:
+        # e.g. non-string or duplicate headers from Excel
+        logger.warning(f"⚠️ Frame not stored as Parquet: {exc}")
+        return None
+
+
+def read_parquet_sidecar(content: bytes, columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """Read `columns` (all when None) from a sidecar written by frame_to_parquet."""
+    schema = pq.ParquetFile(BytesIO(content)).schema_arrow
+    selected = None
+    if columns is not None:
+        wanted = set(columns)
+        selected = [name for name in schema.names if name in wanted]
+    df = pd.read_parquet(BytesIO(content), columns=selected)
+    # Arrow returns None for missing strings; CSV/Excel parsing gives NaN
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].where(df[col].notna(), np.nan)
+
+    mixed = json.loads((schema.metadata or {}).get(MIXED_COLUMNS_METADATA_KEY, b"[]"))
+    for col in mixed:
+        if col in df.columns:
+            df[col] = pd.Series(
+                [json.loads(v) if isinstance(v, str) else np.nan for v in df[col]], index=df.index, dtype=object
+            )
+    return df
@@ -0,0 +1,390 @@
+"""
+Pluggable OCR model backends.
+
+`extract_text_from_image_bytes` / `extract_text_from_pdf_bytes` build the prompt
+and contents, then hand the actual model call to the active backend:
+
+- gemini: the real API, using handles from the Gemini model pool
+- replay: serves recorded responses offline with a configurable latency
+  distribution and injected 429 / timeout errors, so concurrency, retry and
+  key-rotation changes can be benchmarked without network access
+- record: wraps gemini and writes every response to the replay directory
+
+Backends return a response object exposing `.text` and
+`.usage_metadata.prompt_token_count / candidates_token_count`, matching
+google.generativeai's GenerateContentResponse.
+
+Configuration (environment):
+- OCR_BACKEND:                gemini | replay | record (default gemini)
+- OCR_REPLAY_DIR:             recordings directory (default uploads/ocr_replay)
+- OCR_REPLAY_LATENCY:         fixed:S | uniform:LO,HI | normal:MU,SIGMA | lognormal:MEDIAN,SIGMA | recorded
+                              (default recorded)
+- OCR_REPLAY_429_RATE:        probability of an injected 429 per call (default 0)
+- OCR_REPLAY_TIMEOUT_RATE:    probability of an injected timeout per call (default 0)
+- OCR_REPLAY_TIMEOUT_SECONDS: latency before an injected timeout is raised (default 30)
+- OCR_REPLAY_RPM_PER_KEY:     emulate a per-key RPM limit with real 429s (default 0 = off)
+- OCR_REPLAY_SEED:            RNG seed for reproducible runs (default 0)
+- OCR_REPLAY_MISSING:         synthetic | error, behaviour for unrecorded requests (default synthetic)
+"""
+
+import abc
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _UsageMetadata:
+    __slots__ = ("prompt_token_count", "candidates_token_count")
+
+    def __init__(self, prompt_token_count: int = 0, candidates_token_count: int = 0):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+    def __repr__(self) -> str:
+        return (
+            f"prompt_token_count: {self.prompt_token_count}\n"
+            f"candidates_token_count: {self.candidates_token_count}"
+        )
+
+
+class OcrResponse:
+    """Minimal stand-in for GenerateContentResponse."""
+
+    def __init__(self, text: str, input_tokens: int = 0, output_tokens: int = 0):
+        self.text = text
+        self.usage_metadata = _UsageMetadata(input_tokens, output_tokens)
+
+
+def recording_key(source_bytes: bytes, prompt: str, response_schema: Any) -> str:
+    """Stable key of one OCR request (schema-less fallbacks record separately)."""
+    digest = hashlib.sha256()
+    digest.update(hashlib.sha256(source_bytes or b"").digest())
+    digest.update(hashlib.sha256((prompt or "").encode("utf-8")).digest())
+    schema_repr = json.dumps(response_schema, sort_keys=True, default=str) if response_schema is not None else ""
+    digest.update(hashlib.sha256(schema_repr.encode("utf-8")).digest())
+    return digest.hexdigest()
+
+
+class OcrBackend(abc.ABC):
+    """Interface for the model call behind the extract functions."""
+
+    name = "base"
+
+    @abc.abstractmethod
+    async def generate_content(
+        self,
+        api_key: str,
+        model_name: str,
+        contents: list,
+        generation_config: Any,
+        source_bytes: bytes,
+        prompt: str,
+        response_schema: Any = None,
+    ) -> Any:
+        """Run one model call and return a GenerateContentResponse-like object."""
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class GeminiBackend(OcrBackend):
+    """Real Gemini calls through per-key pooled model handles."""
+
+    name = "gemini"
+
+    async def generate_content(
+        self,
+        api_key: str,
+        model_name: str,
+        contents: list,
+        generation_config: Any,
+        source_bytes: bytes,
+        prompt: str,
+        response_schema: Any = None,
+    ) -> Any:
+        from utils.gemini_model_pool import DEFAULT_GENERATION_CONFIG, get_gemini_model_pool
+
+        # 從模型池取得綁定此 API key 的模型（不修改全局 genai 配置）
+        with get_gemini_model_pool().checkout(api_key, model_name, DEFAULT_GENERATION_CONFIG) as model:
+            # Use asyncio.to_thread to run the blocking API call in a separate thread
+            return await asyncio.to_thread(
+                model.generate_content,
+                contents=contents,
+                generation_config=generation_config,
+            )
+
+
+class LatencyModel:
+    """Samples call latency from a configured distribution."""
+
+    def __init__(self, spec: str = "recorded", seed: int = 0):
+        self.spec = (spec or "recorded").strip().lower()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        kind, _, params = self.spec.partition(":")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p.strip()] if params else []
+        if kind not in ("fixed", "uniform", "normal", "lognormal", "recorded"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self, recorded: Optional[float] = None) -> float:
+        with self._lock:
+            if self.kind == "fixed":
+                return self.params[0]
+            if self.kind == "uniform":
+                return self._rng.uniform(self.params[0], self.params[1])
+            if self.kind == "normal":
+                return max(0.0, self._rng.gauss(self.params[0], self.params[1]))
+            if self.kind == "lognormal":
+                median, sigma = self.params[0], self.params[1]
+                return self._rng.lognormvariate(math.log(median), sigma)
+        return recorded or 0.0
+
+    def chance(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self._rng.random() < rate
+
+
+class ReplayBackend(OcrBackend):
+    """Serves recorded responses offline with injected latency and failures."""
+
+    name = "replay"
+
+    def __init__(
+        self,
+        replay_dir: str = "uploads/ocr_replay",
+        latency: str = "recorded",
+        rate_429: float = 0.0,
+        timeout_rate: float = 0.0,
+        timeout_seconds: float = 30.0,
+        rpm_per_key: int = 0,
+        seed: int = 0,
+        missing: str = "synthetic",
+    ):
+        self.replay_dir = replay_dir
+        self.latency = LatencyModel(latency, seed)
+        self.rate_429 = rate_429
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        self.rpm_per_key = rpm_per_key
+        self.missing = missing
+
+        self._lock = threading.Lock()
+        self._recordings: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._key_windows: Dict[str, Deque[float]] = {}
+        self.calls = 0
+        self.replayed = 0
+        self.synthetic = 0
+        self.injected_429 = 0
+        self.injected_timeouts = 0
+        self.rpm_429 = 0
+        self.calls_by_key: Dict[str, int] = {}
+
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key in self._recordings:
+                return self._recordings[key]
+        path = os.path.join(self.replay_dir, f"{key}.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                recording = json.load(f)
+        except FileNotFoundError:
+            recording = None
+        with self._lock:
+            self._recordings[key] = recording
+        return recording
+
+    def _over_rpm(self, api_key: str) -> bool:
+        if not self.rpm_per_key:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            window = self._key_windows.setdefault(api_key, deque())
+            while window and window[0] <= now - 60.0:
+                window.popleft()
+            if len(window) >= self.rpm_per_key:
+                return True
+            window.append(now)
+            return False
+
+    async def generate_content(
+        self,
+        api_key: str,
+        model_name: str,
+        contents: list,
+        generation_config: Any,
+        source_bytes: bytes,
+        prompt: str,
+        response_schema: Any = None,
+    ) -> Any:
+        with self._lock:
+            self.calls += 1
+            short_key = (api_key or "")[:8]
+            self.calls_by_key[short_key] = self.calls_by_key.get(short_key, 0) + 1
+
+        if self._over_rpm(api_key):
+            with self._lock:
+                self.rpm_429 += 1
+            await asyncio.sleep(0.05)
+            raise RuntimeError("429 Resource has been exhausted (e.g. check quota). [replay: per-key RPM]")
+
+        if self.latency.chance(self.rate_429):
+            with self._lock:
+                self.injected_429 += 1
+            await asyncio.sleep(0.05)
+            raise RuntimeError("429 Resource has been exhausted (e.g. check quota). [replay: injected]")
+
+        if self.latency.chance(self.timeout_rate):
+            with self._lock:
+                self.injected_timeouts += 1
+            await asyncio.sleep(self.timeout_seconds)
+            raise TimeoutError("504 Deadline Exceeded: request timeout [replay: injected]")
+
+        recording = self._load(recording_key(source_bytes, prompt, response_schema))
+        if recording is None:
+            if self.missing == "error":
+                raise LookupError("No recorded OCR response for this request [replay]")
+            with self._lock:
+                self.synthetic += 1
+            recording = {
+                "text": "{}",
+                "input_tokens": len(prompt or "") // 4 + 258,
+                "output_tokens": 2,
+                "latency": 0.0,
+            }
+        else:
+            with self._lock:
+                self.replayed += 1
+
+        await asyncio.sleep(self.latency.sample(recording.get("latency")))
+        return OcrResponse(
+            recording.get("text", ""),
+            int(recording.get("input_tokens") or 0),
+            int(recording.get("output_tokens") or 0),
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "latency": self.latency.spec,
+                "calls": self.calls,
+                "replayed": self.replayed,
+                "synthetic": self.synthetic,
+                "injected_429": self.injected_429,
+                "injected_timeouts": self.injected_timeouts,
+                "rpm_429": self.rpm_429,
+                "calls_by_key": dict(self.calls_by_key),
+            }
+
+
+class RecordingBackend(OcrBackend):
+    """Delegates to another backend and writes each response for later replay."""
+
+    name = "record"
+
+    def __init__(self, inner: OcrBackend, replay_dir: str = "uploads/ocr_replay"):
+        self.inner = inner
+        self.replay_dir = replay_dir
+        self.recorded = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.replay_dir, exist_ok=True)
+
+    async def generate_content(
+        self,
+        api_key: str,
+        model_name: str,
+        contents: list,
+        generation_config: Any,
+        source_bytes: bytes,
+        prompt: str,
+        response_schema: Any = None,
+    ) -> Any:
+        start = time.time()
+        response = await self.inner.generate_content(
+            api_key, model_name, contents, generation_config, source_bytes, prompt, response_schema
+        )
+        usage = getattr(response, "usage_metadata", None)
+        recording = {
+            "text": response.text,
+            "input_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+            "output_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+            "latency": time.time() - start,
+            "model_name": model_name,
+        }
+        key = recording_key(source_bytes, prompt, response_schema)
+        path = os.path.join(self.replay_dir, f"{key}.json")
+        try:
+            tmp_path = f"{path}.tmp{threading.get_ident()}"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(recording, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self.recorded += 1
+        except OSError as e:
+            logger.warning(f"⚠️ Could not write OCR recording {key[:12]}: {e}")
+        return response
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": self.name, "inner": self.inner.name, "recorded": self.recorded}
+
+
+def create_ocr_backend(kind: Optional[str] = None) -> OcrBackend:
+    """Build a backend from OCR_BACKEND / OCR_REPLAY_* settings."""
+    kind = (kind or os.getenv("OCR_BACKEND", "gemini")).lower()
+    replay_dir = os.getenv("OCR_REPLAY_DIR", os.path.join("uploads", "ocr_replay"))
+    if kind == "replay":
+        return ReplayBackend(
+            replay_dir=replay_dir,
+            latency=os.getenv("OCR_REPLAY_LATENCY", "recorded"),
+            rate_429=float(os.getenv("OCR_REPLAY_429_RATE", "0")),
+            timeout_rate=float(os.getenv("OCR_REPLAY_TIMEOUT_RATE", "0")),
+            timeout_seconds=float(os.getenv("OCR_REPLAY_TIMEOUT_SECONDS", "30")),
+            rpm_per_key=int(os.getenv("OCR_REPLAY_RPM_PER_KEY", "0")),
+            seed=int(os.getenv("OCR_REPLAY_SEED", "0")),
+            missing=os.getenv("OCR_REPLAY_MISSING", "synthetic").lower(),
+        )
+    if kind == "record":
+        return RecordingBackend(GeminiBackend(), replay_dir)
+    if kind != "gemini":
+        logger.warning(f"⚠️ Unknown OCR_BACKEND '{kind}', using gemini")
+    return GeminiBackend()
+
+
+# 全局OCR後端實例
+_ocr_backend = None
+_ocr_backend_lock = threading.Lock()
+
+
+def get_ocr_backend() -> OcrBackend:
+    """獲取全局OCR後端實例"""
+    global _ocr_backend
+
+    if _ocr_backend is None:
+        with _ocr_backend_lock:
+            if _ocr_backend is None:
+                _ocr_backend = create_ocr_backend()
+                logger.info(f"✅ OCR backend initialised: {_ocr_backend.name}")
+
+    return _ocr_backend
+
+
+def set_ocr_backend(backend: Optional[OcrBackend]) -> None:
+    """Install a backend explicitly (benchmarks); None resets to the configured default."""
+    global _ocr_backend
+
+    with _ocr_backend_lock:
+        _ocr_backend = backend
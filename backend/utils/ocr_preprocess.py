@@ -0,0 +1,262 @@
+"""
+Pre-upload compaction for OCR inputs.
+
+Phone-camera JPEGs and scanned PNGs are sent to Gemini at full resolution,
+which costs upload bytes, latency and image tiles (input tokens). This stage
+runs before the request and:
+
+- applies the EXIF orientation, then strips metadata
+- downsamples to a target DPI and/or a maximum long edge
+- optionally converts to grayscale
+- re-encodes (JPEG by default)
+- re-saves PDFs with garbage collection / deflate and empty metadata
+
+The compacted bytes are only used when they are actually smaller. Every file
+gets a report with bytes and estimated input-token savings.
+
+Configuration (environment):
+- OCR_PREPROCESS_ENABLED:  true | false (default false)
+- OCR_IMAGE_MAX_LONG_EDGE: max pixels on the long edge (default 2048, 0 = no limit)
+- OCR_IMAGE_TARGET_DPI:    downsample images scanned above this DPI (default 0 = ignore)
+- OCR_IMAGE_FORMAT:        JPEG | PNG | WEBP (default JPEG)
+- OCR_IMAGE_QUALITY:       lossy quality (default 85)
+- OCR_IMAGE_GRAYSCALE:     true | false (default false)
+- OCR_PDF_COMPACT:         true | false (default true)
+"""
+
+import io
+import logging
+import math
+import os
+import threading
+from typing import Any, Dict, Tuple
+
+try:
+    import PIL.Image
+    import PIL.ImageOps
+
+    PIL_AVAILABLE = True
+except ImportError:  # pragma: no cover - environment without Pillow
+    PIL_AVAILABLE = False
+
+try:
+    import fitz  # PyMuPDF
+
+    PYMUPDF_AVAILABLE = True
+except ImportError:  # pragma: no cover - environment without PyMuPDF
+    fitz = None
+    PYMUPDF_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}
+FORMAT_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+
+# Gemini bills images ≤384px on both sides as one tile; larger images are
+# tiled into 768x768 crops, each costing 258 tokens.
+GEMINI_TOKENS_PER_TILE = 258
+GEMINI_SMALL_IMAGE_EDGE = 384
+GEMINI_TILE_EDGE = 768
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Estimated Gemini input tokens for an image of the given size."""
+    if width <= GEMINI_SMALL_IMAGE_EDGE and height <= GEMINI_SMALL_IMAGE_EDGE:
+        return GEMINI_TOKENS_PER_TILE
+    tiles = math.ceil(width / GEMINI_TILE_EDGE) * math.ceil(height / GEMINI_TILE_EDGE)
+    return tiles * GEMINI_TOKENS_PER_TILE
+
+
+class OcrPreprocessor:
+    """Compacts images and PDFs before they are sent for OCR."""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        max_long_edge: int = 2048,
+        target_dpi: int = 0,
+        image_format: str = "JPEG",
+        quality: int = 85,
+        grayscale: bool = False,
+        compact_pdf: bool = True,
+    ):
+        self.enabled = enabled
+        self.max_long_edge = max(0, max_long_edge)
+        self.target_dpi = max(0, target_dpi)
+        self.image_format = image_format.upper() if image_format.upper() in FORMAT_EXTENSIONS else "JPEG"
+        self.quality = min(100, max(1, quality))
+        self.grayscale = grayscale
+        self.compact_pdf = compact_pdf
+
+        self._lock = threading.Lock()
+        self.files_processed = 0
+        self.files_compacted = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+        self.tokens_saved_estimate = 0
+
+    # ------------------------------------------------------------------
+    # Images
+    # ------------------------------------------------------------------
+
+    def _target_size(self, image: "PIL.Image.Image") -> Tuple[int, int]:
+        width, height = image.size
+        scale = 1.0
+
+        if self.target_dpi:
+            dpi = image.info.get("dpi")
+            source_dpi = float(dpi[0]) if isinstance(dpi, tuple) and dpi and dpi[0] else 0.0
+            if source_dpi > self.target_dpi:
+                scale = min(scale, self.target_dpi / source_dpi)
+
+        if self.max_long_edge:
+            long_edge = max(width, height)
+            if long_edge * scale > self.max_long_edge:
+                scale = self.max_long_edge / long_edge
+
+        return max(1, int(width * scale)), max(1, int(height * scale))
+
+    def _compact_image(self, data: bytes, ext: str) -> Tuple[bytes, str, Dict[str, Any]]:
+        with PIL.Image.open(io.BytesIO(data)) as source:
+            # Bake the camera orientation into the pixels before EXIF is dropped
+            image = PIL.ImageOps.exif_transpose(source)
+            original_size = image.size
+            target_size = self._target_size(image)
+            if target_size != image.size:
+                image = image.resize(target_size, PIL.Image.LANCZOS)
+
+            if self.grayscale:
+                image = image.convert("L")
+            elif self.image_format == "JPEG" and image.mode not in ("RGB", "L"):
+                # JPEG has no alpha channel; flatten onto white like a printed page
+                rgba = image.convert("RGBA")
+                background = PIL.Image.new("RGB", rgba.size, (255, 255, 255))
+                background.paste(rgba, mask=rgba.split()[-1])
+                image = background
+
+            buffer = io.BytesIO()
+            save_kwargs: Dict[str, Any] = {"optimize": True}
+            if self.image_format in ("JPEG", "WEBP"):
+                save_kwargs["quality"] = self.quality
+            # Nothing from source.info is forwarded, so EXIF/ICC/XMP are stripped
+            image.save(buffer, format=self.image_format, **save_kwargs)
+
+        tokens_before = estimate_image_tokens(*original_size)
+        tokens_after = estimate_image_tokens(*target_size)
+        report = {
+            "original_size": list(original_size),
+            "output_size": list(target_size),
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_after,
+        }
+        return buffer.getvalue(), FORMAT_EXTENSIONS[self.image_format], report
+
+    # ------------------------------------------------------------------
+    # PDFs
+    # ------------------------------------------------------------------
+
+    def _compact_pdf(self, data: bytes) -> Tuple[bytes, str, Dict[str, Any]]:
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            page_count = doc.page_count
+            doc.set_metadata({})
+            doc.del_xml_metadata()
+            output = doc.tobytes(garbage=4, deflate=True, clean=True)
+        # Gemini bills PDFs per page, so compaction saves bytes but not tokens
+        tokens = page_count * GEMINI_TOKENS_PER_TILE
+        return output, ".pdf", {"pages": page_count, "tokens_before": tokens, "tokens_after": tokens}
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def compact(self, data: bytes, file_ext: str, file_name: str = "") -> Tuple[bytes, str, Dict[str, Any]]:
+        """Return (bytes, extension, report) for an OCR input file.
+
+        The original bytes and extension are returned when preprocessing is
+        disabled, unsupported for the file type, fails, or does not shrink the file.
+        """
+        ext = (file_ext or "").lower()
+        report: Dict[str, Any] = {"file": file_name, "applied": False, "bytes_before": len(data), "bytes_after": len(data)}
+        if not self.enabled or not data:
+            return data, file_ext, report
+
+        try:
+            if ext in IMAGE_EXTENSIONS and PIL_AVAILABLE:
+                output, out_ext, details = self._compact_image(data, ext)
+            elif ext == ".pdf" and self.compact_pdf and PYMUPDF_AVAILABLE:
+                output, out_ext, details = self._compact_pdf(data)
+            else:
+                return data, file_ext, report
+        except Exception as e:
+            logger.warning(f"⚠️ OCR preprocessing skipped for {file_name or ext}: {e}")
+            return data, file_ext, report
+
+        report.update(details)
+        tokens_saved = max(0, details.get("tokens_before", 0) - details.get("tokens_after", 0))
+        applied = len(output) < len(data) or tokens_saved > 0
+        if applied:
+            report.update({"applied": True, "bytes_after": len(output), "output_ext": out_ext})
+        report["bytes_saved"] = report["bytes_before"] - report["bytes_after"]
+        report["tokens_saved_estimate"] = tokens_saved if applied else 0
+
+        with self._lock:
+            self.files_processed += 1
+            self.bytes_before += report["bytes_before"]
+            self.bytes_after += report["bytes_after"]
+            if applied:
+                self.files_compacted += 1
+                self.tokens_saved_estimate += report["tokens_saved_estimate"]
+
+        if applied:
+            logger.info(
+                f"🗜️ Compacted {file_name or ext}: {report['bytes_before']:,} → {report['bytes_after']:,} bytes, "
+                f"~{report['tokens_saved_estimate']} input tokens saved"
+            )
+            return output, out_ext, report
+        return data, file_ext, report
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "max_long_edge": self.max_long_edge,
+                "target_dpi": self.target_dpi,
+                "image_format": self.image_format,
+                "grayscale": self.grayscale,
+                "files_processed": self.files_processed,
+                "files_compacted": self.files_compacted,
+                "bytes_before": self.bytes_before,
+                "bytes_after": self.bytes_after,
+                "bytes_saved": self.bytes_before - self.bytes_after,
+                "tokens_saved_estimate": self.tokens_saved_estimate,
+            }
+
+
+# 全局OCR預處理器實例
+_ocr_preprocessor = None
+_ocr_preprocessor_lock = threading.Lock()
+
+
+def get_ocr_preprocessor() -> OcrPreprocessor:
+    """獲取全局OCR預處理器實例"""
+    global _ocr_preprocessor
+
+    if _ocr_preprocessor is None:
+        with _ocr_preprocessor_lock:
+            if _ocr_preprocessor is None:
+                _ocr_preprocessor = OcrPreprocessor(
+                    enabled=_env_bool("OCR_PREPROCESS_ENABLED", False),
+                    max_long_edge=int(os.getenv("OCR_IMAGE_MAX_LONG_EDGE", "2048")),
+                    target_dpi=int(os.getenv("OCR_IMAGE_TARGET_DPI", "0")),
+                    image_format=os.getenv("OCR_IMAGE_FORMAT", "JPEG"),
+                    quality=int(os.getenv("OCR_IMAGE_QUALITY", "85")),
+                    grayscale=_env_bool("OCR_IMAGE_GRAYSCALE", False),
+                    compact_pdf=_env_bool("OCR_PDF_COMPACT", True),
+                )
+                logger.info(f"✅ OCR preprocessor initialised: enabled={_ocr_preprocessor.enabled}")
+
+    return _ocr_preprocessor
@@ -0,0 +1,315 @@
+"""
+Content-addressed OCR result cache.
+
+Results are keyed by SHA-256 of (file bytes, prompt, schema, model name), so a
+restart-ocr, a re-upload of the same PDF or an AWB month that re-attaches the
+same invoice returns the stored Gemini response instead of paying for a new call.
+
+Configuration (environment):
+- OCR_CACHE_BACKEND:   auto | s3 | local | off   (default auto: s3 when enabled, else local)
+- OCR_CACHE_DIR:       local cache directory      (default uploads/ocr_cache)
+- OCR_CACHE_MAX_BYTES: size budget before oldest entries are evicted (default 512 MiB)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from botocore.exceptions import ClientError
+
+from .s3_storage import get_s3_manager
+
+logger = logging.getLogger(__name__)
+
+S3_CACHE_PREFIX = "cache/ocr/"
+# Run S3 eviction every N writes; listing the prefix on every put would cost more than it saves
+S3_EVICTION_INTERVAL = 50
+# Evict down to this fraction of the budget so eviction does not run on every write
+EVICTION_LOW_WATERMARK = 0.9
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_prompt(prompt: Optional[str]) -> str:
+    return _sha256((prompt or "").encode("utf-8"))
+
+
+def hash_schema(schema: Any) -> str:
+    try:
+        canonical = json.dumps(schema, sort_keys=True, ensure_ascii=False, default=str)
+    except (TypeError, ValueError):
+        canonical = str(schema)
+    return _sha256(canonical.encode("utf-8"))
+
+
+def build_cache_key(file_bytes: bytes, prompt: Optional[str], schema: Any, model_name: str) -> str:
+    """Derive the content address for one OCR request."""
+    parts = [_sha256(file_bytes), hash_prompt(prompt), hash_schema(schema), model_name or ""]
+    return _sha256("|".join(parts).encode("utf-8"))
+
+
+def is_cacheable_result(result: Any) -> bool:
+    """Only successful, schema-conforming responses are worth caching."""
+    if not isinstance(result, dict):
+        return False
+    text = result.get("text")
+    if not isinstance(text, str) or not text or text.startswith("Error:"):
+        return False
+    # Schema-less fallbacks report a different (or no) status and are not cached
+    status = (result.get("status_updates") or {}).get("status")
+    return status == "success"
+
+
+class OcrResultCache:
+    """Stores OCR results on local disk or in S3 with a size budget."""
+
+    def __init__(self, backend: str = "local", cache_dir: str = "uploads/ocr_cache", max_bytes: int = 512 * 1024 * 1024):
+        self.backend = backend
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.s3_manager = get_s3_manager() if backend == "s3" else None
+        if backend == "s3" and self.s3_manager is None:
+            logger.warning("⚠️ OCR cache requested S3 backend but S3 is not configured; using local disk")
+            self.backend = "local"
+
+        self._lock = threading.Lock()
+        self._writes_since_eviction = 0
+        self._local_bytes: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.tokens_saved = 0
+
+        if self.backend == "local":
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend in ("local", "s3")
+
+    # ------------------------------------------------------------------
+    # Storage helpers
+    # ------------------------------------------------------------------
+
+    def _local_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _s3_key(self, key: str) -> str:
+        return f"{S3_CACHE_PREFIX}{key[:2]}/{key}.json"
+
+    def _read(self, key: str) -> Optional[bytes]:
+        if self.backend == "local":
+            path = self._local_path(key)
+            try:
+                with open(path, "rb") as f:
+                    content = f.read()
+                # Touch so eviction treats the entry as recently used
+                os.utime(path, None)
+                return content
+            except FileNotFoundError:
+                return None
+
+        full_key = f"{self.s3_manager.upload_prefix}{self._s3_key(key)}"
+        try:
+            response = self.s3_manager.s3_client.get_object(Bucket=self.s3_manager.bucket_name, Key=full_key)
+            return response["Body"].read()
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+                logger.warning(f"⚠️ OCR cache read failed for {full_key}: {e}")
+            return None
+
+    def _write(self, key: str, content: bytes) -> None:
+        if self.backend == "local":
+            path = self._local_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp{threading.get_ident()}"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        else:
+            self.s3_manager.upload_file(content, self._s3_key(key), content_type="application/json")
+
+    def _evict_local(self) -> int:
+        entries = []
+        total = 0
+        for root, _dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        if total <= self.max_bytes:
+            return total
+        target = int(self.max_bytes * EVICTION_LOW_WATERMARK)
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.evictions += 1
+            except FileNotFoundError:
+                continue
+        return total
+
+    def _evict_s3(self) -> None:
+        objects = self.s3_manager.list_files(prefix=S3_CACHE_PREFIX)
+        total = sum(obj["size"] for obj in objects)
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * EVICTION_LOW_WATERMARK)
+        for obj in sorted(objects, key=lambda o: o["last_modified"]):
+            if total <= target:
+                break
+            if self.s3_manager.delete_file(obj["key"]):
+                total -= obj["size"]
+                self.evictions += 1
+
+    def _local_size(self) -> int:
+        total = 0
+        for root, _dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    continue
+        return total
+
+    def _maybe_evict(self, written: int) -> None:
+        with self._lock:
+            if self.backend == "local":
+                # Track size incrementally; only walk the directory when over budget
+                if self._local_bytes is None:
+                    self._local_bytes = self._local_size()
+                else:
+                    self._local_bytes += written
+                if self._local_bytes <= self.max_bytes:
+                    return
+            else:
+                self._writes_since_eviction += 1
+                if self._writes_since_eviction < S3_EVICTION_INTERVAL:
+                    return
+                self._writes_since_eviction = 0
+        try:
+            if self.backend == "local":
+                remaining = self._evict_local()
+                with self._lock:
+                    self._local_bytes = remaining
+            else:
+                self._evict_s3()
+        except Exception as e:
+            logger.warning(f"⚠️ OCR cache eviction failed: {e}")
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached OCR result (marked cache_hit, zero tokens) or None."""
+        if not self.enabled:
+            return None
+        start = time.time()
+        try:
+            content = self._read(key)
+        except Exception as e:
+            logger.warning(f"⚠️ OCR cache lookup failed: {e}")
+            content = None
+
+        if content is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        try:
+            entry = json.loads(content.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self.tokens_saved += int(entry.get("input_tokens") or 0) + int(entry.get("output_tokens") or 0)
+
+        lookup_time = time.time() - start
+        logger.info(f"🟢 OCR cache hit {key[:12]}… ({lookup_time * 1000:.1f} ms)")
+        return {
+            "text": entry.get("text", ""),
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "processing_time": lookup_time,
+            "status_updates": {"status": "success", "step": "cache_hit"},
+            "cache_hit": True,
+            "cache_key": key,
+        }
+
+    def put(self, key: str, result: Dict[str, Any], model_name: str) -> None:
+        """Store a successful OCR result."""
+        if not self.enabled or not is_cacheable_result(result):
+            return
+        entry = {
+            "text": result["text"],
+            "input_tokens": result.get("input_tokens") or 0,
+            "output_tokens": result.get("output_tokens") or 0,
+            "model_name": model_name,
+            "cached_at": time.time(),
+        }
+        try:
+            content = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+            self._write(key, content)
+            with self._lock:
+                self.writes += 1
+            self._maybe_evict(len(content))
+        except Exception as e:
+            logger.warning(f"⚠️ OCR cache write failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": self.backend,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "tokens_saved": self.tokens_saved,
+            }
+
+
+# 全局OCR结果缓存实例
+_ocr_result_cache = None
+_ocr_result_cache_lock = threading.Lock()
+
+
+def get_ocr_result_cache() -> OcrResultCache:
+    """获取全局OCR结果缓存实例"""
+    global _ocr_result_cache
+
+    if _ocr_result_cache is None:
+        with _ocr_result_cache_lock:
+            if _ocr_result_cache is None:
+                backend = os.getenv("OCR_CACHE_BACKEND", "auto").lower()
+                if backend == "auto":
+                    backend = "s3" if get_s3_manager() is not None else "local"
+                cache_dir = os.getenv("OCR_CACHE_DIR", os.path.join("uploads", "ocr_cache"))
+                max_bytes = int(os.getenv("OCR_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+                _ocr_result_cache = OcrResultCache(backend, cache_dir, max_bytes)
+                logger.info(f"✅ OCR result cache initialised: backend={_ocr_result_cache.backend}")
+
+    return _ocr_result_cache
@@ -0,0 +1,331 @@
+"""
+Process-wide OCR scheduler.
+
+Every Gemini call (a whole file, a PDF page chunk or a schema-less fallback)
+holds one slot of a single call scheduler while it runs, so the number of
+concurrent model calls stays bounded however items fan out into files and PDFs
+into chunks, and regardless of how many orders run at the same time. Cache hits
+and retry back-off sleeps hold no slot.
+
+Items are admitted by a second scheduler instance so the number of items in
+flight (each holding a DB session and its downloaded files) is bounded too.
+The two pools are separate: an item never waits for a call slot while holding
+one, so nested acquisition cannot deadlock.
+
+Calls are attributed to an order through a context variable: `ocr_order()` (and
+`run`/`run_many`) bind the order for the current task and every task created
+inside it.
+
+- Global call limit:      OCR_MAX_CONCURRENCY (default 8)
+- Optional per-order cap: OCR_MAX_PER_ORDER (default 0 = no cap)
+- Items in flight:        OCR_MAX_ACTIVE_ITEMS (default 16)
+- Fair share: when a slot frees up it goes to the waiting order that currently
+  holds the fewest slots (ties broken by arrival), so one 300-invoice order
+  cannot starve a small order submitted after it.
+
+The scheduler is thread-safe and event-loop agnostic: restart endpoints run
+their pipeline on a private event loop in a worker thread, while BackgroundTasks
+run on the server loop. Waiters are woken on their own loop via
+call_soon_threadsafe.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Order that OCR calls in the current task belong to (0 = not part of an order)
+_current_order: ContextVar[int] = ContextVar("ocr_current_order", default=0)
+
+
+def current_ocr_order() -> int:
+    return _current_order.get()
+
+
+@contextmanager
+def ocr_order(order_id: int) -> Iterator[None]:
+    """Attribute OCR calls made in this block (and tasks created in it) to order_id."""
+    token = _current_order.set(order_id)
+    try:
+        yield
+    finally:
+        _current_order.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("order_id", "loop", "future", "enqueued_at", "seq")
+
+    def __init__(self, order_id: int, loop: asyncio.AbstractEventLoop, seq: int):
+        self.order_id = order_id
+        self.loop = loop
+        self.future: asyncio.Future = loop.create_future()
+        self.enqueued_at = time.monotonic()
+        self.seq = seq
+
+
+class OcrScheduler:
+    """Bounded, fair-share scheduler for OCR work units."""
+
+    def __init__(self, max_concurrency: int = 8, max_per_order: int = 0):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_per_order = max(0, int(max_per_order))
+
+        self._lock = threading.Lock()
+        self._queues: Dict[int, Deque[_Waiter]] = {}
+        self._running: Dict[int, int] = {}
+        self._running_total = 0
+        self._seq = 0
+
+        # Metrics
+        self._granted_total = 0
+        self._completed_total = 0
+        self._failed_total = 0
+        self._peak_queue_depth = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+    # ------------------------------------------------------------------
+    # Slot accounting
+    # ------------------------------------------------------------------
+
+    def _queued_total(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _order_has_capacity(self, order_id: int) -> bool:
+        if not self.max_per_order:
+            return True
+        return self._running.get(order_id, 0) < self.max_per_order
+
+    def _grant(self, order_id: int, waited: float) -> None:
+        self._running[order_id] = self._running.get(order_id, 0) + 1
+        self._running_total += 1
+        self._granted_total += 1
+        self._wait_time_total += waited
+        if waited > self._wait_time_max:
+            self._wait_time_max = waited
+
+    def _pick_next(self) -> Optional[_Waiter]:
+        """Pick the head waiter of the eligible order holding the fewest slots."""
+        best: Optional[_Waiter] = None
+        best_running = None
+        for order_id, queue in self._queues.items():
+            if not queue or not self._order_has_capacity(order_id):
+                continue
+            running = self._running.get(order_id, 0)
+            head = queue[0]
+            if (
+                best is None
+                or running < best_running
+                or (running == best_running and head.seq < best.seq)
+            ):
+                best = head
+                best_running = running
+        return best
+
+    def _dispatch_locked(self) -> None:
+        while self._running_total < self.max_concurrency:
+            waiter = self._pick_next()
+            if waiter is None:
+                return
+            queue = self._queues[waiter.order_id]
+            queue.popleft()
+            if not queue:
+                self._queues.pop(waiter.order_id, None)
+            self._grant(waiter.order_id, time.monotonic() - waiter.enqueued_at)
+            try:
+                waiter.loop.call_soon_threadsafe(self._wake, waiter)
+            except RuntimeError:
+                # Loop already closed; give the slot back and keep dispatching
+                self._release_locked(waiter.order_id)
+
+    def _wake(self, waiter: _Waiter) -> None:
+        # Runs on the waiter's own loop
+        if waiter.future.done():
+            # Waiter was cancelled after the slot was granted
+            self.release(waiter.order_id)
+            return
+        waiter.future.set_result(True)
+
+    def _release_locked(self, order_id: int) -> None:
+        running = self._running.get(order_id, 0) - 1
+        if running > 0:
+            self._running[order_id] = running
+        else:
+            self._running.pop(order_id, None)
+        self._running_total = max(0, self._running_total - 1)
+
+    async def acquire(self, order_id: int) -> None:
+        """Wait for an OCR slot on behalf of order_id."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if (
+                self._running_total < self.max_concurrency
+                and self._order_has_capacity(order_id)
+                and not self._queues
+            ):
+                self._grant(order_id, 0.0)
+                return
+
+            self._seq += 1
+            waiter = _Waiter(order_id, loop, self._seq)
+            self._queues.setdefault(order_id, deque()).append(waiter)
+            depth = self._queued_total()
+            if depth > self._peak_queue_depth:
+                self._peak_queue_depth = depth
+            # A slot may be free for this order even though other orders are queued
+            self._dispatch_locked()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                queue = self._queues.get(order_id)
+                if queue and waiter in queue:
+                    queue.remove(waiter)
+                    if not queue:
+                        self._queues.pop(order_id, None)
+                    waiter = None
+            if waiter is not None and waiter.future.done() and not waiter.future.cancelled():
+                # Slot was granted just before cancellation
+                self.release(order_id)
+            raise
+
+    def release(self, order_id: int) -> None:
+        """Return a slot and hand it to the next eligible waiter."""
+        with self._lock:
+            self._release_locked(order_id)
+            self._dispatch_locked()
+
+    @asynccontextmanager
+    async def slot(self, order_id: Optional[int] = None) -> AsyncIterator[None]:
+        """Hold one slot for the block; order_id defaults to the order bound by ocr_order()."""
+        if order_id is None:
+            order_id = current_ocr_order()
+        await self.acquire(order_id)
+        try:
+            yield
+            with self._lock:
+                self._completed_total += 1
+        except BaseException:
+            with self._lock:
+                self._failed_total += 1
+            raise
+        finally:
+            self.release(order_id)
+
+    async def run(
+        self,
+        order_id: int,
+        func: Callable[..., Awaitable[Any]],
+        *args: Any,
+        **kwargs: Any,
+    ) -> Any:
+        """Run func(*args, **kwargs) once a slot is available for order_id."""
+        with ocr_order(order_id):
+            await self.acquire(order_id)
+            try:
+                result = await func(*args, **kwargs)
+                with self._lock:
+                    if result is False:
+                        self._failed_total += 1
+                    else:
+                        self._completed_total += 1
+                return result
+            except BaseException:
+                with self._lock:
+                    self._failed_total += 1
+                raise
+            finally:
+                self.release(order_id)
+
+    async def run_many(
+        self,
+        order_id: int,
+        func: Callable[..., Awaitable[Any]],
+        args_list: List[tuple],
+    ) -> List[Any]:
+        """Schedule func(*args) for each args tuple and gather results (exceptions returned)."""
+        tasks = [asyncio.create_task(self.run(order_id, func, *args)) for args in args_list]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Snapshot of queue depth and throughput counters."""
+        with self._lock:
+            queued_by_order = {str(oid): len(q) for oid, q in self._queues.items() if q}
+            running_by_order = {str(oid): n for oid, n in self._running.items() if n}
+            granted = self._granted_total
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_per_order": self.max_per_order,
+                "running": self._running_total,
+                "queued": sum(queued_by_order.values()),
+                "peak_queue_depth": self._peak_queue_depth,
+                "running_by_order": running_by_order,
+                "queued_by_order": queued_by_order,
+                "granted_total": granted,
+                "completed_total": self._completed_total,
+                "failed_total": self._failed_total,
+                "avg_wait_seconds": round(self._wait_time_total / granted, 3) if granted else 0.0,
+                "max_wait_seconds": round(self._wait_time_max, 3),
+            }
+
+
+# 全局OCR调度器实例（Gemini 调用级）
+_ocr_scheduler = None
+_ocr_scheduler_lock = threading.Lock()
+
+
+def get_ocr_scheduler() -> OcrScheduler:
+    """获取全局OCR调度器实例（每个 Gemini 调用占用一个槽位）"""
+    global _ocr_scheduler
+
+    if _ocr_scheduler is None:
+        with _ocr_scheduler_lock:
+            if _ocr_scheduler is None:
+                max_concurrency = int(os.getenv("OCR_MAX_CONCURRENCY", "8"))
+                max_per_order = int(os.getenv("OCR_MAX_PER_ORDER", "0"))
+                _ocr_scheduler = OcrScheduler(max_concurrency, max_per_order)
+                logger.info(
+                    f"✅ OCR scheduler initialised: max_concurrency={_ocr_scheduler.max_concurrency}, "
+                    f"max_per_order={_ocr_scheduler.max_per_order or 'unbounded'}"
+                )
+
+    return _ocr_scheduler
+
+
+def set_ocr_scheduler(scheduler: Optional[OcrScheduler]) -> None:
+    """Install a call scheduler explicitly (benchmarks); None resets to the configured default."""
+    global _ocr_scheduler
+
+    with _ocr_scheduler_lock:
+        _ocr_scheduler = scheduler
+
+
+# 全局OCR项目调度器实例（订单项级）
+_ocr_item_scheduler = None
+_ocr_item_scheduler_lock = threading.Lock()
+
+
+def get_ocr_item_scheduler() -> OcrScheduler:
+    """获取全局OCR项目调度器实例（限制同时处理的订单项数量）"""
+    global _ocr_item_scheduler
+
+    if _ocr_item_scheduler is None:
+        with _ocr_item_scheduler_lock:
+            if _ocr_item_scheduler is None:
+                max_items = int(os.getenv("OCR_MAX_ACTIVE_ITEMS", "16"))
+                _ocr_item_scheduler = OcrScheduler(max_items, 0)
+                logger.info(f"✅ OCR item scheduler initialised: max_active_items={_ocr_item_scheduler.max_concurrency}")
+
+    return _ocr_item_scheduler
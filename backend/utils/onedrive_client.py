@@ -106,6 +106,33 @@ class OneDriveClient:
             logger.error(f"❌ Error getting folder {folder_path}: {str(e)}")
             return None
 
+    def get_file_version(self, file_path: str) -> Optional[str]:
+        """Return a version token for a file without downloading it.
+
+        Uses the item's eTag when the library exposes it, otherwise its
+        last-modified timestamp and size. Returns None if not found/error.
+        """
+        if not self.drive:
+            logger.error("❌ Drive not connected. Call connect() first.")
+            return None
+
+        try:
+            file_item = self.drive.get_item_by_path(file_path.strip('/'))
+            if not file_item or not file_item.is_file:
+                return None
+            etag = getattr(file_item, 'etag', None) or getattr(file_item, 'e_tag', None)
+            if etag:
+                return str(etag)
+            modified = getattr(file_item, 'modified', None)
+            size = getattr(file_item, 'size', None)
+            if modified is None and size is None:
+                return None
+            modified_str = modified.isoformat() if hasattr(modified, 'isoformat') else str(modified)
+            return f"{modified_str}|{size}"
+        except Exception as exc:
+            logger.warning(f"⚠️ Error reading OneDrive metadata for {file_path}: {exc}")
+            return None
+
     def download_file_content(self, file_path: str) -> Optional[bytes]:
         """Download file content by absolute OneDrive path.
 
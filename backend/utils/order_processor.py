@@ -4,19 +4,22 @@ Handles the complete OCR Order workflow from submission to completion
 """
 
 import asyncio
+import hashlib
 import json
 import os
 import tempfile
+import threading
 import zipfile
 import re
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Union, Tuple, TYPE_CHECKING
+from typing import List, Dict, Any, Iterable, Optional, Sequence, Set, Union, Tuple, TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 import logging
 import pandas as pd
 from difflib import SequenceMatcher
-from io import BytesIO, StringIO
+from io import StringIO
 
 from sqlalchemy.orm import Session, sessionmaker, joinedload
 
@@ -28,28 +31,79 @@ from db.models import (
     OrderStatus,
     OrderItemStatus,
     OrderItemType,
+    OrderJobType,
     Company,
     DocumentType,
     CompanyDocumentConfig,
     File,
     ApiUsage,
 )
-from main import extract_text_from_image, extract_text_from_pdf
+from main import extract_text_from_image_bytes, extract_text_from_pdf_bytes, extract_text_from_pdf_chunked
 from utils.s3_storage import get_s3_manager
 from utils.special_csv_generator import SpecialCsvGenerator
 from utils.template_service import sanitize_template_version
 from utils.prompt_schema_manager import get_prompt_schema_manager
 from utils.excel_converter import json_to_excel, json_to_csv
+from utils.json_flattener import row_axes_from_schema
+from utils.fuzzy_index import FuzzyIndex
 # Lazy import OneDrive client to avoid hard dependency at module import time
 if TYPE_CHECKING:
     from utils.onedrive_client import OneDriveClient  # pragma: no cover - typing only
 from utils.mapping_config import MappingItemType
 from utils.mapping_config_resolver import MappingConfigResolver
 from utils.ws_notify import broadcast as ws_broadcast
+from utils.ocr_scheduler import get_ocr_item_scheduler
+from utils.pdf_chunking import resolve_pages_per_chunk
+from utils.ocr_preprocess import get_ocr_preprocessor
+from utils.master_data_cache import MasterCacheEntry, get_master_data_cache
+from utils.master_file_loader import (
+    master_cache_key,
+    master_projection,
+    parse_master_bytes,
+    project_master_frame,
+    PARQUET_AVAILABLE,
+    read_parquet_sidecar,
+    frame_to_parquet,
+    sidecar_enabled,
+    sidecar_key,
+    sidecar_path_prefix,
+    stale_sidecar_keys,
+)
+from utils.join_normalization import (
+    build_master_join_table,
+    join_normalize_fingerprint,
+    left_join_column,
+    normalize_join_series,
+)
 from config_loader import config_loader
 
 logger = logging.getLogger(__name__)
 
+# OrderItemFile.ocr_status values (per-file OCR checkpoints)
+FILE_OCR_COMPLETED = "COMPLETED"
+FILE_OCR_FAILED = "FAILED"
+
+# Bump when mapping logic changes in a way that should invalidate stored item frames
+MAPPING_FINGERPRINT_VERSION = "1"
+
+# 全局映射工作池 (items of all orders share it, so MAPPING_WORKERS bounds total mapping CPU)
+_mapping_executor: Optional[ThreadPoolExecutor] = None
+_mapping_executor_lock = threading.Lock()
+
+
+def get_mapping_executor() -> ThreadPoolExecutor:
+    """獲取全局映射工作池"""
+    global _mapping_executor
+
+    if _mapping_executor is None:
+        with _mapping_executor_lock:
+            if _mapping_executor is None:
+                workers = max(1, int(os.getenv("MAPPING_WORKERS", str(min(4, os.cpu_count() or 1)))))
+                _mapping_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mapping")
+                logger.info(f"✅ Mapping worker pool initialised: workers={workers}")
+
+    return _mapping_executor
+
 
 def escape_excel_formulas(value: Any) -> Any:
     """
@@ -113,6 +167,111 @@ class MatchResult:
     match_reason: str = ""
 
 
+_NON_ALPHANUMERIC = re.compile(r'[^a-zA-Z0-9]')
+_NON_DIGIT = re.compile(r'[^0-9]')
+
+
+def _first_index(positions: Iterable[Optional[int]]) -> Optional[int]:
+    found = [position for position in positions if position is not None]
+    return min(found) if found else None
+
+
+class _CandidateLookup:
+    """Lookup structures over one candidate list, built once per MatchingEngine.match_many call.
+
+    For every enabled strategy, first(value) returns the earliest candidate position
+    that strategy's pairwise method would accept, without scanning all candidates.
+    """
+
+    def __init__(self, engine: "MatchingEngine", candidates: Sequence[Any], field_name: Optional[str] = None):
+        config = engine.config
+        self.engine = engine
+        self.candidates = list(candidates)
+        self.min_length = config.min_match_length
+        self.keys = [engine._normalize(candidate) for candidate in self.candidates]
+
+        enabled = [strategy for strategy in config.priority_order if strategy in config.strategies]
+        self.pattern = None
+        if MatchingStrategy.REGEX in enabled and field_name in config.regex_patterns:
+            try:
+                self.pattern = re.compile(config.regex_patterns[field_name])
+            except re.error:
+                pass  # regex_match never succeeds with an invalid pattern
+        self.strategies = [
+            strategy for strategy in enabled
+            if strategy != MatchingStrategy.REGEX or self.pattern is not None
+        ]
+
+        self.exact: Dict[str, int] = {}
+        self.contained: Dict[str, int] = {}
+        self.contained_lengths: List[int] = []
+        self.contains_eligible: List[int] = []
+        self.kgram_size = max(1, self.min_length)
+        self.kgrams: Dict[str, List[int]] = {}
+        self.identifiers: Dict[str, int] = {}
+        self.regex_groups: Dict[Tuple, int] = {}
+        self.fuzzy: Optional[FuzzyIndex] = None
+
+        for position, key in enumerate(self.keys):
+            if MatchingStrategy.EXACT in self.strategies:
+                self.exact.setdefault(key, position)
+            if MatchingStrategy.CONTAINS in self.strategies and len(key) >= self.min_length:
+                self.contained.setdefault(key, position)
+                self.contains_eligible.append(position)
+                for start in {key[i:i + self.kgram_size] for i in range(len(key) - self.kgram_size + 1)}:
+                    self.kgrams.setdefault(start, []).append(position)
+            if MatchingStrategy.SPLIT in self.strategies:
+                for identifier in engine._split_identifiers(self.candidates[position]):
+                    self.identifiers.setdefault(identifier, position)
+            if self.pattern is not None:
+                groups = engine._regex_groups(self.pattern, self.candidates[position])
+                if groups is not None:
+                    self.regex_groups.setdefault(groups, position)
+
+        self.contained_lengths = sorted({len(key) for key in self.contained})
+        if MatchingStrategy.FUZZY in self.strategies:
+            self.fuzzy = FuzzyIndex(self.candidates, normalize=engine._normalize)
+
+    def first(self, value: Any) -> Optional[int]:
+        """Earliest candidate position smart_match(value, candidate) succeeds for, or None."""
+        key = self.engine._normalize(value)
+        positions: List[Optional[int]] = []
+        for strategy in self.strategies:
+            if strategy == MatchingStrategy.EXACT:
+                positions.append(self.exact.get(key))
+            elif strategy == MatchingStrategy.CONTAINS:
+                positions.append(self._first_contains(key))
+            elif strategy == MatchingStrategy.SPLIT:
+                positions.append(_first_index(self.identifiers.get(i) for i in self.engine._split_identifiers(value)))
+            elif strategy == MatchingStrategy.FUZZY:
+                matches = self.fuzzy.search(value, self.engine.config.fuzzy_threshold)
+                positions.append(min(position for position, _ in matches) if matches else None)
+            elif strategy == MatchingStrategy.REGEX:
+                groups = self.engine._regex_groups(self.pattern, value)
+                positions.append(self.regex_groups.get(groups) if groups is not None else None)
+        return _first_index(positions)
+
+    def _first_contains(self, key: str) -> Optional[int]:
+        if len(key) < self.min_length:
+            return None
+
+        # Candidates contained in the value: its substrings of the candidate key lengths
+        found: List[Optional[int]] = []
+        for length in self.contained_lengths:
+            if length > len(key):
+                break
+            found.append(_first_index(self.contained.get(key[i:i + length]) for i in range(len(key) - length + 1)))
+
+        # Candidates containing the value: verify the postings of its rarest k-gram
+        if len(key) < self.kgram_size:
+            scan = self.contains_eligible
+        else:
+            grams = {key[i:i + self.kgram_size] for i in range(len(key) - self.kgram_size + 1)}
+            scan = min((self.kgrams.get(gram, []) for gram in grams), key=len)
+        found.append(next((position for position in scan if key in self.keys[position]), None))
+        return _first_index(found)
+
+
 class MatchingEngine:
     """
     Universal intelligent matching engine for flexible field mapping.
@@ -169,12 +328,12 @@ class MatchingEngine:
             normalized_identifiers.append(identifier)
 
             # Remove all non-alphanumeric characters
-            alphanumeric_only = re.sub(r'[^a-zA-Z0-9]', '', identifier)
+            alphanumeric_only = _NON_ALPHANUMERIC.sub('', identifier)
             if alphanumeric_only and alphanumeric_only != identifier:
                 normalized_identifiers.append(alphanumeric_only)
 
             # Digits only
-            digits_only = re.sub(r'[^0-9]', '', identifier)
+            digits_only = _NON_DIGIT.sub('', identifier)
             if digits_only and len(digits_only) >= self.config.min_match_length:
                 normalized_identifiers.append(digits_only)
 
@@ -189,6 +348,26 @@ class MatchingEngine:
         self.logger.debug(f"Extracted identifiers from '{value_str}': {final_identifiers}")
         return final_identifiers
 
+    def _normalize(self, value: Any) -> str:
+        """Comparison form used by the exact, contains and fuzzy strategies"""
+        value_str = str(value).strip()
+        return value_str if self.config.case_sensitive else value_str.lower()
+
+    def _split_identifiers(self, value: Any) -> Set[str]:
+        """Identifier set compared by split_match"""
+        identifiers = self.extract_identifiers(value)
+        if not self.config.case_sensitive:
+            identifiers = [identifier.lower() for identifier in identifiers]
+        return set(identifiers)
+
+    @staticmethod
+    def _regex_groups(pattern: "re.Pattern", value: Any) -> Optional[Tuple]:
+        """Groups regex_match compares, or None when the pattern does not match"""
+        match = pattern.search(str(value))
+        if not match:
+            return None
+        return tuple(match.groups()) if match.groups() else (match.group(),)
+
     def exact_match(self, ocr_value: str, mapping_value: str) -> MatchResult:
         """Perform exact string matching"""
         ocr_norm = str(ocr_value).strip()
@@ -416,6 +595,56 @@ class MatchingEngine:
 
         return best_result
 
+    def match_many(self, values: Iterable[Any], candidates: Sequence[Any], field_name: str = None) -> List[MatchResult]:
+        """
+        Match a whole column of values against one candidate list.
+
+        For each value the result equals smart_match(value, candidate) for the first
+        candidate (in list order) it succeeds for; a failed MatchResult with an empty
+        mapping_value when no candidate matches. Lookup structures for each enabled
+        strategy are built once, and each distinct value is resolved once, instead of
+        calling smart_match for every value/candidate pair.
+
+        Args:
+            values: Column of OCR values
+            candidates: Mapping values to match against
+            field_name: Field name for regex pattern lookup
+
+        Returns:
+            One MatchResult per value, in input order
+        """
+        lookup = _CandidateLookup(self, candidates, field_name)
+        resolved: Dict[Tuple[type, Any], MatchResult] = {}
+        results: List[MatchResult] = []
+        for value in values:
+            # Keyed by type too: 1, 1.0 and True are equal but compare as different strings
+            memo_key = (type(value), value)
+            try:
+                cached = resolved.get(memo_key)
+            except TypeError:  # Unhashable value: resolve without memoizing
+                cached = None
+            if cached is not None:
+                results.append(replace(cached, ocr_value=value, extracted_parts=list(cached.extracted_parts)))
+                continue
+
+            position = lookup.first(value)
+            if position is None:
+                result = MatchResult(
+                    success=False,
+                    strategy=MatchingStrategy.SMART,
+                    ocr_value=value,
+                    mapping_value="",
+                    match_reason="No candidate matched with any enabled strategy"
+                )
+            else:
+                result = self.smart_match(value, lookup.candidates[position], field_name)
+            try:
+                resolved[memo_key] = result
+            except TypeError:
+                pass
+            results.append(result)
+        return results
+
     def match(self, ocr_value: str, mapping_value: str, strategy: MatchingStrategy = None, field_name: str = None) -> MatchResult:
         """
         Perform matching using the specified strategy or the default configured strategy.
@@ -466,7 +695,7 @@ class OrderProcessor:
         self.app_config = config_loader.get_app_config()
         self.special_csv_generator = SpecialCsvGenerator()
         self.onedrive_client: Optional['OneDriveClient'] = None
-        self._master_csv_cache: Dict[str, pd.DataFrame] = {}
+        self._onedrive_lock = threading.Lock()
 
         # Initialize intelligent matching engine with default configuration
         default_config = MatchingConfig(
@@ -485,7 +714,13 @@ class OrderProcessor:
     def _ensure_onedrive_client(self) -> 'OneDriveClient':
         if self.onedrive_client:
             return self.onedrive_client
+        # Items are mapped on worker threads; connect only once
+        with self._onedrive_lock:
+            if self.onedrive_client:
+                return self.onedrive_client
+            return self._connect_onedrive_client()
 
+    def _connect_onedrive_client(self) -> 'OneDriveClient':
         onedrive_cfg = (self.app_config or {}).get("onedrive", {}) if isinstance(self.app_config, dict) else {}
 
         client_id = os.getenv("ONEDRIVE_CLIENT_ID") or onedrive_cfg.get("client_id")
@@ -557,28 +792,101 @@ class OrderProcessor:
         except Exception as e:
             logger.warning(f"Failed to apply output metadata mapping: {e}")
 
-    def _get_master_csv_dataframe(self, path: str) -> pd.DataFrame:
-        cached = self._master_csv_cache.get(path)
-        if cached is not None:
-            return cached.copy()
+    def _probe_master_version(self, path: str) -> Optional[str]:
+        """Cheap version token for a master file (S3 ETag / OneDrive eTag or last-modified)."""
+        if path.startswith("s3://"):
+            return self.s3_manager.get_etag_by_stored_path(path) if self.s3_manager else None
+        return self._ensure_onedrive_client().get_file_version(path)
 
-        client = self._ensure_onedrive_client()
-        content = client.download_file_content(path)
-        if not content:
-            raise RuntimeError(f"Master CSV not found at OneDrive path: {path}")
+    def _load_master_sidecar(self, key: Optional[str]) -> Optional[bytes]:
+        if not key or not self.s3_manager:
+            return None
+        try:
+            return self.s3_manager.download_file(key)
+        except Exception as exc:
+            logger.warning(f"⚠️ Master Parquet sidecar unavailable ({key}): {exc}")
+            return None
+
+    def _load_master_csv(
+        self,
+        path: str,
+        columns: Optional[Sequence[str]] = None,
+        dtypes: Optional[Dict[str, str]] = None,
+    ) -> Tuple[pd.DataFrame, Optional[str]]:
+        """Parse a master file, keeping only `columns` (all when None) with `dtypes` applied.
+
+        Uses the Parquet sidecar of this master version when one exists, and writes
+        it after a full parse otherwise (see utils.master_file_loader).
+        """
+        # Read the version first: if the file changes mid-download the next check reloads it
+        version = self._probe_master_version(path)
+        sidecar = sidecar_key(path, version, dtypes) if version and self.s3_manager and sidecar_enabled() else None
+
+        cached = self._load_master_sidecar(sidecar)
+        if cached:
+            try:
+                return read_parquet_sidecar(cached, columns), version
+            except Exception as exc:
+                logger.warning(f"⚠️ Master Parquet sidecar unreadable for '{path}', parsing source: {exc}")
+
+        if path.startswith("s3://"):
+            if not self.s3_manager:
+                raise RuntimeError("S3 storage is not configured for master CSV path")
+            content = self.s3_manager.download_file_by_stored_path(path)
+            if not content:
+                raise RuntimeError(f"Master CSV not found at S3 path: {path}")
+        else:
+            client = self._ensure_onedrive_client()
+            content = client.download_file_content(path)
+            if not content:
+                raise RuntimeError(f"Master CSV not found at OneDrive path: {path}")
 
         extension = os.path.splitext(path)[1].lower()
         try:
-            if extension in {".xlsx", ".xls"}:
-                df = pd.read_excel(BytesIO(content))
-            else:
-                df = pd.read_csv(BytesIO(content))
+            if not sidecar:
+                return parse_master_bytes(content, extension, columns, dtypes), version
+            # Parse every column once so the sidecar serves any column set of this version
+            full_df = parse_master_bytes(content, extension, dtypes=dtypes)
         except Exception as exc:
             raise RuntimeError(f"Failed to parse master CSV '{path}': {exc}") from exc
 
-        df.columns = [col.strip() if isinstance(col, str) else col for col in df.columns]
-        self._master_csv_cache[path] = df
-        return df.copy()
+        parquet_bytes = frame_to_parquet(full_df)
+        if parquet_bytes and self.s3_manager.upload_file(parquet_bytes, sidecar):
+            logger.info(f"💾 Stored Parquet sidecar for master '{path}' ({len(parquet_bytes):,} bytes)")
+            self._prune_master_sidecars(path, version)
+        return project_master_frame(full_df, columns), version
+
+    def _prune_master_sidecars(self, path: str, version: str) -> None:
+        """Delete the sidecars of earlier versions of a master file (best effort)."""
+        try:
+            listed = self.s3_manager.list_files(prefix=sidecar_path_prefix(path))
+            stale = stale_sidecar_keys(path, version, [entry["key"] for entry in listed])
+            for key in stale:
+                self.s3_manager.delete_file(key)
+            if stale:
+                logger.info(f"🧹 Removed {len(stale)} outdated Parquet sidecar(s) for master '{path}'")
+        except Exception as exc:
+            logger.warning(f"⚠️ Could not prune old Parquet sidecars for master '{path}': {exc}")
+
+    def _get_master_csv_entry(
+        self,
+        path: str,
+        columns: Optional[Sequence[str]] = None,
+        dtypes: Optional[Dict[str, str]] = None,
+    ) -> MasterCacheEntry:
+        """Process-wide cache entry for a master file; its frame is shared and read-only.
+
+        Each column/dtype projection is cached separately (see master_cache_key).
+        """
+        return get_master_data_cache().get_entry(
+            master_cache_key(path, columns, dtypes),
+            loader=lambda: self._load_master_csv(path, columns, dtypes),
+            probe=lambda: self._probe_master_version(path),
+        )
+
+    def _get_master_csv_dataframe(self, path: str) -> pd.DataFrame:
+        """Parsed master file (shallow copy; do not modify values in place)."""
+        return self._get_master_csv_entry(path).frame.copy(deep=False)
 
     def _download_content_from_uri(self, uri: str) -> Optional[bytes]:
         if not uri:
@@ -1007,6 +1315,7 @@ class OrderProcessor:
         column_aliases: Optional[Dict[str, str]] = None,
         join_normalize: Optional[Dict[str, Any]] = None,
         merge_suffix: Optional[str] = None,
+        master_entry: Optional[MasterCacheEntry] = None,
     ) -> pd.DataFrame:
         if not external_join_keys:
             return item_df
@@ -1099,150 +1408,35 @@ class OrderProcessor:
         if missing_right:
             raise RuntimeError(f"Master CSV missing required join columns: {missing_right}")
 
-        # Coerce join columns to strings on both sides to avoid dtype mismatch
-        def _normalize_text(s: str, opts: Optional[Dict[str, Any]], key_name: Optional[str] = None) -> str:
-            if opts is None:
-                return s
-            out = s
-            try:
-                if isinstance(out, str):
-                    if opts.get('strip_non_digits'):
-                        import re
-                        out = re.sub(r"\D+", "", out)
-                    # zfill: int or per-key map
-                    zfill = opts.get('zfill')
-                    if isinstance(zfill, int) and zfill > 0:
-                        out = out.zfill(zfill)
-                    elif isinstance(zfill, dict) and key_name and key_name in zfill:
-                        length = int(zfill[key_name])
-                        if length > 0:
-                            out = out.zfill(length)
-            except Exception:
-                return s
-            return out
-
-        def _as_str_series(series: pd.Series, key_name: Optional[str]) -> pd.Series:
-            try:
-                s = series.astype(str).replace({"nan": "", "None": ""}).str.strip()
-                if join_normalize:
-                    # Basic text transforms first
-                    s = s.apply(lambda v: _normalize_text(v, join_normalize, key_name))
-                    # Optional: strip invisible/zero-width whitespace and NBSP/full-width space
-                    # Controlled via join_normalize.strip_invisible = true
-                    if isinstance(join_normalize, dict) and join_normalize.get('strip_invisible'):
-                        try:
-                            import re
-                            # Replace a set of invisible/spacing characters with a regular space,
-                            # then subsequent whitespace normalization can collapse them.
-                            # Note: avoid hardcoded business values; this is generic unicode cleanup.
-                            INVIS_WS = (
-                                "\u00A0\u1680\u180E\u2000\u2001\u2002\u2003\u2004\u2005\u2006"
-                                "\u2007\u2008\u2009\u200A\u200B\u200C\u200D\u202F\u205F\u3000\uFEFF"
-                            )
-                            pattern = f"[{INVIS_WS}]"
-                            s = s.apply(lambda v: re.sub(pattern, " ", v) if isinstance(v, str) else v)
-                        except Exception:
-                            pass
-                    # Unicode normalization (NFKC)
-                    if isinstance(join_normalize, dict) and join_normalize.get('nfkc'):
-                        try:
-                            import unicodedata
-                            s = s.apply(lambda v: unicodedata.normalize('NFKC', v) if isinstance(v, str) else v)
-                        except Exception:
-                            pass
-                    # Collapse whitespaces
-                    if isinstance(join_normalize, dict) and join_normalize.get('normalize_ws'):
-                        try:
-                            s = s.str.replace(r"\s+", " ", regex=True).str.strip()
-                        except Exception:
-                            pass
-                    # Lowercase last (after unicode/ws normalization)
-                    if isinstance(join_normalize, dict) and join_normalize.get('lower'):
-                        s = s.str.lower()
-
-                    # Optional: apply value alias mapping after transforms. This allows admin-configured
-                    # alias dictionaries to canonicalise join values without hardcoding here.
-                    # Accept either a global alias map or a per-key map structure.
-                    #   join_normalize.value_alias_map = {"alias": "canonical", ...}
-                    #   join_normalize.value_alias_map = {key_name: {"alias": "canonical"}}
-                    try:
-                        alias_spec = None
-                        if isinstance(join_normalize, dict):
-                            alias_spec = join_normalize.get('value_alias_map') or join_normalize.get('aliases')
-                        if isinstance(alias_spec, dict):
-                            cur_map = None
-                            # Per-key map has precedence when available
-                            if key_name and isinstance(alias_spec.get(key_name), dict):
-                                cur_map = alias_spec.get(key_name)
-                            else:
-                                # Global map applied to any key
-                                cur_map = alias_spec
-                            if isinstance(cur_map, dict) and cur_map:
-                                # Ensure keys are strings; apply mapping on exact post-normalized value
-                                s = s.apply(lambda v: cur_map.get(v, v) if isinstance(v, str) else v)
-                    except Exception:
-                        pass
-                return s
-            except Exception:
-                s = series.astype("string").fillna("").str.strip()
-                if join_normalize:
-                    s = s.apply(lambda v: _normalize_text(v, join_normalize, key_name))
-                    if isinstance(join_normalize, dict) and join_normalize.get('strip_invisible'):
-                        try:
-                            import re
-                            INVIS_WS = (
-                                "\u00A0\u1680\u180E\u2000\u2001\u2002\u2003\u2004\u2005\u2006"
-                                "\u2007\u2008\u2009\u200A\u200B\u200C\u200D\u202F\u205F\u3000\uFEFF"
-                            )
-                            pattern = f"[{INVIS_WS}]"
-                            s = s.apply(lambda v: re.sub(pattern, " ", v) if isinstance(v, str) else v)
-                        except Exception:
-                            pass
-                    if isinstance(join_normalize, dict) and join_normalize.get('nfkc'):
-                        try:
-                            import unicodedata
-                            s = s.apply(lambda v: unicodedata.normalize('NFKC', v) if isinstance(v, str) else v)
-                        except Exception:
-                            pass
-                    if isinstance(join_normalize, dict) and join_normalize.get('normalize_ws'):
-                        try:
-                            s = s.str.replace(r"\s+", " ", regex=True).str.strip()
-                        except Exception:
-                            pass
-                    if isinstance(join_normalize, dict) and join_normalize.get('lower'):
-                        s = s.str.lower()
-                    try:
-                        alias_spec = None
-                        if isinstance(join_normalize, dict):
-                            alias_spec = join_normalize.get('value_alias_map') or join_normalize.get('aliases')
-                        if isinstance(alias_spec, dict):
-                            cur_map = None
-                            if key_name and isinstance(alias_spec.get(key_name), dict):
-                                cur_map = alias_spec.get(key_name)
-                            else:
-                                cur_map = alias_spec
-                            if isinstance(cur_map, dict) and cur_map:
-                                s = s.apply(lambda v: cur_map.get(v, v) if isinstance(v, str) else v)
-                    except Exception:
-                        pass
-                return s
+        # Coerce join columns to strings on both sides to avoid dtype mismatch.
+        # The master side is normalized and indexed once per master version (cached on
+        # the master entry); only the order's own rows are normalized per join.
+        if master_entry is not None:
+            table_key = ("join", tuple(right_on), tuple(external_join_keys), join_normalize_fingerprint(join_normalize))
+            master_table = get_master_data_cache().derived(
+                master_entry,
+                table_key,
+                lambda frame: build_master_join_table(frame, right_on, external_join_keys, join_normalize),
+            )
+        else:
+            master_table = build_master_join_table(master_df, right_on, external_join_keys, join_normalize)
 
         left_tmp_cols: List[str] = []
-        right_tmp_cols: List[str] = []
-        for i, (lcol, rcol, key_name) in enumerate(zip(left_on, right_on, external_join_keys)):
-            ltmp = f"__join_left_{i}__"
-            rtmp = f"__join_right_{i}__"
-            item_df[ltmp] = _as_str_series(item_df[lcol], key_name)
-            master_df[rtmp] = _as_str_series(master_df[rcol], key_name)
+        for i, (lcol, key_name) in enumerate(zip(left_on, external_join_keys)):
+            ltmp = left_join_column(i)
+            item_df[ltmp] = normalize_join_series(item_df[lcol], join_normalize, key_name)
             left_tmp_cols.append(ltmp)
-            right_tmp_cols.append(rtmp)
+        right_tmp_cols: List[str] = list(master_table.key_columns)
+
+        # Only master rows whose normalized key occurs in this item take part in the merge
+        master_df = master_table.candidates(item_df, left_tmp_cols)
 
         # Debug: show normalized samples per key
         if mapping_debug:
             try:
                 for i, key_name in enumerate(external_join_keys):
                     left_sample = item_df[left_tmp_cols[i]].dropna().head(5).tolist()
-                    right_sample = master_df[right_tmp_cols[i]].dropna().head(5).tolist()
+                    right_sample = master_table.frame[right_tmp_cols[i]].dropna().head(5).tolist()
                     logger.info(
                         "[MAPPING_DEBUG] NORMALIZED samples for key '%s': left=%s | right=%s",
                         key_name,
@@ -1289,8 +1483,7 @@ class OrderProcessor:
         item: OcrOrderItem,
         mapped_df: pd.DataFrame,
     ) -> str:
-        s3_base = f"results/orders/{order_id // 1000}/items/{item.item_id}"
-        csv_key = f"{s3_base}/item_{item.item_id}_mapped_final.csv"
+        csv_key = self._item_mapped_csv_key(order_id, item.item_id)
 
         csv_bytes = mapped_df.to_csv(index=False).encode("utf-8")
         upload_success = self.s3_manager.upload_file(csv_bytes, csv_key)
@@ -1299,8 +1492,139 @@ class OrderProcessor:
 
         return f"s3://{self.s3_manager.bucket_name}/{self.s3_manager.upload_prefix}{csv_key}"
 
-    async def process_order(self, order_id: int):
-        """Process an entire OCR order"""
+    @staticmethod
+    def _item_mapped_csv_key(order_id: int, item_id: int) -> str:
+        return f"results/orders/{order_id // 1000}/items/{item_id}/item_{item_id}_mapped_final.csv"
+
+    @staticmethod
+    def _item_mapped_frame_key(order_id: int, item_id: int) -> str:
+        return f"results/orders/{order_id // 1000}/items/{item_id}/item_{item_id}_mapped_frame.parquet"
+
+    def _mapping_fingerprint(
+        self,
+        item: OcrOrderItem,
+        mapping_item_type: MappingItemType,
+        records_hash: str,
+        master_version: Optional[str],
+    ) -> Optional[str]:
+        """Hash of everything an item's mapped frame depends on; None if it cannot be pinned down."""
+        master_path = item.mapping_config.get("master_csv_path") if isinstance(item.mapping_config, dict) else None
+        if master_path and master_version is None:
+            return None
+        payload = {
+            "version": MAPPING_FINGERPRINT_VERSION,
+            "item_type": mapping_item_type.value,
+            "template_id": item.applied_template_id,
+            # Join keys, aliases, normalization and master path all live in the resolved config
+            "mapping_config": item.mapping_config,
+            "master": [master_path, master_version],
+            "ocr": records_hash,
+        }
+        canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _load_mapped_frame(self, order_id: int, item_id: int) -> Optional[pd.DataFrame]:
+        if not PARQUET_AVAILABLE:
+            return None
+        try:
+            content = self.s3_manager.download_file(self._item_mapped_frame_key(order_id, item_id))
+            if not content:
+                return None
+            # Parquet keeps the column dtypes (CSV would not) and, unlike pickle, cannot execute code on load
+            return read_parquet_sidecar(content)
+        except Exception as exc:
+            logger.warning(f"⚠️ Cached mapped frame unusable for item {item_id}: {exc}")
+            return None
+
+    def _save_mapped_frame(self, order_id: int, item_id: int, merged_df: pd.DataFrame) -> bool:
+        """Store the mapped frame for reuse; False (no reuse next time) if it cannot be stored as Parquet."""
+        try:
+            content = frame_to_parquet(merged_df)
+            if content is None:
+                logger.warning(f"⚠️ Mapped frame for item {item_id} not stored; it will be remapped next time")
+                return False
+            return bool(self.s3_manager.upload_file(content, self._item_mapped_frame_key(order_id, item_id)))
+        except Exception as exc:
+            logger.warning(f"⚠️ Failed to store mapped frame for item {item_id}: {exc}")
+            return False
+
+    @staticmethod
+    def _run_error(order: Optional[OcrOrder]) -> Optional[str]:
+        """Error to report to the job worker when a run left the order FAILED (None otherwise)."""
+        if order is None or order.status != OrderStatus.FAILED:
+            return None
+        return order.error_message or f"Order {order.order_id} failed"
+
+    def prepare_order_retry(self, order_id: int, job_type: OrderJobType) -> Optional[OrderJobType]:
+        """Reset an order left behind by a failed or abandoned run so a job attempt can resume it.
+
+        - Items stuck in PROCESSING (the previous worker died mid-OCR) go back to PENDING;
+          files OCR'd before the crash are served from their checkpoints.
+        - Items that FAILED before producing an OCR result are re-queued as PENDING.
+        - The run resumes from the order's current stage: a PROCESS_ORDER job whose OCR
+          stage already finished runs mapping only.
+
+        Returns the job type to run, or None when the order needs no further work.
+        """
+        with Session(engine) as db:
+            order = db.query(OcrOrder).filter(OcrOrder.order_id == order_id).first()
+            if not order or order.status in {OrderStatus.LOCKED, OrderStatus.COMPLETED}:
+                return None
+            if job_type == OrderJobType.OCR_ONLY and order.status == OrderStatus.OCR_COMPLETED:
+                return None
+
+            items = db.query(OcrOrderItem).filter(OcrOrderItem.order_id == order_id).all()
+            reset = 0
+            for item in items:
+                stuck = item.status == OrderItemStatus.PROCESSING
+                retry_ocr = (
+                    job_type != OrderJobType.MAPPING_ONLY
+                    and item.status == OrderItemStatus.FAILED
+                    and not item.ocr_result_json_path
+                )
+                if stuck or retry_ocr:
+                    item.status = OrderItemStatus.PENDING
+                    item.error_message = None
+                    item.updated_at = datetime.utcnow()
+                    reset += 1
+
+            has_pending = any(item.status == OrderItemStatus.PENDING for item in items)
+            has_ocr = any(item.ocr_result_json_path for item in items)
+
+            resume = job_type
+            if job_type == OrderJobType.MAPPING_ONLY:
+                if order.status == OrderStatus.FAILED:
+                    order.status = OrderStatus.MAPPING
+            elif has_pending:
+                order.status = OrderStatus.PROCESSING
+            elif job_type == OrderJobType.PROCESS_ORDER and has_ocr:
+                # OCR finished before the previous attempt died or failed in mapping
+                order.status = OrderStatus.MAPPING
+                resume = OrderJobType.MAPPING_ONLY
+            elif job_type == OrderJobType.OCR_ONLY and has_ocr:
+                order.status = OrderStatus.OCR_COMPLETED
+                resume = None
+            else:
+                # Nothing left to run; let the runner record why
+                order.status = OrderStatus.PROCESSING
+
+            order.error_message = None
+            order.updated_at = datetime.utcnow()
+            db.commit()
+
+        logger.info(
+            f"🔁 Order {order_id}: resuming {job_type.value} as "
+            f"{resume.value if resume else 'no-op'} ({reset} items reset to PENDING)"
+        )
+        return resume
+
+    async def process_order(self, order_id: int) -> Optional[str]:
+        """Process an entire OCR order
+
+        Failures are recorded on the order (status FAILED) rather than raised; the
+        error message is also returned so the job worker can retry the run.
+        """
+        order = None
         with Session(engine) as db:
             try:
                 # Get order
@@ -1324,18 +1648,17 @@ class OrderProcessor:
                     order.status = OrderStatus.FAILED
                     order.error_message = "No items to process"
                     db.commit()
-                    return
+                    return self._run_error(order)
 
                 logger.info(f"Processing order {order_id} with {len(items)} items")
 
-                # Process all items in parallel
-                tasks = []
-                for item in items:
-                    task = asyncio.create_task(self._process_order_item(item.item_id))
-                    tasks.append(task)
-
-                # Wait for all items to complete
-                results = await asyncio.gather(*tasks, return_exceptions=True)
+                # Admit items through the process-wide item scheduler; each Gemini call inside
+                # an item takes its own slot from the OCR call scheduler (see utils.ocr_scheduler)
+                results = await get_ocr_item_scheduler().run_many(
+                    order_id,
+                    self._process_order_item,
+                    [(item.item_id,) for item in items],
+                )
 
                 # Check results and update order status
                 completed_count = 0
@@ -1375,15 +1698,22 @@ class OrderProcessor:
                 except Exception:
                     pass
                 logger.info(f"Order {order_id} OCR stage completed: {completed_count} succeeded, {failed_count} failed")
+                return self._run_error(order)
 
             except Exception as e:
                 logger.error(f"Error processing order {order_id}: {str(e)}")
-                order.status = OrderStatus.FAILED
-                order.error_message = str(e)
-                db.commit()
+                if order is not None:
+                    order.status = OrderStatus.FAILED
+                    order.error_message = str(e)
+                    db.commit()
+                return str(e)
 
-    async def process_order_ocr_only(self, order_id: int):
-        """Process an OCR order without mapping (OCR-only mode)"""
+    async def process_order_ocr_only(self, order_id: int) -> Optional[str]:
+        """Process an OCR order without mapping (OCR-only mode)
+
+        Returns the order's error message when the run left it FAILED, like process_order.
+        """
+        order = None
         with Session(engine) as db:
             try:
                 # Get order
@@ -1412,18 +1742,17 @@ class OrderProcessor:
                     order.status = OrderStatus.FAILED
                     order.error_message = "No items to process"
                     db.commit()
-                    return
+                    return self._run_error(order)
 
                 logger.info(f"Processing order {order_id} (OCR-only) with {len(items)} items")
 
-                # Process all items in parallel
-                tasks = []
-                for item in items:
-                    task = asyncio.create_task(self._process_order_item(item.item_id))
-                    tasks.append(task)
-
-                # Wait for all items to complete
-                results = await asyncio.gather(*tasks, return_exceptions=True)
+                # Admit items through the process-wide item scheduler; each Gemini call inside
+                # an item takes its own slot from the OCR call scheduler (see utils.ocr_scheduler)
+                results = await get_ocr_item_scheduler().run_many(
+                    order_id,
+                    self._process_order_item,
+                    [(item.item_id,) for item in items],
+                )
 
                 # Check results and update order status
                 completed_count = 0
@@ -1453,12 +1782,15 @@ class OrderProcessor:
 
                 db.commit()
                 logger.info(f"Order {order_id} OCR-only processing completed: {completed_count} succeeded, {failed_count} failed")
+                return self._run_error(order)
 
             except Exception as e:
                 logger.error(f"Error processing order OCR-only {order_id}: {str(e)}")
-                order.status = OrderStatus.FAILED
-                order.error_message = str(e)
-                db.commit()
+                if order is not None:
+                    order.status = OrderStatus.FAILED
+                    order.error_message = str(e)
+                    db.commit()
+                return str(e)
 
     def _get_ordered_file_links(self, item: OcrOrderItem) -> Tuple[Optional[Dict], List[Dict]]:
         """Get file links ordered with primary file first.
@@ -1557,6 +1889,184 @@ class OrderProcessor:
             logger.error(f"Error generating mapped CSV for item {item_id}: {str(e)}")
             return None
 
+    @staticmethod
+    def _file_ocr_concurrency() -> int:
+        """Files of one item in flight at once (OCR_FILE_CONCURRENCY, default 4).
+
+        Bounds per-item fan-out only; every model call still waits for an OCR scheduler slot.
+        """
+        try:
+            return max(1, int(os.getenv("OCR_FILE_CONCURRENCY", "4")))
+        except ValueError:
+            return 4
+
+    @staticmethod
+    def _ocr_fingerprint(prompt: str, schema: Dict[str, Any], pages_per_chunk: int) -> str:
+        """Identify the OCR inputs a checkpoint was produced with (prompt/schema edits invalidate it)."""
+        payload = json.dumps(
+            {"prompt": prompt, "schema": schema, "pages_per_chunk": pages_per_chunk},
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _load_file_checkpoint(self, file_link: OrderItemFile, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Return the checkpointed OCR result for a file, or None if it must be OCR'd again."""
+        if file_link.ocr_status != FILE_OCR_COMPLETED or not file_link.ocr_result_path:
+            return None
+        try:
+            content = self.s3_manager.download_file_by_stored_path(file_link.ocr_result_path)
+            if not content:
+                return None
+            checkpoint = json.loads(content.decode("utf-8"))
+        except Exception as e:
+            logger.warning(f"⚠️ Ignoring unreadable OCR checkpoint {file_link.ocr_result_path}: {e}")
+            return None
+        if checkpoint.get("fingerprint") != fingerprint or not isinstance(checkpoint.get("result"), dict):
+            return None
+        return checkpoint["result"]
+
+    def _write_file_checkpoint(self, item_id: int, file_id: int, fingerprint: str, tagged: Dict[str, Any]) -> None:
+        """Persist one file's OCR outcome and record it on its OrderItemFile row.
+
+        Only parsed JSON results are checkpointed as COMPLETED; anything tagged with
+        __error ("Error:" responses, failed page chunks, non-JSON text) is recorded as
+        FAILED so the next attempt OCRs the file again.
+        """
+        status = FILE_OCR_FAILED if "__error" in tagged else FILE_OCR_COMPLETED
+        error = tagged.get("__error")
+        result_path = None
+        if status == FILE_OCR_COMPLETED:
+            checkpoint_key = f"results/orders/{item_id // 1000}/items/{item_id}/checkpoints/file_{file_id}_ocr.json"
+            body = json.dumps(
+                {"fingerprint": fingerprint, "saved_at": datetime.utcnow().isoformat(), "result": tagged},
+                ensure_ascii=False,
+            ).encode("utf-8")
+            if self.s3_manager.upload_file(body, checkpoint_key):
+                result_path = f"s3://{self.s3_manager.bucket_name}/{self.s3_manager.upload_prefix}{checkpoint_key}"
+            else:
+                status, error = FILE_OCR_FAILED, "Failed to upload OCR checkpoint"
+
+        try:
+            with Session(engine) as db:
+                link = db.query(OrderItemFile).filter(
+                    OrderItemFile.item_id == item_id, OrderItemFile.file_id == file_id
+                ).first()
+                if not link:
+                    return
+                link.ocr_status = status
+                link.ocr_result_path = result_path
+                link.ocr_completed_at = datetime.utcnow() if status == FILE_OCR_COMPLETED else None
+                link.ocr_error = error
+                db.commit()
+        except Exception as e:
+            logger.warning(f"⚠️ Could not record OCR checkpoint for item {item_id}, file {file_id}: {e}")
+
+    async def _ocr_item_file(
+        self,
+        semaphore: asyncio.Semaphore,
+        file_record: File,
+        is_primary_file: bool,
+        prompt: str,
+        schema: Dict[str, Any],
+        is_awb: bool,
+        pages_per_chunk: int = 0,
+        item_id: Optional[int] = None,
+        file_link: Optional[OrderItemFile] = None,
+        fingerprint: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """OCR a single item file and return its tagged result (None if download failed).
+
+        A COMPLETED checkpoint on file_link with a matching fingerprint is reused instead
+        of calling OCR again; fresh results are checkpointed as soon as the file finishes.
+        """
+        async with semaphore:
+            checkpoint = None
+            if file_link is not None and fingerprint:
+                checkpoint = await asyncio.to_thread(self._load_file_checkpoint, file_link, fingerprint)
+            if checkpoint is not None:
+                logger.info(f"⏭️ Reusing OCR checkpoint for item {item_id}, file {file_record.file_name}")
+                checkpoint["__is_primary"] = is_primary_file
+                if is_awb:
+                    checkpoint["__file_id"] = file_record.file_id
+                    checkpoint["__source_path"] = file_record.file_path
+                return checkpoint
+
+            try:
+                # Download file from S3 into memory (boto3 is blocking)
+                file_content = await asyncio.to_thread(
+                    self.s3_manager.download_file_by_stored_path, file_record.file_path
+                )
+                if not file_content:
+                    logger.error(f"Failed to download file: {file_record.file_path}")
+                    return None
+
+                # Downsample/re-encode/strip metadata before upload (no-op when disabled)
+                file_ext = os.path.splitext(file_record.file_name)[1].lower()
+                file_content, file_ext, _ = await asyncio.to_thread(
+                    get_ocr_preprocessor().compact, file_content, file_ext, file_record.file_name
+                )
+
+                # Process the file straight from memory - no tempfile round-trip
+                if file_ext == '.pdf' and pages_per_chunk:
+                    result = await extract_text_from_pdf_chunked(file_content, prompt, schema, pages_per_chunk)
+                elif file_ext == '.pdf':
+                    result = await extract_text_from_pdf_bytes(file_content, prompt, schema)
+                else:
+                    result = await extract_text_from_image_bytes(file_content, prompt, schema)
+
+                # Clean result data - only keep business data
+                if not isinstance(result, dict):
+                    return None
+
+                text_content = result.get("text", "")
+                if text_content.startswith("Error:"):
+                    # The extract functions (and chunked PDFs with any failed chunk) report failures as text
+                    tagged = {
+                        "__filename": file_record.file_name,
+                        "__error": text_content,
+                        "__is_primary": is_primary_file
+                    }
+                elif text_content:
+                    try:
+                        tagged = json.loads(text_content)
+                        tagged["__filename"] = file_record.file_name
+                        tagged["__is_primary"] = is_primary_file  # Mark if primary file
+                    except json.JSONDecodeError:
+                        # Keep the raw text in the results, but never checkpoint it as a completed OCR
+                        tagged = {
+                            "text": text_content,
+                            "__filename": file_record.file_name,
+                            "__error": "OCR response is not valid JSON",
+                            "__is_primary": is_primary_file
+                        }
+                else:
+                    tagged = {
+                        "__filename": file_record.file_name,
+                        "__error": "No text content in result",
+                        "__is_primary": is_primary_file
+                    }
+
+            except Exception as e:
+                logger.error(f"Error processing file {file_record.file_name}: {str(e)}")
+                tagged = {
+                    "__filename": file_record.file_name,
+                    "__error": f"Processing failed: {str(e)}",
+                    "__is_primary": is_primary_file
+                }
+
+            if item_id is not None and fingerprint:
+                await asyncio.to_thread(
+                    self._write_file_checkpoint, item_id, file_record.file_id, fingerprint, tagged
+                )
+
+            # Add file-level metadata for AWB items
+            if is_awb:
+                tagged["__file_id"] = file_record.file_id
+                tagged["__source_path"] = file_record.file_path
+            return tagged
+
     async def _process_order_item(self, item_id: int) -> bool:
         """Process a single order item"""
         with Session(engine) as db:
@@ -1596,91 +2106,28 @@ class OrderProcessor:
                 if primary_file_data:
                     # `primary_file_data` is a dict with keys: file_record, file_link, is_primary
                     # Use the DB file record, not a non-existent 'file' key
-                    all_files.append((primary_file_data['file_record'], True))  # Mark as primary
+                    all_files.append((primary_file_data['file_record'], primary_file_data['file_link'], True))  # Mark as primary
                 for attachment_data in attachment_files:
-                    all_files.append((attachment_data['file_record'], False))  # Mark as attachment
+                    all_files.append((attachment_data['file_record'], attachment_data['file_link'], False))  # Mark as attachment
 
                 if not all_files:
                     raise Exception("No files found for item")
 
-                # Process all files for this item
-                all_results = []
-                temp_files_to_cleanup = []
+                # Process all files for this item concurrently (bounded); gather keeps
+                # primary-first ordering so __is_primary/__file_id stay aligned
                 is_awb = doc_type.type_code == "AIRWAY_BILL"  # Check if this is an AWB item
-
-                for file_record, is_primary_file in all_files:
-                    try:
-                        # Download file from S3 to temporary location
-                        file_content = self.s3_manager.download_file_by_stored_path(file_record.file_path)
-                        if not file_content:
-                            logger.error(f"Failed to download file: {file_record.file_path}")
-                            continue
-
-                        # Create temporary file
-                        file_ext = os.path.splitext(file_record.file_name)[1].lower()
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as temp_file:
-                            temp_file.write(file_content)
-                            temp_file_path = temp_file.name
-                            temp_files_to_cleanup.append(temp_file_path)
-
-                        # Process the file
-                        if file_ext == '.pdf':
-                            result = await extract_text_from_pdf(temp_file_path, prompt, schema)
-                        else:
-                            result = await extract_text_from_image(temp_file_path, prompt, schema)
-
-                        # Clean result data - only keep business data
-                        if isinstance(result, dict):
-                            text_content = result.get("text", "")
-                            if text_content:
-                                try:
-                                    business_data = json.loads(text_content)
-                                    business_data["__filename"] = file_record.file_name
-                                    business_data["__is_primary"] = is_primary_file  # Mark if primary file
-                                    # Add file-level metadata for AWB items
-                                    if is_awb:
-                                        business_data["__file_id"] = file_record.file_id
-                                        business_data["__source_path"] = file_record.file_path
-                                    all_results.append(business_data)
-                                except json.JSONDecodeError:
-                                    error_result = {
-                                        "text": text_content,
-                                        "__filename": file_record.file_name,
-                                        "__is_primary": is_primary_file
-                                    }
-                                    if is_awb:
-                                        error_result["__file_id"] = file_record.file_id
-                                        error_result["__source_path"] = file_record.file_path
-                                    all_results.append(error_result)
-                            else:
-                                no_content_result = {
-                                    "__filename": file_record.file_name,
-                                    "__error": "No text content in result",
-                                    "__is_primary": is_primary_file
-                                }
-                                if is_awb:
-                                    no_content_result["__file_id"] = file_record.file_id
-                                    no_content_result["__source_path"] = file_record.file_path
-                                all_results.append(no_content_result)
-
-                    except Exception as e:
-                        logger.error(f"Error processing file {file_record.file_name}: {str(e)}")
-                        error_result = {
-                            "__filename": file_record.file_name,
-                            "__error": f"Processing failed: {str(e)}",
-                            "__is_primary": is_primary_file
-                        }
-                        if is_awb:
-                            error_result["__file_id"] = file_record.file_id
-                            error_result["__source_path"] = file_record.file_path
-                        all_results.append(error_result)
-
-                # Clean up temporary files
-                for temp_file in temp_files_to_cleanup:
-                    try:
-                        os.unlink(temp_file)
-                    except:
-                        pass
+                file_semaphore = asyncio.Semaphore(self._file_ocr_concurrency())
+                pages_per_chunk = resolve_pages_per_chunk(doc_type)
+                # Files with a matching COMPLETED checkpoint are reused, so restarts only redo unfinished files
+                fingerprint = self._ocr_fingerprint(prompt, schema, pages_per_chunk)
+                file_results = await asyncio.gather(*[
+                    self._ocr_item_file(
+                        file_semaphore, file_record, is_primary_file, prompt, schema, is_awb, pages_per_chunk,
+                        item_id=item_id, file_link=file_link, fingerprint=fingerprint,
+                    )
+                    for file_record, file_link, is_primary_file in all_files
+                ])
+                all_results = [result for result in file_results if result is not None]
 
                 if not all_results:
                     raise Exception("No results generated")
@@ -1923,8 +2370,9 @@ class OrderProcessor:
                     db.commit()
                     return
 
-                # Generate consolidated reports
-                await self._generate_consolidated_reports(order_id, all_consolidated_results)
+                # Generate consolidated reports; the document types' OCR schemas decide which arrays become rows
+                row_axes = await self._consolidated_row_axes(completed_items)
+                await self._generate_consolidated_reports(order_id, all_consolidated_results, row_axes)
 
                 # Mark order as completed
                 order.status = OrderStatus.COMPLETED
@@ -1939,7 +2387,34 @@ class OrderProcessor:
                 order.error_message = f"Consolidation failed: {str(e)}"
                 db.commit()
 
-    async def _generate_consolidated_reports(self, order_id: int, results: List[Dict[str, Any]]):
+    async def _consolidated_row_axes(self, items: List[OcrOrderItem]) -> Optional[Set[str]]:
+        """Arrays of objects declared in the items' OCR schemas (None = explode every array).
+
+        Falls back to None when any document type's schema cannot be loaded, so its
+        documents are not collapsed by the other types' row axes.
+        """
+        row_axes: Set[str] = set()
+        seen = set()
+        for item in items:
+            if not item.company or not item.document_type:
+                return None
+            key = (item.company.company_code, item.document_type.type_code)
+            if key in seen:
+                continue
+            seen.add(key)
+            schema = await self.prompt_schema_manager.get_schema(*key)
+            if not isinstance(schema, dict):
+                logger.warning(f"⚠️ No OCR schema for {key[0]}/{key[1]}; consolidated export expands every array")
+                return None
+            row_axes |= row_axes_from_schema(schema)
+        return row_axes
+
+    async def _generate_consolidated_reports(
+        self,
+        order_id: int,
+        results: List[Dict[str, Any]],
+        row_axes: Optional[Set[str]] = None,
+    ):
         """Generate consolidated reports for the entire order"""
         try:
             s3_base = f"results/orders/{order_id // 1000}/consolidated"
@@ -1947,7 +2422,9 @@ class OrderProcessor:
             # Save consolidated JSON
             json_content = json.dumps(results, indent=2, ensure_ascii=False)
             json_s3_key = f"{s3_base}/order_{order_id}_consolidated.json"
-            json_upload_success = self.s3_manager.upload_file(json_content.encode('utf-8'), json_s3_key)
+            json_upload_success = await asyncio.to_thread(
+                self.s3_manager.upload_file, json_content.encode('utf-8'), json_s3_key
+            )
 
             # Save consolidated Excel
             excel_path = None
@@ -1955,12 +2432,13 @@ class OrderProcessor:
                 temp_excel_path = temp_excel.name
 
             try:
-                json_to_excel(results, temp_excel_path)
+                # Exports and uploads run off the event loop so job heartbeats and other orders keep going
+                await asyncio.to_thread(json_to_excel, results, temp_excel_path, row_axes=row_axes)
 
                 with open(temp_excel_path, 'rb') as excel_file:
                     excel_content = excel_file.read()
                     excel_s3_key = f"{s3_base}/order_{order_id}_consolidated.xlsx"
-                    excel_upload_success = self.s3_manager.upload_file(excel_content, excel_s3_key)
+                    excel_upload_success = await asyncio.to_thread(self.s3_manager.upload_file, excel_content, excel_s3_key)
 
                     if excel_upload_success:
                         excel_path = f"s3://{self.s3_manager.bucket_name}/{self.s3_manager.upload_prefix}{excel_s3_key}"
@@ -1974,12 +2452,12 @@ class OrderProcessor:
                 temp_csv_path = temp_csv.name
 
             try:
-                json_to_csv(results, temp_csv_path)
+                await asyncio.to_thread(json_to_csv, results, temp_csv_path, row_axes=row_axes)
 
                 with open(temp_csv_path, 'rb') as csv_file:
                     csv_content = csv_file.read()
                     csv_s3_key = f"{s3_base}/order_{order_id}_consolidated.csv"
-                    csv_upload_success = self.s3_manager.upload_file(csv_content, csv_s3_key)
+                    csv_upload_success = await asyncio.to_thread(self.s3_manager.upload_file, csv_content, csv_s3_key)
 
                     if csv_upload_success:
                         csv_path = f"s3://{self.s3_manager.bucket_name}/{self.s3_manager.upload_prefix}{csv_s3_key}"
@@ -2034,8 +2512,111 @@ class OrderProcessor:
             raise
 
 
-    async def process_order_mapping_only(self, order_id: int):
-        """Process mapping for an order using per-item configurations."""
+    def _map_order_item(
+        self,
+        order_id: int,
+        item: OcrOrderItem,
+        mapping_item_type: MappingItemType,
+    ) -> Tuple[str, pd.DataFrame, Optional[str], bool]:
+        """Build, join and persist one item's mapped frame.
+
+        Returns (mapped_path, annotated_df, fingerprint, reused). When the item's
+        input fingerprint matches the stored one, the stored frame is reused
+        instead of rebuilding and re-joining it.
+
+        Runs on the mapping worker pool: it must not use the DB session, only
+        attributes already loaded on the item.
+        """
+        logger.info(
+            "Processing mapping for order %s item %s (type=%s)",
+            order_id,
+            item.item_id,
+            mapping_item_type.value,
+        )
+
+        records = self._load_item_records(item)
+        records_hash = hashlib.sha256(
+            json.dumps(records, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+        ).hexdigest()
+
+        master_path = item.mapping_config.get("master_csv_path")
+        if not master_path:
+            raise RuntimeError("master_csv_path missing from mapping configuration")
+
+        # Only the join keys and configured master_columns are loaded when the config restricts them
+        master_columns, master_dtypes = master_projection(item.mapping_config)
+
+        merged_df: Optional[pd.DataFrame] = None
+        fingerprint: Optional[str] = None
+        reused = False
+        if item.mapping_fingerprint:
+            master_version = get_master_data_cache().version(
+                master_cache_key(master_path, master_columns, master_dtypes),
+                probe=lambda: self._probe_master_version(master_path),
+            )
+            fingerprint = self._mapping_fingerprint(item, mapping_item_type, records_hash, master_version)
+            if fingerprint and fingerprint == item.mapping_fingerprint:
+                merged_df = self._load_mapped_frame(order_id, item.item_id)
+                reused = merged_df is not None
+
+        if reused:
+            logger.info(f"♻️ Reusing mapped frame for order {order_id} item {item.item_id} (inputs unchanged)")
+            mapped_path = (
+                f"s3://{self.s3_manager.bucket_name}/{self.s3_manager.upload_prefix}"
+                f"{self._item_mapped_csv_key(order_id, item.item_id)}"
+            )
+        else:
+            if mapping_item_type == MappingItemType.SINGLE_SOURCE:
+                item_df = self._build_single_source_dataframe(item, records)
+            else:
+                internal_key = item.mapping_config.get("internal_join_key") if isinstance(item.mapping_config, dict) else None
+                # Support per-attachment join keys; 'internal_key' acts as default if provided
+                item_df = self._build_multi_source_dataframe(item, records, internal_key)
+
+            master_entry = self._get_master_csv_entry(master_path, master_columns, master_dtypes)
+
+            merged_df = self._join_with_master_csv(
+                item_df,
+                master_entry.frame.copy(deep=False),
+                item.mapping_config.get("external_join_keys", []),
+                item.mapping_config.get("column_aliases"),
+                item.mapping_config.get("join_normalize") or item.mapping_config.get("join_value_normalization"),
+                item.mapping_config.get("merge_suffix"),
+                master_entry=master_entry,
+            )
+
+            mapped_path = self._persist_item_mapping_result(order_id, item, merged_df)
+            # Fingerprint the master version actually joined, not the one probed above
+            fingerprint = self._mapping_fingerprint(item, mapping_item_type, records_hash, master_entry.version)
+            if fingerprint and not self._save_mapped_frame(order_id, item.item_id, merged_df):
+                fingerprint = None
+
+        annotated_df = merged_df.copy()
+        # Optional: augment with metadata columns based on mapping spec defined in mapping_config.output_meta
+        mapping_spec = None
+        try:
+            if isinstance(item.mapping_config, dict):
+                mapping_spec = item.mapping_config.get("output_meta")
+        except Exception:
+            mapping_spec = None
+        self._apply_output_metadata(
+            annotated_df,
+            {
+                "order_id": order_id,
+                "item_id": item.item_id,
+                "item_name": item.item_name or "",
+                "company_id": item.company_id,
+                "doc_type_id": item.doc_type_id,
+            },
+            mapping_spec,
+        )
+        return mapped_path, annotated_df, fingerprint, reused
+
+    async def process_order_mapping_only(self, order_id: int) -> Optional[str]:
+        """Process mapping for an order using per-item configurations.
+
+        Returns the order's error message when the run left it FAILED, like process_order.
+        """
         with Session(engine) as db:
             order = db.query(OcrOrder).filter(OcrOrder.order_id == order_id).first()
             if not order:
@@ -2085,8 +2666,22 @@ class OrderProcessor:
                     order.error_message = "No items with OCR results available for mapping"
                     order.updated_at = datetime.utcnow()
                     db.commit()
-                return
+                return self._run_error(order)
+
+            def _mark_failed(failed_item: OcrOrderItem, exc: BaseException) -> None:
+                logger.error(
+                    "Failed to map order %s item %s: %s",
+                    order_id,
+                    failed_item.item_id,
+                    exc,
+                )
+                failed_item.status = OrderItemStatus.FAILED
+                failed_item.error_message = str(exc)
+                failed_item.updated_at = datetime.utcnow()
+                item_failures[failed_item.item_id] = str(exc)
 
+            # Resolve configurations first; all DB work stays on this session's thread
+            mapping_jobs: List[Tuple[OcrOrderItem, MappingItemType]] = []
             for item in items:
                 try:
                     resolved = resolver.resolve_for_item(
@@ -2109,77 +2704,40 @@ class OrderProcessor:
                     mapping_item_type = MappingItemType(
                         item.mapping_config.get("item_type", item.item_type.value)
                     )
-
-                    logger.info(
-                        "Processing mapping for order %s item %s (type=%s)",
-                        order_id,
-                        item.item_id,
-                        mapping_item_type.value,
-                    )
-
-                    records = self._load_item_records(item)
-
-                    if mapping_item_type == MappingItemType.SINGLE_SOURCE:
-                        item_df = self._build_single_source_dataframe(item, records)
-                    else:
-                        internal_key = item.mapping_config.get("internal_join_key") if isinstance(item.mapping_config, dict) else None
-                        # Support per-attachment join keys; 'internal_key' acts as default if provided
-                        item_df = self._build_multi_source_dataframe(item, records, internal_key)
-
-                    master_path = item.mapping_config.get("master_csv_path")
-                    if not master_path:
-                        raise RuntimeError("master_csv_path missing from mapping configuration")
-
-                    master_df = self._get_master_csv_dataframe(master_path)
-
-                    merged_df = self._join_with_master_csv(
-                        item_df,
-                        master_df,
-                        item.mapping_config.get("external_join_keys", []),
-                        item.mapping_config.get("column_aliases"),
-                        item.mapping_config.get("join_normalize") or item.mapping_config.get("join_value_normalization"),
-                        item.mapping_config.get("merge_suffix"),
-                    )
-
-                    mapped_path = self._persist_item_mapping_result(order_id, item, merged_df)
-                    item.ocr_result_csv_path = mapped_path
-                    item.updated_at = datetime.utcnow()
-                    item.status = OrderItemStatus.COMPLETED
-                    item.error_message = None
-
-                    annotated_df = merged_df.copy()
-                    # Optional: augment with metadata columns based on mapping spec defined in mapping_config.output_meta
-                    mapping_spec = None
-                    try:
-                        if isinstance(item.mapping_config, dict):
-                            mapping_spec = item.mapping_config.get("output_meta")
-                    except Exception:
-                        mapping_spec = None
-                    self._apply_output_metadata(
-                        annotated_df,
-                        {
-                            "order_id": order_id,
-                            "item_id": item.item_id,
-                            "item_name": item.item_name or "",
-                            "company_id": item.company_id,
-                            "doc_type_id": item.doc_type_id,
-                        },
-                        mapping_spec,
-                    )
-                    aggregated_frames.append(annotated_df)
-
+                    mapping_jobs.append((item, mapping_item_type))
                 except Exception as exc:
-                    logger.error(
-                        "Failed to map order %s item %s: %s",
-                        order_id,
-                        item.item_id,
-                        exc,
-                    )
-                    item.status = OrderItemStatus.FAILED
-                    item.error_message = str(exc)
-                    item.updated_at = datetime.utcnow()
-                    item_failures[item.item_id] = str(exc)
+                    _mark_failed(item, exc)
+
+            # Map items concurrently on the mapping worker pool (download, build, join, upload)
+            loop = asyncio.get_running_loop()
+            executor = get_mapping_executor()
+            outcomes = await asyncio.gather(
+                *[
+                    loop.run_in_executor(executor, self._map_order_item, order_id, item, mapping_item_type)
+                    for item, mapping_item_type in mapping_jobs
+                ],
+                return_exceptions=True,
+            )
+
+            reused_count = 0
+            for (item, _), outcome in zip(mapping_jobs, outcomes):
+                if isinstance(outcome, BaseException):
+                    _mark_failed(item, outcome)
+                    continue
+                mapped_path, annotated_df, fingerprint, reused = outcome
+                reused_count += int(reused)
+                item.mapping_fingerprint = fingerprint
+                item.ocr_result_csv_path = mapped_path
+                item.updated_at = datetime.utcnow()
+                item.status = OrderItemStatus.COMPLETED
+                item.error_message = None
+                aggregated_frames.append(annotated_df)
 
+            if mapping_jobs:
+                logger.info(
+                    f"♻️ Order {order_id}: reused {reused_count}/{len(mapping_jobs)} item mappings, "
+                    f"recomputed {len(mapping_jobs) - reused_count}"
+                )
             db.commit()
 
         with Session(engine) as db:
@@ -2223,9 +2781,11 @@ class OrderProcessor:
                 try:
                     if order.primary_doc_type and order.primary_doc_type.template_json_path:
                         template_path = order.primary_doc_type.template_json_path
-                        template_json = self.special_csv_generator.load_template_from_s3(template_path)
-                        self.special_csv_generator.validate_template(template_json)
-                        special_df = self.special_csv_generator.generate_special_csv(combined_df, template_json)
+                        # Cached with its compiled plan (validated when loaded); only re-fetched when the ETag changes
+                        template_json, template_plan = self.special_csv_generator.load_compiled_template(template_path)
+                        special_df = self.special_csv_generator.generate_special_csv(
+                            combined_df, template_json, plan=template_plan
+                        )
                         # Upload special CSV
                         special_key = f"{s3_base}/order_{order_id}_special.csv"
                         special_csv_bytes = special_df.to_csv(index=False).encode('utf-8')
@@ -2271,6 +2831,8 @@ class OrderProcessor:
                 })
             except Exception:
                 pass
+            return self._run_error(order)
+
     async def _load_expanded_ocr_results(self, order_id: int) -> List[Dict[str, Any]]:
         """Load OCR results in expanded format (individual rows per phone service)"""
         with Session(engine) as db:
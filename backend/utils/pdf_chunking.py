@@ -0,0 +1,108 @@
+"""
+PDF page chunking for OCR.
+
+Large multi-page PDFs (e.g. 40-page monthly bills) are split into page ranges
+that are OCR'd concurrently with the same prompt and schema; the per-chunk JSON
+results are merged back into a single document by concatenating array fields.
+
+Scalar fields are not combined: the value from the earliest chunk that has one
+is kept and later chunks' values for the same field are ignored. This suits
+header fields (invoice number, dates, customer) that are printed on the first
+page. Totals printed only on the last page are still picked up, because the
+earlier chunks leave them empty. A field whose value differs between pages, such
+as a running page subtotal, keeps the first chunk's value. Such fields should be
+arrays in the schema so that every chunk's value is kept.
+"""
+
+import logging
+import os
+from typing import Any, List, Optional
+
+try:
+    import fitz  # PyMuPDF
+
+    PYMUPDF_AVAILABLE = True
+except ImportError:  # pragma: no cover - environment without PyMuPDF
+    fitz = None
+    PYMUPDF_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+def default_pages_per_chunk() -> int:
+    """Global fallback chunk size (OCR_PDF_PAGES_PER_CHUNK, default 0 = disabled)."""
+    try:
+        return max(0, int(os.getenv("OCR_PDF_PAGES_PER_CHUNK", "0")))
+    except ValueError:
+        return 0
+
+
+def resolve_pages_per_chunk(doc_type: Any) -> int:
+    """Chunk size for a document type: its own setting, else the global default."""
+    value = getattr(doc_type, "pdf_pages_per_chunk", None) if doc_type is not None else None
+    if value is not None:
+        return max(0, int(value))
+    return default_pages_per_chunk()
+
+
+def count_pdf_pages(pdf_bytes: bytes) -> int:
+    if not PYMUPDF_AVAILABLE:
+        return 0
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return doc.page_count
+
+
+def split_pdf_bytes(pdf_bytes: bytes, pages_per_chunk: int) -> List[bytes]:
+    """Split a PDF into chunks of pages_per_chunk pages.
+
+    Returns [pdf_bytes] unchanged when chunking is disabled, PyMuPDF is missing
+    or the document already fits in one chunk.
+    """
+    if pages_per_chunk <= 0 or not PYMUPDF_AVAILABLE:
+        return [pdf_bytes]
+
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as source:
+        page_count = source.page_count
+        if page_count <= pages_per_chunk:
+            return [pdf_bytes]
+
+        chunks = []
+        for start in range(0, page_count, pages_per_chunk):
+            end = min(start + pages_per_chunk, page_count) - 1
+            with fitz.open() as part:
+                part.insert_pdf(source, from_page=start, to_page=end)
+                chunks.append(part.tobytes(garbage=3, deflate=True))
+
+    logger.info(f"📄 Split {page_count}-page PDF into {len(chunks)} chunks of ≤{pages_per_chunk} pages")
+    return chunks
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def merge_chunk_values(base: Any, incoming: Any) -> Any:
+    """Merge one chunk's value into the accumulated value.
+
+    - list + list: concatenated in page order
+    - dict + dict: merged key by key
+    - scalars: the first non-empty value wins, later values are dropped (see module docstring)
+    """
+    if isinstance(base, list) and isinstance(incoming, list):
+        return base + incoming
+    if isinstance(base, dict) and isinstance(incoming, dict):
+        merged = dict(base)
+        for key, value in incoming.items():
+            merged[key] = merge_chunk_values(merged[key], value) if key in merged else value
+        return merged
+    return incoming if _is_empty(base) else base
+
+
+def merge_chunk_results(chunk_results: List[Any]) -> Optional[Any]:
+    """Merge parsed per-chunk JSON documents (in page order) into one document."""
+    merged: Optional[Any] = None
+    for result in chunk_results:
+        if result is None:
+            continue
+        merged = result if merged is None else merge_chunk_values(merged, result)
+    return merged
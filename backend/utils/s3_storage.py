@@ -1892,6 +1892,38 @@ class S3StorageManager:
             logger.error(f"❌ Failed to delete from stored path '{stored_path}': {e}")
             return False
 
+    def get_etag_by_stored_path(self, stored_path: str) -> Optional[str]:
+        """
+        Get the ETag of a stored file with a HEAD request (no download)
+
+        Args:
+            stored_path: Full S3 URI (s3://bucket/key) or relative path within current bucket
+
+        Returns:
+            Optional[str]: ETag without quotes, None if not found or on error
+        """
+        if not stored_path or stored_path.startswith('/'):
+            return None
+        if stored_path.startswith('s3://'):
+            s3_parts = stored_path[5:].split('/', 1)
+            if len(s3_parts) != 2:
+                return None
+            bucket_name, s3_key = s3_parts
+        else:
+            bucket_name, s3_key = self.bucket_name, stored_path
+
+        try:
+            response = self.s3_client.head_object(Bucket=bucket_name, Key=s3_key)
+            etag = response.get("ETag")
+            return etag.strip('"') if etag else None
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("404", "NoSuchKey"):
+                logger.warning(f"⚠️ Failed to read ETag for {stored_path}: {e}")
+            return None
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to read ETag for {stored_path}: {e}")
+            return None
+
 
 # 全局S3存储管理器实例
 _s3_manager = None
@@ -1,15 +1,31 @@
-"""Generate special CSV outputs based on template.json definitions."""
+"""Generate special CSV outputs based on template.json definitions.
+
+A template is compiled once into a SpecialCsvPlan: one step per output column,
+in column_order. Each computed column sees the mapped DataFrame plus the
+template columns before it, so column_order is already a valid dependency
+order. Generation writes every column into a dict, gives each expression a
+narrow frame holding only the columns it reads, and materializes the output
+DataFrame once at the end.
+
+Templates loaded by path are cached process-wide together with their plan
+(see utils.template_cache), so mapping runs neither download nor compile a
+template that has not changed.
+"""
 
 from __future__ import annotations
 
 import json
 import logging
-from typing import Any, Dict, Iterable, List, Optional, Sequence
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
 
+import numpy as np
 import pandas as pd
 
-from .expression_engine import ExpressionEngine, ParsedExpression
+from .expression_engine import CompiledExpression, ExpressionEngine, ParsedExpression, row_dtype_of
 from .file_storage import get_file_storage
+from .template_cache import get_template_cache
 from .template_service import (
     collect_computed_expressions,
     extract_expression_variables,
@@ -20,6 +36,29 @@ from .template_service import (
 logger = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True)
+class ColumnStep:
+    """One output column of a template, in evaluation order."""
+
+    name: str
+    column_type: str
+    default_value: Any
+    source_column: Optional[str] = None
+    value: Any = None
+    expression: Optional[CompiledExpression] = None
+    # Earlier template columns a computed column reads (other references come from the mapped DataFrame)
+    depends_on: Tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class SpecialCsvPlan:
+    """Evaluation plan compiled once per template."""
+
+    column_order: Tuple[str, ...]
+    steps: Tuple[ColumnStep, ...]
+    required_source_columns: Tuple[str, ...]
+
+
 class SpecialCsvGenerator:
     """Create special CSV DataFrames from mapped DataFrames and templates."""
 
@@ -31,8 +70,38 @@ class SpecialCsvGenerator:
     # Template loading / validation
     # ------------------------------------------------------------------
     def load_template_from_s3(self, template_path: str) -> Dict[str, Any]:
-        """Load and parse template JSON from S3 or local storage."""
+        """Load and parse template JSON from S3 or local storage (cached; treat as read-only)."""
 
+        return self.load_compiled_template(template_path)[0]
+
+    def load_compiled_template(self, template_path: str) -> Tuple[Dict[str, Any], SpecialCsvPlan]:
+        """Validated template and its compiled plan, from the process-wide template cache.
+
+        Both are shared between orders and must not be modified.
+        """
+
+        entry = get_template_cache().get_entry(
+            template_path,
+            loader=lambda: self._load_template(template_path),
+            probe=lambda: self._probe_template_version(template_path),
+        )
+        return entry.template, entry.plan
+
+    def _probe_template_version(self, template_path: str) -> Optional[str]:
+        """Cheap version token for a template file (S3 ETag, or mtime and size for local files)."""
+
+        if template_path.startswith("s3://"):
+            s3_manager = self._file_storage.s3_manager
+            return s3_manager.get_etag_by_stored_path(template_path) if s3_manager else None
+        try:
+            stat = os.stat(template_path)
+        except OSError:
+            return None
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+    def _load_template(self, template_path: str) -> Tuple[Dict[str, Any], SpecialCsvPlan, Optional[str]]:
+        # Read the version first: if the file changes mid-download the next check reloads it
+        version = self._probe_template_version(template_path)
         raw_content = self._file_storage.download_file(template_path)
         if not raw_content:
             raise FileNotFoundError(f"Template file not found: {template_path}")
@@ -42,8 +111,7 @@ class SpecialCsvGenerator:
         except (UnicodeDecodeError, json.JSONDecodeError) as exc:
             raise ValueError(f"Invalid template JSON at {template_path}: {exc}") from exc
 
-        validate_template_payload(template_json)
-        return template_json
+        return template_json, self.build_plan(template_json), version
 
     def validate_template(self, template_json: Dict[str, Any]) -> None:
         """Validate template structure and log computed column information."""
@@ -56,6 +124,54 @@ class SpecialCsvGenerator:
                 ", ".join(computed_columns.keys()),
             )
 
+    def build_plan(self, template_config: Dict[str, Any]) -> SpecialCsvPlan:
+        """Compile a template into its evaluation plan (expressions parsed and compiled once).
+
+        A reference to a template column that comes later in column_order (or
+        to no template column) reads the mapped DataFrame column of that name.
+        """
+
+        validate_template_payload(template_config)
+        column_definitions: Dict[str, Any] = template_config["column_definitions"]
+
+        steps: List[ColumnStep] = []
+        produced: List[str] = []
+        for column_name in template_config["column_order"]:
+            definition = column_definitions[column_name]
+            column_type = definition.get("type")
+            compiled = None
+            depends_on: Tuple[str, ...] = ()
+
+            if column_type == "computed":
+                try:
+                    compiled = self.expression_engine.compile_expression(definition.get("expression"))
+                except SyntaxError as exc:
+                    raise ValueError(f"Invalid expression for column '{column_name}': {exc}") from exc
+                if compiled.columns is None:
+                    depends_on = tuple(produced)
+                else:
+                    depends_on = tuple(name for name in compiled.columns if name in produced)
+
+            steps.append(
+                ColumnStep(
+                    name=column_name,
+                    column_type=column_type,
+                    default_value=definition.get("default_value", ""),
+                    source_column=definition.get("source_column"),
+                    value=definition.get("value", definition.get("default_value", "")),
+                    expression=compiled,
+                    depends_on=depends_on,
+                )
+            )
+            if column_name not in produced:
+                produced.append(column_name)
+
+        return SpecialCsvPlan(
+            column_order=tuple(template_config["column_order"]),
+            steps=tuple(steps),
+            required_source_columns=tuple(self._required_source_columns(column_definitions)),
+        )
+
     # ------------------------------------------------------------------
     # Generation API
     # ------------------------------------------------------------------
@@ -63,13 +179,19 @@ class SpecialCsvGenerator:
         self,
         standard_df: pd.DataFrame,
         template_config: Dict[str, Any],
+        plan: Optional[SpecialCsvPlan] = None,
     ) -> pd.DataFrame:
-        """Generate the special CSV DataFrame based on the template definition."""
+        """Generate the special CSV DataFrame based on the template definition.
+
+        ``plan`` is the template's compiled plan (see load_compiled_template);
+        it is built from ``template_config`` when omitted.
+        """
 
         if standard_df is None or standard_df.empty:
             raise ValueError("Standard DataFrame must not be empty for special CSV generation")
 
-        validate_template_payload(template_config)
+        if plan is None:
+            plan = self.build_plan(template_config)
 
         # === COMPREHENSIVE DIAGNOSTIC LOGGING ===
         logger.info(f"=== SPECIAL CSV GENERATION DIAGNOSTICS ===")
@@ -133,99 +255,63 @@ class SpecialCsvGenerator:
         logger.info(f"=== END DIAGNOSTICS ===")
         # === END DIAGNOSTIC LOGGING ===
 
-        self._validate_columns_exist(standard_df, self._required_source_columns(column_definitions))
+        self._validate_columns_exist(standard_df, plan.required_source_columns)
 
-        result_df = pd.DataFrame(index=standard_df.index)
+        index = standard_df.index
+        has_computed = any(step.column_type == "computed" for step in plan.steps)
+        matched_mask, use_matched_logic = self._matched_logic(standard_df) if has_computed else (None, False)
 
-        for column_name in column_order:
-            definition = column_definitions[column_name]
-            column_type = definition.get("type")
-            default_value = definition.get("default_value", "")
+        # Columns visible to expressions: the mapped DataFrame, then template columns as they
+        # are produced (a template column shadows a mapped column of the same name)
+        available: Dict[Any, pd.Series] = dict(standard_df.items())
+        output: Dict[str, pd.Series] = {}
 
-            if column_type == "source":
-                source_column = definition.get("source_column")
-                result_df[column_name] = standard_df[source_column]
+        for step in plan.steps:
+            if step.column_type == "source":
+                series = standard_df[step.source_column]
 
-            elif column_type == "computed":
-                expression = definition.get("expression")
-                parsed_expression = self.expression_engine.parse_expression(expression)
-
-                logger.info(f"Processing computed column '{column_name}' with expression: '{expression}'")
-
-                # Decide whether to use Matched-based logic with robust validation
-                use_matched_logic = False
-                matched_mask = None
-
-                if 'Matched' in standard_df.columns:
-                    try:
-                        # Validate Matched column and create boolean mask
-                        matched_mask = standard_df['Matched'].astype(bool)
-                        matched_count = matched_mask.sum()
-                        total_count = len(matched_mask)
-
-                        logger.info(f"Matched analysis for '{column_name}': {matched_count}/{total_count} rows matched")
-
-                        # Only use Matched logic if we have both matched and unmatched rows
-                        # AND there's at least some matched rows
-                        if 0 < matched_count < total_count:
-                            use_matched_logic = True
-                            logger.info(f"Using Matched-based logic for '{column_name}': {matched_count} matched, {total_count - matched_count} unmatched")
-                        elif matched_count == 0:
-                            logger.warning(f"ALL rows unmatched for '{column_name}'. This suggests a Matched detection issue - using fallback logic")
-                        elif matched_count == total_count:
-                            logger.info(f"All rows matched for '{column_name}'. Using standard computation for all rows")
-
-                    except Exception as e:
-                        logger.error(f"Failed to process Matched column for '{column_name}': {e}. Using fallback logic")
-                else:
-                    logger.info(f"No Matched column found for '{column_name}'. Using standard computation for all rows")
+            elif step.column_type == "constant":
+                # Same dtype inference as broadcasting the scalar into a DataFrame column
+                series = pd.Series([step.value] * len(index), index=index)
+
+            else:
+                logger.info(f"Processing computed column '{step.name}' with expression: '{step.expression.parsed.original}'")
+                frame = self._expression_frame(step.expression, available, index)
+                row_dtype = self._row_dtype(standard_df, output)
 
-                # Apply the appropriate logic
                 if use_matched_logic:
-                    # Use Matched-based logic (mixed match status)
-                    computed_values = pd.Series(index=standard_df.index, data=default_value)
-
-                    # Merge standard_df with result_df for calculation context
-                    merged_df = pd.concat([standard_df, result_df], axis=1)
-
-                    # Calculate only for matched rows
-                    matched_results = self._evaluate_computed_column(
-                        merged_df[matched_mask],
-                        parsed_expression,
-                        default_value,
-                        column_name,
+                    # Calculate only for matched rows; unmatched rows keep the default value
+                    series = pd.Series(index=index, data=step.default_value)
+                    series[matched_mask] = self._evaluate_computed_column(
+                        frame[matched_mask],
+                        step.expression,
+                        step.default_value,
+                        step.name,
+                        row_dtype,
+                    )
+                    logger.info(
+                        f"Computed column '{step.name}': {int(matched_mask.sum())} calculated, "
+                        f"{int((~matched_mask).sum())} used default value"
                     )
-                    computed_values[matched_mask] = matched_results
-
-                    # Log statistics
-                    unmatched_count = (~matched_mask).sum()
-                    if unmatched_count > 0:
-                        logger.info(f"Computed column '{column_name}': {matched_count} calculated, {unmatched_count} used default value")
-
-                    result_df[column_name] = computed_values
-
                 else:
-                    # Use original logic (no Matched column, or all matched/unmatched)
-                    logger.info(f"Computed column '{column_name}': using standard computation for all rows")
-                    merged_df = pd.concat([standard_df, result_df], axis=1)
-                    result_df[column_name] = self._evaluate_computed_column(
-                        merged_df,
-                        parsed_expression,
-                        default_value,
-                        column_name,
+                    series = self._evaluate_computed_column(
+                        frame,
+                        step.expression,
+                        step.default_value,
+                        step.name,
+                        row_dtype,
                     )
 
-            elif column_type == "constant":
-                result_df[column_name] = definition.get("value", default_value)
+            if step.default_value is not None:
+                series = series.fillna(step.default_value)
 
-            else:
-                raise ValueError(f"Unsupported column type '{column_type}' for column '{column_name}'")
-
-            if default_value is not None:
-                result_df[column_name] = result_df[column_name].fillna(default_value)
+            output[step.name] = series
+            available[step.name] = series
 
-        # Ensure column order aligns with template definition
-        result_df = result_df[column_order]
+        # Materialize the output once, in template column order
+        result_df = pd.DataFrame(output, index=index)
+        if len(set(plan.column_order)) != len(plan.column_order):
+            result_df = result_df[list(plan.column_order)]
 
         return result_df
 
@@ -235,28 +321,74 @@ class SpecialCsvGenerator:
     def _evaluate_computed_column(
         self,
         standard_df: pd.DataFrame,
-        parsed_expression: ParsedExpression,
+        expression: Union[ParsedExpression, CompiledExpression],
         default_value: Optional[Any],
         target_column: str,
+        row_dtype: Optional[Any] = None,
     ) -> pd.Series:
-        """Evaluate a computed column across the DataFrame."""
-
-        def _compute(row: pd.Series) -> Any:
-            context = row.to_dict()
-            try:
-                value = self.expression_engine.evaluate(parsed_expression, context, default_value, standard_df)
-            except Exception as exc:
-                raise ValueError(
-                    f"Failed to evaluate expression for column '{target_column}': {exc}"
-                ) from exc
-            return value
+        """Evaluate a computed column across the DataFrame (column-wise when the expression allows)."""
 
-        series = standard_df.apply(_compute, axis=1)
+        try:
+            series = self.expression_engine.evaluate_column(
+                expression, standard_df, default_value, row_dtype=row_dtype
+            )
+        except Exception as exc:
+            raise ValueError(
+                f"Failed to evaluate expression for column '{target_column}': {exc}"
+            ) from exc
 
         if default_value is not None:
             return series.fillna(default_value)
         return series
 
+    @staticmethod
+    def _matched_logic(standard_df: pd.DataFrame) -> Tuple[Optional[pd.Series], bool]:
+        """Matched mask and whether computed columns are only calculated for matched rows."""
+
+        if 'Matched' not in standard_df.columns:
+            logger.info("No Matched column found. Using standard computation for all rows")
+            return None, False
+
+        try:
+            # Validate Matched column and create boolean mask
+            matched_mask = standard_df['Matched'].astype(bool)
+        except Exception as e:
+            logger.error(f"Failed to process Matched column: {e}. Using fallback logic")
+            return None, False
+
+        matched_count = matched_mask.sum()
+        total_count = len(matched_mask)
+        logger.info(f"Matched analysis for computed columns: {matched_count}/{total_count} rows matched")
+
+        # Only use Matched logic if we have both matched and unmatched rows
+        if 0 < matched_count < total_count:
+            logger.info(f"Using Matched-based logic: {matched_count} matched, {total_count - matched_count} unmatched")
+            return matched_mask, True
+        if matched_count == 0:
+            logger.warning("ALL rows unmatched. This suggests a Matched detection issue - using fallback logic")
+        else:
+            logger.info("All rows matched. Using standard computation for all rows")
+        return matched_mask, False
+
+    @staticmethod
+    def _expression_frame(
+        expression: CompiledExpression, available: Dict[Any, pd.Series], index: pd.Index
+    ) -> pd.DataFrame:
+        """Only the columns an expression reads (all of them for dynamic references)."""
+
+        names = expression.columns if expression.columns is not None else list(available)
+        return pd.DataFrame({name: available[name] for name in names if name in available}, index=index)
+
+    @staticmethod
+    def _row_dtype(standard_df: pd.DataFrame, output: Dict[str, pd.Series]) -> np.dtype:
+        """Row dtype of the mapped DataFrame joined with the template columns produced so far."""
+
+        row_dtype = row_dtype_of(standard_df)
+        if row_dtype == object or not output:
+            return row_dtype  # mixed frames stay object whatever is added
+        produced = pd.DataFrame({name: series.iloc[:0] for name, series in output.items()})
+        return row_dtype_of(pd.concat([standard_df.iloc[:0], produced], axis=1))
+
     @staticmethod
     def _required_source_columns(column_definitions: Dict[str, Any]) -> List[str]:
         """Extract columns that must exist in the INPUT DataFrame (not template-created columns)."""
@@ -0,0 +1,231 @@
+"""
+Process-wide cache for special CSV templates and their compiled plans.
+
+Every mapping run used to download template.json from S3, parse it and compile
+every computed-column expression again (a new SpecialCsvGenerator is created per
+order). This cache lives for the whole process and is keyed by template path
+(S3 URI); each entry holds the parsed template, its SpecialCsvPlan and the ETag
+observed when it was loaded.
+
+Within TEMPLATE_CACHE_REVALIDATE_SECONDS an entry is served without touching
+S3. After that the ETag is re-checked with a HEAD request and the template is
+only downloaded and compiled again when it changed. The admin template
+endpoints invalidate paths explicitly, so an upload is picked up immediately by
+this process; other worker processes see it at their next ETag check.
+
+Cached templates and plans are shared between orders and must be treated as
+read-only.
+
+Configuration (environment):
+- TEMPLATE_CACHE_REVALIDATE_SECONDS: seconds between ETag checks (default 60, 0 = check every use)
+- TEMPLATE_CACHE_MAX_ENTRIES:        templates kept in memory (default 64, 0 = disable caching)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .special_csv_generator import SpecialCsvPlan
+
+logger = logging.getLogger(__name__)
+
+# loader() -> (template, plan, ETag observed at download time)
+TemplateLoader = Callable[[], Tuple[Dict[str, Any], "SpecialCsvPlan", Optional[str]]]
+# probe() -> current ETag, or None when it cannot be determined
+VersionProbe = Callable[[], Optional[str]]
+
+
+@dataclass
+class TemplateCacheEntry:
+    template: Dict[str, Any]
+    plan: "SpecialCsvPlan"
+    version: Optional[str]
+    loaded_at: float
+    checked_at: float
+    load_seconds: float
+    hits: int = 0
+
+
+class TemplateCache:
+    """LRU cache of parsed templates and compiled plans with ETag revalidation."""
+
+    def __init__(self, max_entries: int = 64, revalidate_seconds: float = 60.0):
+        self.max_entries = max(0, max_entries)
+        self.revalidate_seconds = max(0.0, revalidate_seconds)
+
+        self._entries: "OrderedDict[str, TemplateCacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per path so concurrent orders wait for a single download instead of all loading
+        self._path_locks: Dict[str, threading.Lock] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.reloads = 0
+        self.probe_failures = 0
+        self.invalidations = 0
+        self.total_load_seconds = 0.0
+
+    def _path_lock(self, path: str) -> threading.Lock:
+        with self._lock:
+            lock = self._path_locks.get(path)
+            if lock is None:
+                lock = self._path_locks[path] = threading.Lock()
+            return lock
+
+    def _lookup(self, path: str) -> Optional[TemplateCacheEntry]:
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                self._entries.move_to_end(path)
+            return entry
+
+    def _fresh(self, entry: Optional[TemplateCacheEntry]) -> bool:
+        return entry is not None and time.monotonic() - entry.checked_at < self.revalidate_seconds
+
+    def _store(self, path: str, entry: TemplateCacheEntry) -> None:
+        with self._lock:
+            self._entries[path] = entry
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                logger.info(f"🧹 Template cache evicted {evicted}")
+
+    def _record_hit(self, entry: TemplateCacheEntry) -> TemplateCacheEntry:
+        with self._lock:
+            self.hits += 1
+            entry.hits += 1
+        return entry
+
+    def _load(self, path: str, loader: TemplateLoader, reload: bool) -> TemplateCacheEntry:
+        start = time.monotonic()
+        template, plan, version = loader()
+        now = time.monotonic()
+        elapsed = now - start
+        entry = TemplateCacheEntry(
+            template=template, plan=plan, version=version, loaded_at=now, checked_at=now, load_seconds=elapsed
+        )
+        with self._lock:
+            self.total_load_seconds += elapsed
+            if reload:
+                self.reloads += 1
+            else:
+                self.misses += 1
+        logger.info(
+            f"📥 Template {'reloaded' if reload else 'loaded'}: {path} "
+            f"({len(plan.steps)} columns, {elapsed:.3f}s, version={version})"
+        )
+        return entry
+
+    def get_entry(self, path: str, loader: TemplateLoader, probe: Optional[VersionProbe] = None) -> TemplateCacheEntry:
+        """Return the cache entry for path, loading or revalidating it as needed."""
+        if self.max_entries == 0:
+            return self._load(path, loader, reload=False)
+
+        entry = self._lookup(path)
+        if self._fresh(entry):
+            return self._record_hit(entry)
+
+        with self._path_lock(path):
+            # Another thread may have loaded/revalidated while we waited
+            entry = self._lookup(path)
+            if self._fresh(entry):
+                return self._record_hit(entry)
+
+            if entry is not None:
+                current = None
+                if probe is not None:
+                    try:
+                        current = probe()
+                    except Exception as e:
+                        logger.warning(f"⚠️ Template version check failed for {path}: {e}")
+                with self._lock:
+                    self.revalidations += 1
+                if current is None:
+                    with self._lock:
+                        self.probe_failures += 1
+                    if entry.version is not None:
+                        # Metadata unavailable: keep serving the cached template rather than re-downloading
+                        entry.checked_at = time.monotonic()
+                        return self._record_hit(entry)
+                elif current == entry.version:
+                    entry.checked_at = time.monotonic()
+                    return self._record_hit(entry)
+
+            entry = self._load(path, loader, reload=entry is not None)
+            self._store(path, entry)
+            return entry
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        """Drop one path (or everything) so the next use reloads it."""
+        with self._lock:
+            if path is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+            else:
+                dropped = int(self._entries.pop(path, None) is not None)
+            self.invalidations += dropped
+        if dropped:
+            logger.info(f"🧹 Template cache invalidated {path or 'all templates'}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.reloads
+            loads = self.misses + self.reloads
+            return {
+                "max_entries": self.max_entries,
+                "revalidate_seconds": self.revalidate_seconds,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "revalidations": self.revalidations,
+                "probe_failures": self.probe_failures,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "total_load_seconds": round(self.total_load_seconds, 3),
+                "avg_load_seconds": round(self.total_load_seconds / loads, 3) if loads else 0.0,
+                "templates": [
+                    {
+                        "path": path,
+                        "version": entry.version,
+                        "template_version": entry.template.get("version"),
+                        "columns": len(entry.plan.steps),
+                        "hits": entry.hits,
+                        "load_seconds": round(entry.load_seconds, 3),
+                        "age_seconds": round(time.monotonic() - entry.loaded_at, 1),
+                    }
+                    for path, entry in self._entries.items()
+                ],
+            }
+
+
+# 全局模板緩存實例
+_template_cache = None
+_template_cache_lock = threading.Lock()
+
+
+def get_template_cache() -> TemplateCache:
+    """獲取全局模板緩存實例"""
+    global _template_cache
+
+    if _template_cache is None:
+        with _template_cache_lock:
+            if _template_cache is None:
+                _template_cache = TemplateCache(
+                    max_entries=int(os.getenv("TEMPLATE_CACHE_MAX_ENTRIES", "64")),
+                    revalidate_seconds=float(os.getenv("TEMPLATE_CACHE_REVALIDATE_SECONDS", "60")),
+                )
+                logger.info(
+                    f"✅ Template cache initialised: max_entries={_template_cache.max_entries}, "
+                    f"revalidate={_template_cache.revalidate_seconds}s"
+                )
+
+    return _template_cache
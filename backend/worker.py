@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Order processing worker.
+
+Claims OCR / mapping jobs from the order_jobs table (see utils/job_queue.py),
+keeps their leases alive with heartbeats (from a separate thread, so steps that
+block the event loop do not let a lease expire) and runs them through OrderProcessor.
+A run that leaves its order FAILED is reported to the queue and retried with
+backoff; retries and reclaimed jobs resume through
+OrderProcessor.prepare_order_retry.
+Run as many workers as needed, on any node that can reach the database and S3:
+
+  python worker.py                              # all job types, 2 concurrent jobs
+  python worker.py --types OCR_ONLY PROCESS_ORDER --concurrency 4
+  python worker.py --once                       # drain the queue and exit
+
+The API only enqueues jobs when ORDER_JOB_MODE=queue.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import uuid
+from typing import List, Optional, Set
+
+from db.models import OrderJobType
+from utils.job_queue import (
+    ClaimedJob,
+    LeaseKeeper,
+    claim_next_job,
+    complete_job,
+    fail_job,
+    lease_seconds,
+    release_job,
+)
+from utils.order_processor import OrderProcessor
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+logger = logging.getLogger("worker")
+
+
+class OrderJobWorker:
+    """Polls the job table and runs claimed jobs with lease heartbeats."""
+
+    def __init__(
+        self,
+        worker_id: Optional[str] = None,
+        job_types: Optional[List[OrderJobType]] = None,
+        concurrency: int = 2,
+        poll_interval: float = 2.0,
+    ):
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.job_types = job_types
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.lease = lease_seconds()
+        self._stopping = asyncio.Event()
+        self._running: Set[asyncio.Task] = set()
+
+    async def _run_handler(self, job: ClaimedJob) -> Optional[str]:
+        """Run the job's pipeline; returns the order's error when the run left it FAILED."""
+        processor = OrderProcessor()
+        job_type = job.job_type
+        if job.resumed:
+            # Retry, reclaimed lease or released on shutdown: put stuck items back and resume from the order's current stage
+            job_type = await asyncio.to_thread(processor.prepare_order_retry, job.order_id, job.job_type)
+            if job_type is None:
+                return None
+
+        if job_type == OrderJobType.PROCESS_ORDER:
+            return await processor.process_order(job.order_id)
+        elif job_type == OrderJobType.OCR_ONLY:
+            return await processor.process_order_ocr_only(job.order_id)
+        elif job_type == OrderJobType.MAPPING_ONLY:
+            return await processor.process_order_mapping_only(job.order_id)
+        else:
+            raise ValueError(f"Unknown job type: {job_type}")
+
+    async def _execute(self, job: ClaimedJob) -> None:
+        handler = asyncio.create_task(self._run_handler(job))
+        # Heartbeats run on their own thread so blocking pipeline steps cannot starve them
+        loop = asyncio.get_running_loop()
+        keeper = LeaseKeeper(
+            job.job_id, self.worker_id, self.lease, lambda: loop.call_soon_threadsafe(handler.cancel)
+        ).start()
+        try:
+            try:
+                error = await handler
+            finally:
+                # Stop renewing before the outcome is reported (which clears the lease)
+                await asyncio.to_thread(keeper.stop)
+        except asyncio.CancelledError:
+            if self._stopping.is_set():
+                await asyncio.to_thread(release_job, job.job_id, self.worker_id)
+                logger.info(f"↩️ Released job {job.job_id} on shutdown")
+            return
+        except Exception as e:
+            logger.exception(f"❌ Job {job.job_id} (order {job.order_id}) raised")
+            await asyncio.to_thread(fail_job, job.job_id, self.worker_id, f"{type(e).__name__}: {e}")
+            return
+
+        if error:
+            # The runners record failures on the order instead of raising; retry through the queue
+            logger.warning(f"⚠️ Job {job.job_id} (order {job.order_id}) left the order FAILED: {error}")
+            await asyncio.to_thread(fail_job, job.job_id, self.worker_id, error)
+            return
+
+        if await asyncio.to_thread(complete_job, job.job_id, self.worker_id):
+            logger.info(f"✅ Job {job.job_id} ({job.job_type.value}, order {job.order_id}) completed")
+        else:
+            logger.warning(f"⚠️ Job {job.job_id} finished but its lease had been taken over")
+
+    async def run(self, once: bool = False) -> None:
+        logger.info(
+            f"🚀 Worker {self.worker_id} started: types={[t.value for t in self.job_types] if self.job_types else 'all'}, "
+            f"concurrency={self.concurrency}, lease={self.lease}s"
+        )
+        while not self._stopping.is_set():
+            claimed = None
+            if len(self._running) < self.concurrency:
+                try:
+                    claimed = await asyncio.to_thread(claim_next_job, self.worker_id, self.job_types, self.lease)
+                except Exception as e:
+                    logger.error(f"❌ Failed to claim job: {e}")
+
+            if claimed:
+                task = asyncio.create_task(self._execute(claimed))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+                continue
+
+            if once and not self._running:
+                break
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+        if self._running:
+            logger.info(f"⏳ Waiting for {len(self._running)} running job(s) to stop")
+            for task in list(self._running):
+                task.cancel()
+            await asyncio.gather(*self._running, return_exceptions=True)
+        logger.info(f"👋 Worker {self.worker_id} stopped")
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run an order processing worker")
+    parser.add_argument(
+        "--types",
+        nargs="*",
+        choices=[t.value for t in OrderJobType],
+        help="Job types to claim (default: all)",
+    )
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "2")))
+    parser.add_argument("--poll-interval", type=float, default=float(os.getenv("WORKER_POLL_INTERVAL", "2")))
+    parser.add_argument("--worker-id", default=os.getenv("WORKER_ID"))
+    parser.add_argument("--once", action="store_true", help="Exit when the queue is empty")
+    args = parser.parse_args()
+
+    job_types = [OrderJobType(t) for t in args.types] if args.types else None
+    worker = OrderJobWorker(args.worker_id, job_types, args.concurrency, args.poll_interval)
+
+    async def _main() -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, worker.stop)
+            except NotImplementedError:  # pragma: no cover - Windows
+                pass
+        await worker.run(once=args.once)
+
+    asyncio.run(_main())
+
+
+if __name__ == "__main__":
+    main()